@@ -5,17 +5,17 @@ Unified extractor:
 - If provided an actual text string, use text parsing.
 - Uses local LM Studio by default (LMSTUDIO_URL) or OpenRouter if OPENROUTER_API_KEY set.
 
-Exported function:
+Exported functions:
     extract_invoice_auto(path_or_text: str, is_text=False) -> dict
+    extract_invoice_auto_async(path_or_text: str, is_text=False) -> dict  (non-blocking, for FastAPI)
 """
 
 import os
 import json
-import re
-import tempfile
-import base64
-import requests
-from typing import List
+import asyncio
+import hashlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -30,9 +30,42 @@ LMSTUDIO_VISION_URL = os.getenv("LMSTUDIO_VISION_URL", LMSTUDIO_CHAT_URL)
 TEXT_MODEL = os.getenv("TEXT_MODEL", "qwen/qwen3-vl-4b")  # used for text parsing if desired
 VISION_MODEL = os.getenv("VISION_MODEL", os.getenv("LMSTUDIO_MODEL", "qwen/qwen3-vl-4b"))
 
+# Async pipeline limits (per uvicorn worker). Each stage has its own cap so a
+# burst of scanned PDFs cannot starve LLM calls and vice versa.
+EXTRACT_EXECUTOR_WORKERS = int(os.getenv("EXTRACT_EXECUTOR_WORKERS", "8"))
+PDF_STAGE_CONCURRENCY = int(os.getenv("PDF_STAGE_CONCURRENCY", "4"))
+OCR_STAGE_CONCURRENCY = int(os.getenv("OCR_STAGE_CONCURRENCY", "2"))
+LLM_STAGE_CONCURRENCY = int(os.getenv("LLM_STAGE_CONCURRENCY", "4"))  # model server parallel slots
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "300"))
+
+# Vision pipeline: render DPI for PDF pages and pages per multimodal request
+# (1 = one concurrent request per page, merged afterwards).
+VLM_DPI = int(os.getenv("VLM_DPI", "150"))
+VLM_PAGES_PER_REQUEST = int(os.getenv("VLM_PAGES_PER_REQUEST", "4"))
+
+# Per-request extraction modes:
+#   auto   - PDFs via selectable text/Tesseract, images via the VLM (default)
+#   vision - PDFs and images both go to the VLM as page images
+#   ocr    - images are OCR'd with Tesseract and parsed as text
+#   layout - like auto, but PDF text keeps table rows as delimited lines and
+#            drops running headers/footers and boilerplate (shorter prompts)
+EXTRACTION_MODES = ("auto", "vision", "ocr", "layout")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tiff", ".bmp", ".webp")
+
 # local utility imports (safe to import here)
-from utils.pdf_reader import pdf_has_text, pdf_to_text, pdf_to_images
-from utils.ocr_reader import image_to_text, multiple_images_to_text
+from llm_client import LLMClient
+from extraction_cache import extraction_cache, file_sha256, text_sha256, make_key
+import rule_extractor
+from chunked_extractor import (
+    needs_chunking, extract_chunked, extract_chunked_async,
+    HEADER_PROMPT_TEMPLATE, ITEMS_PROMPT_TEMPLATE,
+)
+from utils.pdf_reader import analyze_pdf, extract_layout_text, extract_pdf_text, iter_page_images
+from utils.ocr_reader import image_to_text, count_ocr
+from utils.image_prep import prepare_image, to_data_url
+from utils.json_repair import parse_json, parse_json_checked, IncrementalJsonParser
+from utils import timing
 
 # Prompt template (strict JSON output)
 PROMPT_TEMPLATE = """
@@ -64,57 +97,40 @@ Invoice text:
 \"\"\"{invoice_text}\"\"\"
 """
 
+# Vision prompt: same schema minus raw_text (the model should not transcribe pages)
+VISION_PROMPT = (
+    "You are an invoice parsing expert. The attached image(s) are pages of one invoice, in page order.\n"
+    "Extract fields and return ONLY valid JSON (no explanation).\n\n"
+    "Schema:\n{\n"
+    + ",\n".join(f'  "{f}": {t}' for f, t in rule_extractor.FIELD_SCHEMA.items())
+    + "\n}\n"
+)
+
+# Part of every extraction cache key: editing the prompt invalidates old results.
+PROMPT_VERSION = hashlib.sha256(
+    (PROMPT_TEMPLATE + HEADER_PROMPT_TEMPLATE + ITEMS_PROMPT_TEMPLATE + VISION_PROMPT).encode("utf-8")
+).hexdigest()[:12]
+
 # ----------------------
 # Helpers for LLM calls
 # ----------------------
-def _clean_model_json_text(raw: str) -> str:
-    """
-    Extracts and repairs JSON from messy model output.
-    Handles:
-    - missing closing braces
-    - trailing commas
-    - single quotes
-    - markdown code blocks
-    """
-    if raw is None:
-        raise ValueError("Model returned empty response")
-
-    raw = raw.strip()
-
-    # Remove markdown fences ```json ... ```
-    raw = re.sub(r"```json", "", raw, flags=re.IGNORECASE)
-    raw = re.sub(r"```", "", raw)
+# Shared by every text and vision call: pooled keep-alive connections,
+# bounded concurrency, retries with backoff and latency/token accounting.
+llm = LLMClient(
+    max_concurrency=LLM_STAGE_CONCURRENCY,
+    max_retries=LLM_MAX_RETRIES,
+    timeout=LLM_TIMEOUT,
+    pool_size=max(LLM_STAGE_CONCURRENCY, 4),
+)
 
-    # Extract largest JSON-like structure
-    m = re.search(r"\{[\s\S]*\}", raw)
-    if m:
-        raw = m.group(0)
+async def close_llm_client():
+    await llm.aclose()
 
-    # Fix common JSON issues
-    raw = raw.replace("'", "\"")
-    raw = re.sub(r",\s*}", "}", raw)
-    raw = re.sub(r",\s*]", "]", raw)
 
-    # Fix unclosed braces/brackets
-    open_braces = raw.count("{")
-    close_braces = raw.count("}")
-    if close_braces < open_braces:
-        raw += "}" * (open_braces - close_braces)
-
-    open_brackets = raw.count("[")
-    close_brackets = raw.count("]")
-    if close_brackets < open_brackets:
-        raw += "]" * (open_brackets - close_brackets)
-
-    return raw
-
-def _post_chat(payload: dict, url: str, headers: dict = None, timeout: int = 300) -> dict:
-    headers = headers or {"Content-Type": "application/json"}
-    r = requests.post(url, json=payload, headers=headers, timeout=timeout)
-    r.raise_for_status()
-    return r.json()
-
-def call_text_llm(prompt_text: str, model: str = TEXT_MODEL) -> dict:
+def _text_llm_request(prompt_text: str, model: str, max_tokens: int = 2000):
+    """
+    Build (payload, url, headers) for a text completion.
+    """
     payload = {
         "model": model,
         "messages": [
@@ -132,118 +148,270 @@ def call_text_llm(prompt_text: str, model: str = TEXT_MODEL) -> dict:
             }
         ],
         "temperature": 0,
-        "max_tokens": 2000
+        "max_tokens": max_tokens
     }
 
-    # Send request
     if OPENROUTER_API_KEY:
         headers = {"Authorization": f"Bearer {OPENROUTER_API_KEY}", "Content-Type": "application/json"}
-        resp = _post_chat(payload, OPENROUTER_URL, headers=headers)
-    else:
-        resp = _post_chat(payload, LMSTUDIO_CHAT_URL)
+        return payload, OPENROUTER_URL, headers
+    return payload, LMSTUDIO_CHAT_URL, None
 
-    msg = resp.get("choices", [{}])[0].get("message", {})
-    raw = msg.get("content") or resp.get("choices", [{}])[0].get("text")
+def _parse_text_llm_response(resp: dict):
+    return _parse_text_llm_response_checked(resp)[0]
+
+def _parse_text_llm_response_checked(resp: dict):
+    """
+    (parsed, truncated): truncated when the reply hit max_tokens or the JSON
+    had to be closed early.
+    """
+    choice = resp.get("choices", [{}])[0]
+    msg = choice.get("message", {})
+    raw = msg.get("content") or choice.get("text")
 
     if raw is None:
         raise RuntimeError(f"Model returned empty content. Full response:\n{json.dumps(resp, indent=2)}")
 
-    # 1️⃣ Try direct JSON (best case)
-    try:
-        return json.loads(raw)
-    except:
-        pass
+    # valid JSON parses directly; fences, prose, trailing commas, single quotes
+    # and truncation are repaired in one pass (see utils.json_repair)
+    parsed, truncated = parse_json_checked(raw)
+    return parsed, truncated or choice.get("finish_reason") == "length"
 
-    # 2️⃣ Remove whitespace-only junk around JSON
-    stripped = raw.strip()
-    if stripped.startswith("{") and stripped.endswith("}"):
-        try:
-            return json.loads(stripped)
-        except:
-            pass
+def call_text_llm(prompt_text: str, model: str = TEXT_MODEL) -> dict:
+    payload, url, headers = _text_llm_request(prompt_text, model)
+    resp = llm.post_chat(payload, url, headers=headers)
+    return _parse_text_llm_response(resp)
 
-    # 3️⃣ Fallback cleaning
-    cleaned = _clean_model_json_text(raw)
+async def call_text_llm_async(prompt_text: str, model: str = TEXT_MODEL) -> dict:
+    payload, url, headers = _text_llm_request(prompt_text, model)
+    resp = await llm.post_chat_async(payload, url, headers=headers)
+    return _parse_text_llm_response(resp)
 
-    try:
-        return json.loads(cleaned)
-    except:
-        cleaned2 = cleaned.replace("'", "\"")
-        cleaned2 = re.sub(r",\s*}", "}", cleaned2)
-        cleaned2 = re.sub(r",\s*]", "]", cleaned2)
-        return json.loads(cleaned2)
+def call_text_llm_checked(prompt_text: str, max_tokens: int, model: str = TEXT_MODEL):
+    """
+    Chunked-extraction call: (parsed, truncated) with a per-call reply budget.
+    """
+    payload, url, headers = _text_llm_request(prompt_text, model, max_tokens)
+    resp = llm.post_chat(payload, url, headers=headers)
+    return _parse_text_llm_response_checked(resp)
 
+async def call_text_llm_checked_async(prompt_text: str, max_tokens: int, model: str = TEXT_MODEL):
+    payload, url, headers = _text_llm_request(prompt_text, model, max_tokens)
+    resp = await llm.post_chat_async(payload, url, headers=headers)
+    return _parse_text_llm_response_checked(resp)
 
-def call_vlm_image(image_path: str, model: str = VISION_MODEL) -> dict:
+
+def _vlm_payload(images: list, model: str) -> dict:
     """
-    Send a single image to the local LM Studio VLM endpoint.
-    Uses base64-encoded image in the chat messages payload (LM Studio-compatible).
+    One multimodal request carrying every (bytes, mime) image, in page order.
     """
-    with open(image_path, "rb") as f:
-        b = f.read()
-    b64 = base64.b64encode(b).decode()
-
-    payload = {
+    content = [
+        {"type": "input_image", "image_url": to_data_url(data, mime)}
+        for data, mime in images
+    ]
+    content.append({"type": "text", "text": VISION_PROMPT})
+    return {
         "model": model,
         "messages": [
             {"role": "system", "content": "Extract invoice fields and return ONLY JSON."},
-            {"role": "user", "content": [
-                {"type": "input_image", "image_url": f"data:image/png;base64,{b64}"},
-                {"type": "text", "text": "Return structured JSON following the schema."}
-            ]}
+            {"role": "user", "content": content}
         ],
         "temperature": 0,
         "max_tokens": 2000
     }
 
-    resp = _post_chat(payload, LMSTUDIO_VISION_URL)
+def _parse_vlm_response(resp: dict) -> dict:
     raw = (resp.get("choices", [{}])[0].get("message") or {}).get("content")
-    cleaned = _clean_model_json_text(raw)
-    return json.loads(cleaned)
+    return parse_json(raw)
+
+def _prepare_image_file(image_path: str) -> list:
+    with timing.stage("render"):
+        return [prepare_image(image_path)]
+
+def _prepare_pdf_pages(pdf_src, dpi: int = None, pages: list = None) -> list:
+    # pages are rendered one at a time and only the downscaled encoding is kept
+    with timing.stage("render"):
+        return [prepare_image(raw) for _, raw in iter_page_images(pdf_src, dpi=dpi or VLM_DPI, pages=pages)]
+
+def _vlm_batches(images: list) -> list:
+    n = max(1, VLM_PAGES_PER_REQUEST)
+    return [images[i:i + n] for i in range(0, len(images), n)]
+
+def _merge_page_results(results: list) -> dict:
+    """
+    Merge per-batch VLM outputs: first non-empty value wins for header fields,
+    items are concatenated in page order.
+    """
+    if len(results) == 1:
+        return results[0]
+    merged = {}
+    items = []
+    for r in results:
+        if not isinstance(r, dict):
+            continue
+        for k, v in r.items():
+            if k == "items":
+                items.extend(v or [])
+            elif merged.get(k) in (None, "") and v not in (None, ""):
+                merged[k] = v
+    merged["items"] = items
+    return merged
+
+def call_vlm_images(images: list, model: str = VISION_MODEL) -> dict:
+    """
+    Send prepared (bytes, mime) images to the VLM: VLM_PAGES_PER_REQUEST pages
+    per request, batches run concurrently, outputs merged.
+    """
+    batches = _vlm_batches(images)
+
+    def _one(batch):
+        return _parse_vlm_response(llm.post_chat(_vlm_payload(batch, model), LMSTUDIO_VISION_URL))
+
+    if len(batches) == 1:
+        return _one(batches[0])
+    contexts = [contextvars.copy_context() for _ in batches]  # keep stage timings
+    with ThreadPoolExecutor(max_workers=LLM_STAGE_CONCURRENCY) as pool:
+        return _merge_page_results(list(pool.map(lambda ctx, b: ctx.run(_one, b), contexts, batches)))
+
+async def call_vlm_images_async(images: list, model: str = VISION_MODEL) -> dict:
+    async def _one(batch):
+        resp = await llm.post_chat_async(_vlm_payload(batch, model), LMSTUDIO_VISION_URL)
+        return _parse_vlm_response(resp)
+
+    results = await asyncio.gather(*[_one(b) for b in _vlm_batches(images)])
+    return _merge_page_results(list(results))
+
+def call_vlm_image(image_path: str, model: str = VISION_MODEL) -> dict:
+    """
+    Send a single image to the local LM Studio VLM endpoint.
+    The image is downscaled and re-encoded (see utils.image_prep) and sent
+    base64-encoded with its real MIME type (LM Studio-compatible).
+    """
+    return call_vlm_images(_prepare_image_file(image_path), model)
+
+async def call_vlm_image_async(image_path: str, model: str = VISION_MODEL) -> dict:
+    """
+    Async variant of call_vlm_image(); the image is prepared off the event loop.
+    """
+    images = await _run_stage("pdf", _prepare_image_file, image_path)
+    return await call_vlm_images_async(images, model)
+
+
+# ----------------------
+# Async stage runner
+# ----------------------
+_executor = ThreadPoolExecutor(max_workers=EXTRACT_EXECUTOR_WORKERS, thread_name_prefix="dawg-extract")
+_stage_limits = {"pdf": PDF_STAGE_CONCURRENCY, "ocr": OCR_STAGE_CONCURRENCY}
+_stage_semaphores = {}
+
+def _stage_semaphore(stage: str) -> asyncio.Semaphore:
+    # semaphores bind to the running loop, so keep one set per loop
+    loop = asyncio.get_running_loop()
+    key = (id(loop), stage)
+    sem = _stage_semaphores.get(key)
+    if sem is None:
+        sem = _stage_semaphores[key] = asyncio.Semaphore(_stage_limits[stage])
+    return sem
+
+async def _run_blocking(fn, *args):
+    loop = asyncio.get_running_loop()
+    # carry contextvars (stage timings) into the worker thread
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, ctx.run, fn, *args)
+
+async def _run_stage(stage: str, fn, *args):
+    """
+    Run a blocking CPU/IO stage in the bounded executor under that stage's limit.
+    """
+    async with _stage_semaphore(stage):
+        return await _run_blocking(fn, *args)
 
 
 # -----------------------
 # Public unified entry
 # -----------------------
-def extract_invoice_auto(path_or_text: str, is_text: bool = False) -> dict:
+def extraction_key(path_or_text: str, is_text: bool, content_hash: str = None, mode: str = "auto"):
+    try:
+        if content_hash is None:
+            content_hash = text_sha256(path_or_text) if is_text else file_sha256(str(path_or_text))
+    except OSError:
+        return None  # let the extractor report the unreadable file
+    return make_key(content_hash, PROMPT_VERSION, TEXT_MODEL, VISION_MODEL,
+                    "" if mode == "auto" else mode)
+
+def _check_mode(mode: str) -> str:
+    mode = (mode or "auto").lower()
+    if mode not in EXTRACTION_MODES:
+        raise ValueError(f"Unknown extraction mode '{mode}' (expected one of {', '.join(EXTRACTION_MODES)}).")
+    return mode
+
+def _cacheable(parsed) -> bool:
+    # partial OCR results are not worth pinning
+    return isinstance(parsed, dict) and not parsed.get("ocr_failed_pages")
+
+def extract_invoice_auto(path_or_text: str, is_text: bool = False, use_cache: bool = True,
+                         content_hash: str = None, pdf_bytes: bytes = None, mode: str = "auto") -> dict:
+    """
+    Cached front door for extraction. Results are keyed on the document content
+    (file bytes or normalised text), PROMPT_VERSION, TEXT_MODEL and VISION_MODEL;
+    a hit returns the stored JSON without OCR or LLM work. Pass `content_hash`
+    if the caller already hashed the file bytes, and `pdf_bytes` if the PDF is
+    already in memory (it is then opened from the buffer, not re-read from disk).
+    `mode` picks the pipeline (see EXTRACTION_MODES) and is part of the key.
+    """
+    mode = _check_mode(mode)
+    key = extraction_key(path_or_text, is_text, content_hash, mode) if use_cache and extraction_cache.enabled else None
+    if key:
+        hit = extraction_cache.get(key)
+        if hit is not None:
+            return hit
+    parsed = _extract_invoice_uncached(path_or_text, is_text, pdf_bytes, mode)
+    if key and _cacheable(parsed):
+        extraction_cache.set(key, parsed)
+    return parsed
+
+
+def _extract_invoice_uncached(path_or_text: str, is_text: bool = False, pdf_bytes: bytes = None,
+                              mode: str = "auto") -> dict:
     """
     If is_text=True -> treat path_or_text as raw text string (call text parser).
     Otherwise treat path_or_text as file path:
-      - pdf -> try selectable text, else convert pages to images and OCR, then parse text
+      - pdf -> selectable text per page, OCR only for scanned pages, then parse text
+               (mode="vision": pages rendered and sent to the VLM instead;
+                mode="layout": text rebuilt from word positions, see utils.layout_text)
       - image -> call VLM image pipeline (direct image -> JSON)
+                 (mode="ocr": Tesseract, then parse text)
       - text file -> read & parse
     Returns parsed JSON dict.
     """
 
     # If caller explicitly passes text
     if is_text:
-        prompt = PROMPT_TEMPLATE.format(invoice_text=path_or_text)
-        parsed = call_text_llm(prompt)
-        parsed.setdefault("raw_text", path_or_text)
-        parsed.setdefault("items", parsed.get("items") or [])
-        return parsed
+        return _parse_invoice_text(path_or_text)
 
     fp = str(path_or_text)
     lower = fp.lower()
 
     # PDF path
     if lower.endswith(".pdf"):
-        if pdf_has_text(fp):
-            text = pdf_to_text(fp)
-        else:
-            # scanned -> convert to images then OCR with pytesseract then parse text
-            images = pdf_to_images(fp)
-            text = multiple_images_to_text(images)
+        src = pdf_bytes if pdf_bytes is not None else fp
+        if mode == "vision":
+            return call_vlm_images(_prepare_pdf_pages(src))
+        # single pass over the document; only scanned pages go through OCR
+        analysis = analyze_pdf(src)
+        extract = extract_layout_text if mode == "layout" else extract_pdf_text
+        extracted = extract(src, analysis)
+        text = extracted["text"]
         if not text or not text.strip():
             raise RuntimeError("No text could be extracted from PDF.")
-        prompt = PROMPT_TEMPLATE.format(invoice_text=text)
-        parsed = call_text_llm(prompt)
-        parsed.setdefault("raw_text", text)
-        parsed.setdefault("items", parsed.get("items") or [])
+        parsed = _parse_invoice_text(text)
+        if extracted["ocr_failed_pages"] and isinstance(parsed, dict):
+            parsed["ocr_failed_pages"] = extracted["ocr_failed_pages"]
         return parsed
 
     # Image path
-    if lower.endswith((".png", ".jpg", ".jpeg", ".tiff", ".bmp", ".webp")):
+    if lower.endswith(IMAGE_EXTENSIONS):
+        if mode == "ocr":
+            return _parse_invoice_text(_ocr_image_file(fp))
         return call_vlm_image(fp)
 
     # Otherwise treat as text file
@@ -255,36 +423,279 @@ def extract_invoice_auto(path_or_text: str, is_text: bool = False) -> dict:
 
     if not text.strip():
         raise RuntimeError("No text found in file.")
-    prompt = PROMPT_TEMPLATE.format(invoice_text=text)
-    parsed = call_text_llm(prompt)
+    return _parse_invoice_text(text)
+
+
+def _parse_invoice_text(text: str) -> dict:
+    """
+    Text -> structured JSON. The rule pre-extractor runs first; the LLM is
+    asked only for what it did not find (see rule_extractor.llm_fields), or
+    skipped when that is nothing. Documents over the token budget are
+    extracted in chunks (header once, items per window) and merged into the
+    same schema.
+    """
+    pre = rule_extractor.pre_extract(text) if rule_extractor.RULE_EXTRACTOR_ENABLED else None
+    if pre is not None and not rule_extractor.llm_needed(pre):
+        parsed = None
+    elif needs_chunking(text):
+        parsed = extract_chunked(text, call_text_llm_checked, max_workers=LLM_STAGE_CONCURRENCY,
+                                 header=_needs_header(pre))
+    else:
+        parsed = call_text_llm(_text_prompt(text, pre))
+    return _finish_parsed(parsed, pre, text)
+
+async def _parse_invoice_text_async(text: str) -> dict:
+    pre = rule_extractor.pre_extract(text) if rule_extractor.RULE_EXTRACTOR_ENABLED else None
+    if pre is not None and not rule_extractor.llm_needed(pre):
+        parsed = None
+    elif needs_chunking(text):
+        parsed = await extract_chunked_async(text, call_text_llm_checked_async, header=_needs_header(pre))
+    else:
+        parsed = await call_text_llm_async(_text_prompt(text, pre))
+    return _finish_parsed(parsed, pre, text)
+
+def _needs_header(pre: dict = None) -> bool:
+    """
+    Chunked documents skip the header call when the rules found every header field.
+    """
+    return pre is None or any(f != "items" for f in rule_extractor.llm_fields(pre))
+
+def _text_prompt(text: str, pre: dict = None) -> str:
+    fields = rule_extractor.llm_fields(pre) if pre is not None else rule_extractor.ALL_FIELDS
+    if len(fields) == len(rule_extractor.ALL_FIELDS):
+        return PROMPT_TEMPLATE.format(invoice_text=text)
+    return rule_extractor.partial_prompt(text, fields)
+
+def _finish_parsed(parsed, pre: dict, text: str) -> dict:
+    if pre is not None:
+        parsed = rule_extractor.merge_with_llm(pre, parsed)
+    if not isinstance(parsed, dict):
+        return parsed  # callers report the invalid format
     parsed.setdefault("raw_text", text)
     parsed.setdefault("items", parsed.get("items") or [])
     return parsed
 
+def _ocr_image_file(fp: str) -> str:
+    text = image_to_text(fp)
+    count_ocr([text])
+    if not text.strip():
+        raise RuntimeError("No text could be extracted from image.")
+    return text
+
+def _read_text_file(fp: str) -> str:
+    try:
+        with open(fp, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    except Exception:
+        raise RuntimeError("Unsupported file type or failed to read file.")
+
+async def extract_invoice_auto_async(path_or_text: str, is_text: bool = False, use_cache: bool = True,
+                                     content_hash: str = None, pdf_bytes: bytes = None,
+                                     mode: str = "auto") -> dict:
+    """
+    Non-blocking counterpart of extract_invoice_auto(), with the same cache.
+    Hashing and cache lookups run in the executor.
+    """
+    mode = _check_mode(mode)
+    key = None
+    if use_cache and extraction_cache.enabled:
+        key = await _run_blocking(extraction_key, path_or_text, is_text, content_hash, mode)
+    if key:
+        hit = await _run_blocking(extraction_cache.get, key)
+        if hit is not None:
+            return hit
+    parsed = await _extract_invoice_uncached_async(path_or_text, is_text, pdf_bytes, mode)
+    if key and _cacheable(parsed):
+        await _run_blocking(extraction_cache.set, key, parsed)
+    return parsed
+
+async def _extract_invoice_uncached_async(path_or_text: str, is_text: bool = False, pdf_bytes: bytes = None,
+                                          mode: str = "auto") -> dict:
+    """
+    Non-blocking counterpart of _extract_invoice_uncached() for use on an event loop.
+    PDF parsing and OCR run in the bounded executor, LLM calls go through the
+    async side of the shared LLMClient, and each stage is capped by its
+    *_STAGE_CONCURRENCY limit (the LLM cap is enforced by the client).
+    """
+    if _uses_vision(path_or_text, is_text, mode):
+        return await _extract_vision_async(str(path_or_text), pdf_bytes)
+
+    text, failed = await _document_text_async(path_or_text, is_text, pdf_bytes, mode)
+    parsed = await _parse_invoice_text_async(text)
+    if failed and isinstance(parsed, dict):
+        parsed["ocr_failed_pages"] = failed
+    return parsed
+
+async def extract_section_async(text: str, mode: str = "auto", pdf_src=None, pages: list = None) -> dict:
+    """
+    One splitter section of a multi-invoice PDF. In vision mode the section's
+    own pages (`pages` of `pdf_src`) go to the VLM; otherwise, or when the
+    section has no pages to itself, its text is parsed (the splitter has
+    already OCR'd scanned pages).
+    """
+    mode = _check_mode(mode)
+    if mode == "vision" and pages and pdf_src is not None:
+        images = await _run_stage("pdf", _prepare_pdf_pages, pdf_src, None, pages)
+        parsed = await call_vlm_images_async(images)
+        if isinstance(parsed, dict):
+            parsed.setdefault("raw_text", text)
+        return parsed
+    return await extract_invoice_auto_async(text, is_text=True, mode=mode)
+
+def _uses_vision(path_or_text: str, is_text: bool, mode: str) -> bool:
+    if is_text:
+        return False
+    lower = str(path_or_text).lower()
+    if lower.endswith(".pdf"):
+        return mode == "vision"
+    return lower.endswith(IMAGE_EXTENSIONS) and mode != "ocr"
 
-def repair_broken_json(text):
+async def _extract_vision_async(fp: str, pdf_bytes: bytes = None) -> dict:
+    if fp.lower().endswith(".pdf"):
+        images = await _run_stage("pdf", _prepare_pdf_pages, pdf_bytes if pdf_bytes is not None else fp)
+        return await call_vlm_images_async(images)
+    return await call_vlm_image_async(fp)
+
+async def _document_text_async(path_or_text: str, is_text: bool, pdf_bytes: bytes = None, mode: str = "auto"):
     """
-    Attempts to auto-fix common JSON issues:
-    - missing commas
-    - trailing commas
-    - unquoted keys
-    - unfinished keys like "invoice_number"
+    Text to parse for a non-vision extraction: (text, ocr_failed_pages).
     """
-    # Fix trailing commas
-    text = re.sub(r",\s*}", "}", text)
-    text = re.sub(r",\s*]", "]", text)
+    if is_text:
+        return path_or_text, []
 
-    # Quote unquoted keys
-    text = re.sub(r"(\w+):", r'"\1":', text)
+    fp = str(path_or_text)
+    lower = fp.lower()
 
-    # Ensure all keys have values
-    text = re.sub(r'"\w+"\s*:\s*(?=})', '""', text)
+    if lower.endswith(".pdf"):
+        src = pdf_bytes if pdf_bytes is not None else fp
+        analysis = await _run_stage("pdf", analyze_pdf, src)
+        if analysis["ocr_pages"]:
+            extract = extract_layout_text if mode == "layout" else extract_pdf_text
+            extracted = await _run_stage("ocr", extract, src, analysis)
+        elif mode == "layout":
+            extracted = await _run_stage("pdf", extract_layout_text, src, analysis)
+        else:
+            extracted = extract_pdf_text(src, analysis)  # no OCR needed: just joins page text
+        text = extracted["text"]
+        if not text or not text.strip():
+            raise RuntimeError("No text could be extracted from PDF.")
+        return text, extracted["ocr_failed_pages"]
 
-    # If JSON ends abruptly, close brackets
-    if text.count("{") > text.count("}"):
-        text += "}" * (text.count("{") - text.count("}"))
+    if lower.endswith(IMAGE_EXTENSIONS):
+        return await _run_stage("ocr", _ocr_image_file, fp), []
 
-    if text.count("[") > text.count("]"):
-        text += "]" * (text.count("[") - text.count("]"))
+    text = await _run_stage("pdf", _read_text_file, fp)
+    if not text.strip():
+        raise RuntimeError("No text found in file.")
+    return text, []
 
-    return text
+
+# -----------------------
+# Streaming extraction
+# -----------------------
+async def stream_text_llm(prompt_text: str, on_value, model: str = TEXT_MODEL):
+    """
+    Stream a text completion through the incremental JSON parser, yielding
+    after every delta so the caller can flush what `on_value` collected.
+    Generation is cut off as soon as the top-level JSON object closes.
+    The parser is yielded last; call .close() on it for the final object.
+    """
+    payload, url, headers = _text_llm_request(prompt_text, model)
+    parser = IncrementalJsonParser(on_value=on_value)
+    stream = llm.stream_chat_async(payload, url, headers=headers)
+    try:
+        async for delta in stream:
+            done = parser.feed(delta)
+            yield None
+            if done:
+                break
+    finally:
+        await stream.aclose()
+    yield parser
+
+def _result_events(parsed: dict, skip_fields=(), skip_items: int = 0) -> list:
+    events = [
+        {"event": "field", "name": k, "value": v}
+        for k, v in parsed.items()
+        if k in rule_extractor.FIELD_SCHEMA and k != "items" and k not in skip_fields
+    ]
+    items = parsed.get("items") or []
+    events += [
+        {"event": "item", "index": i, "item": it}
+        for i, it in enumerate(items) if i >= skip_items
+    ]
+    return events
+
+async def extract_invoice_stream(path_or_text: str, is_text: bool = False, use_cache: bool = True,
+                                 content_hash: str = None, pdf_bytes: bytes = None, mode: str = "auto"):
+    """
+    Streaming counterpart of extract_invoice_auto_async(). Async generator of events:
+      {"event": "field", "name": str, "value": any}   a header field, as soon as it is complete
+      {"event": "item", "index": int, "item": dict}   each completed line item
+      {"event": "result", "structured": dict}         the final result, identical to the non-streaming call
+    Single-prompt text extraction is streamed token by token; cache hits,
+    rule-only results, chunked documents and the vision path emit their
+    events from the finished result.
+    """
+    mode = _check_mode(mode)
+    key = None
+    if use_cache and extraction_cache.enabled:
+        key = await _run_blocking(extraction_key, path_or_text, is_text, content_hash, mode)
+    if key:
+        hit = await _run_blocking(extraction_cache.get, key)
+        if hit is not None:
+            for ev in _result_events(hit):
+                yield ev
+            yield {"event": "result", "structured": hit}
+            return
+
+    sent_fields = set()
+    sent_items = 0
+    if _uses_vision(path_or_text, is_text, mode):
+        parsed = await _extract_vision_async(str(path_or_text), pdf_bytes)
+    else:
+        text, failed = await _document_text_async(path_or_text, is_text, pdf_bytes, mode)
+        pre = rule_extractor.pre_extract(text) if rule_extractor.RULE_EXTRACTOR_ENABLED else None
+        if pre is not None and not rule_extractor.llm_needed(pre):
+            parsed = None
+        elif needs_chunking(text):
+            parsed = await extract_chunked_async(text, call_text_llm_checked_async,
+                                                 header=_needs_header(pre))
+        else:
+            # rule hits are final (they win the merge), so send them first
+            rule_fields = pre["fields"] if pre is not None else {}
+            for name, value in rule_fields.items():
+                if name != "items":
+                    sent_fields.add(name)
+                    yield {"event": "field", "name": name, "value": value}
+
+            pending = []
+
+            def _collect(path, value):
+                if len(path) == 1 and path[0] in rule_extractor.FIELD_SCHEMA and path[0] != "items" \
+                        and path[0] not in rule_fields:
+                    pending.append({"event": "field", "name": path[0], "value": value})
+                elif len(path) == 2 and path[0] == "items" and "items" not in rule_fields and isinstance(value, dict):
+                    pending.append({"event": "item", "index": path[1], "item": value})
+
+            parser = None
+            async for step in stream_text_llm(_text_prompt(text, pre), _collect):
+                parser = step
+                for ev in pending:
+                    if ev["event"] == "field":
+                        sent_fields.add(ev["name"])
+                    else:
+                        sent_items = ev["index"] + 1
+                    yield ev
+                pending.clear()
+            parsed = parser.close()
+        parsed = _finish_parsed(parsed, pre, text)
+        if failed and isinstance(parsed, dict):
+            parsed["ocr_failed_pages"] = failed
+
+    if isinstance(parsed, dict):
+        for ev in _result_events(parsed, sent_fields, sent_items):
+            yield ev
+    if key and _cacheable(parsed):
+        await _run_blocking(extraction_cache.set, key, parsed)
+    yield {"event": "result", "structured": parsed}
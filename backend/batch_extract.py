@@ -0,0 +1,389 @@
+# backend/batch_extract.py
+"""
+Parallel, resumable batch extraction over a corpus of PDFs (the corpus-scale
+form of create_dataset_from_pdf.py).
+
+  python batch_extract.py invoices/ more/*.pdf --out corpus_dataset.jsonl
+  python batch_extract.py --manifest files.txt --out corpus_dataset.jsonl --save-db
+
+Pipeline, per PDF:
+  hash -> split into invoice sections (pdf_parse + OCR; scanned pages go to the
+  utils.ocr_reader process pool) -> text LLM per section -> writer [-> DB save]
+Files are split --workers at a time while the sections of earlier files are
+with the LLM, which has at most --llm-concurrency calls in flight.
+
+Output is one JSONL with the create_dataset_from_pdf records
+({"file", "section_id", "text", "model_output"}) plus the section's 1-based
+page range "pages": [first, last] and the file's "sha256".
+A single writer owns the file: a PDF's records are written together once all
+its sections are done, and everything finished meanwhile shares one flush.
+
+Checkpoint: <out>.checkpoint.jsonl gets {"sha256", "file", "sections",
+"errors", "offset"} per finished PDF once its records are on disk. With
+--save-db the writer commits a PDF's invoices in the same step, right before
+writing its records and checkpoint line (which then also carries "saved"), so
+an interrupted run (Ctrl-C lets the step finish) does not save them twice on
+resume; only a hard crash inside that step can. A PDF whose save fails is not
+written or checkpointed, so the next run retries it. Re-running
+with the same --out skips checkpointed hashes (also the same PDF under another
+name) and first cuts --out back to the last checkpointed offset, dropping the
+records of a file that was interrupted mid-write. Files that cannot be read or
+split are reported and not checkpointed, so the next run retries them;
+sections whose extraction failed are recorded with {"error": ...} as before.
+
+Options:
+  --manifest PATH      one path per line, or JSONL with a "file" (or "path") field
+  --out PATH           default TMP_DIR/batch_dataset.jsonl
+  --workers N          PDFs split concurrently (default PDF_STAGE_CONCURRENCY)
+  --llm-concurrency N  section extractions in flight (default LLM_STAGE_CONCURRENCY)
+  --save-db            also save each PDF's parsed sections (uses DATABASE_URL)
+  --no-cache           bypass the extraction cache
+  --restart            discard an existing --out and its checkpoint
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ai_extractor import LLM_STAGE_CONCURRENCY, PDF_STAGE_CONCURRENCY, close_llm_client, extract_invoice_auto_async
+from extraction_cache import file_sha256
+from splitter import find_pdf_sections, section_text
+from utils import timing
+
+OUT_DIR = os.environ.get("TMP_DIR", "/tmp/invoice_extractor")
+OUT_BUFFER = 1024 * 1024
+PROGRESS_INTERVAL = 0.5  # seconds between progress redraws (10x that when not a terminal)
+
+
+# ----------------------
+# corpus
+# ----------------------
+def load_manifest(path: str) -> list:
+    paths = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                rec = json.loads(line)
+                line = rec.get("file") or rec.get("path")
+                if not line:
+                    continue
+            paths.append(line)
+    return paths
+
+
+def collect_files(paths: list) -> list:
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            for root, dirs, names in os.walk(p):
+                dirs.sort()
+                files += [os.path.join(root, n) for n in sorted(names) if n.lower().endswith(".pdf")]
+        else:
+            files.append(p)
+    return files
+
+
+# ----------------------
+# checkpoint
+# ----------------------
+def checkpoint_path(out_path: str) -> str:
+    return out_path + ".checkpoint.jsonl"
+
+
+def load_checkpoint(path: str) -> tuple:
+    """
+    (finished hashes, output offset after the last finished file). A torn last
+    line (crash mid-append) is cut off so appends start on a clean line.
+    """
+    done = set()
+    offset = 0
+    if not os.path.exists(path):
+        return done, offset
+    valid = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                break
+            done.add(rec["sha256"])
+            offset = max(offset, rec["offset"])
+            valid += len(line)
+    if valid < os.path.getsize(path):
+        os.truncate(path, valid)
+    return done, offset
+
+
+class DatasetWriter:
+    """
+    Single owner of the output and checkpoint files; used from one thread at a time.
+    """
+
+    def __init__(self, out_path: str, offset: int, save=None):
+        if os.path.exists(out_path) and os.path.getsize(out_path) > offset:
+            os.truncate(out_path, offset)  # records of a file that never reached the checkpoint
+        self.out = open(out_path, "a", encoding="utf-8", buffering=OUT_BUFFER)
+        self.checkpoint = open(checkpoint_path(out_path), "a", encoding="utf-8")
+        self.save = save  # records -> number of invoices saved (committed)
+
+    def write(self, finished: list):
+        """
+        Append the records of several finished files, make them durable, then
+        checkpoint them. When saving to the DB, each file's invoices are saved
+        first; returns the files whose save failed (left out, so they are retried).
+        """
+        failed = []
+        if self.save:
+            saved = []
+            for f in finished:
+                try:
+                    f["saved"] = self.save(f["records"])
+                except Exception as e:
+                    f["error"] = f"{type(e).__name__}: {e}"
+                    failed.append(f)
+                    continue
+                saved.append(f)
+            finished = saved
+        if not finished:
+            return failed
+        for f in finished:
+            for rec in f["records"]:
+                self.out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self.out.flush()
+        os.fsync(self.out.fileno())
+        offset = self.out.tell()
+        for f in finished:
+            entry = {"sha256": f["sha256"], "file": f["file"], "sections": len(f["records"]),
+                     "errors": f["errors"], "offset": offset}
+            if "saved" in f:
+                entry["saved"] = f["saved"]
+            self.checkpoint.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.checkpoint.flush()
+        os.fsync(self.checkpoint.fileno())
+        return failed
+
+    def close(self):
+        self.out.close()
+        self.checkpoint.close()
+
+
+# ----------------------
+# progress
+# ----------------------
+class Progress:
+    def __init__(self, total: int, stream=sys.stderr):
+        self.total = total
+        self.stream = stream
+        self.tty = stream.isatty()
+        self.start = time.perf_counter()
+        self.last = 0.0
+        self.done = self.skipped = self.failed = self.sections = self.section_errors = 0
+
+    def line(self) -> str:
+        elapsed = time.perf_counter() - self.start
+        finished = self.done + self.skipped + self.failed
+        rate = self.done / elapsed if elapsed else 0.0
+        remaining = self.total - finished
+        eta = f"{int(remaining / rate // 60)}:{int(remaining / rate % 60):02d}" if rate and remaining else "-"
+        return (f"[{finished}/{self.total} files] {self.skipped} skipped, {self.failed} failed | "
+                f"{self.sections} sections ({self.section_errors} errors) | "
+                f"{rate:.2f} files/s {self.sections / elapsed if elapsed else 0.0:.2f} sections/s | eta {eta}")
+
+    def update(self, force: bool = False):
+        now = time.perf_counter()
+        interval = PROGRESS_INTERVAL if self.tty else PROGRESS_INTERVAL * 10
+        if not force and now - self.last < interval:
+            return
+        self.last = now
+        if self.tty:
+            print("\r" + self.line(), end="", file=self.stream, flush=True)
+        else:
+            print(self.line(), file=self.stream, flush=True)
+
+    def finish(self):
+        self.update(force=True)
+        if self.tty:
+            print(file=self.stream)
+
+
+# ----------------------
+# pipeline
+# ----------------------
+def save_sections(records: list) -> int:
+    from database import SessionLocal
+    from models.persistence import save_invoices
+
+    parsed = [r["model_output"] for r in records if isinstance(r["model_output"], dict) and "error" not in r["model_output"]]
+    if not parsed:
+        return 0
+    try:
+        return len(save_invoices(SessionLocal(), parsed))
+    finally:
+        SessionLocal.remove()
+
+
+async def run(files: list, writer: DatasetWriter, done: set, args, progress: Progress) -> dict:
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=args.workers + 2, thread_name_prefix="dawg-batch")
+    split_sem = asyncio.Semaphore(args.workers)
+    llm_sem = asyncio.Semaphore(args.llm_concurrency)
+    # bounds split-but-not-extracted files, so splitting cannot run far ahead of the LLM
+    in_flight = asyncio.Semaphore(args.workers + args.llm_concurrency)
+    queue = asyncio.Queue()
+    seen = set(done)
+    failures = []
+    saved = 0
+
+    async def blocking(fn, *a):
+        ctx = contextvars.copy_context()  # keep stage timings
+        return await loop.run_in_executor(executor, ctx.run, fn, *a)
+
+    async def extract_section(path: str, sid: int, pages: list, text: str) -> dict:
+        async with llm_sem:
+            try:
+                parsed = await extract_invoice_auto_async(text, is_text=True, use_cache=not args.no_cache)
+            except Exception as e:
+                parsed = {"error": str(e)}
+        return {"file": path, "section_id": sid, "pages": pages, "text": text, "model_output": parsed}
+
+    async def process(path: str):
+        try:
+            async with split_sem:
+                sha = await blocking(file_sha256, path)
+                if sha in seen:
+                    progress.skipped += 1
+                    return
+                seen.add(sha)
+                found = await blocking(find_pdf_sections, path)
+            sections = []
+            for sec in found["sections"]:
+                text = section_text(found["pages"], sec)
+                if text:
+                    sections.append(([sec["page_start"] + 1, sec["page_end"] + 1], text))
+            records = await asyncio.gather(*(
+                extract_section(path, sid, pages, text) for sid, (pages, text) in enumerate(sections, 1)
+            ))
+            for r in records:
+                r["sha256"] = sha
+            errors = sum(1 for r in records if not isinstance(r["model_output"], dict) or "error" in r["model_output"])
+            await queue.put({"sha256": sha, "file": path, "records": records, "errors": errors})
+        except Exception as e:
+            progress.failed += 1
+            failures.append({"file": path, "error": f"{type(e).__name__}: {e}"})
+        finally:
+            in_flight.release()
+            progress.update()
+
+    async def write_loop():
+        nonlocal saved
+        while True:
+            item = await queue.get()
+            batch = [item]
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            finished = [f for f in batch if f is not None]
+            if finished:
+                failed = await blocking(writer.write, finished)
+                for f in failed:
+                    progress.failed += 1
+                    failures.append({"file": f["file"], "error": f"DB save: {f['error']}"})
+                for f in finished:
+                    if "error" in f:
+                        continue
+                    saved += f.get("saved", 0)
+                    progress.done += 1
+                    progress.sections += len(f["records"])
+                    progress.section_errors += f["errors"]
+                progress.update()
+            if len(finished) < len(batch):
+                return
+
+    writer_task = asyncio.create_task(write_loop())
+    tasks = []
+    try:
+        for path in files:
+            await in_flight.acquire()
+            tasks.append(asyncio.create_task(process(path)))
+        await asyncio.gather(*tasks)
+    finally:
+        await queue.put(None)
+        await writer_task
+        executor.shutdown(wait=True)
+        await close_llm_client()
+    return {"failures": failures, "saved": saved}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("paths", nargs="*")
+    ap.add_argument("--manifest")
+    ap.add_argument("--out", default=os.path.join(OUT_DIR, "batch_dataset.jsonl"))
+    ap.add_argument("--workers", type=int, default=PDF_STAGE_CONCURRENCY)
+    ap.add_argument("--llm-concurrency", type=int, default=LLM_STAGE_CONCURRENCY)
+    ap.add_argument("--save-db", action="store_true")
+    ap.add_argument("--no-cache", action="store_true")
+    ap.add_argument("--restart", action="store_true")
+    args = ap.parse_args(argv)
+    args.workers = max(1, args.workers)
+    args.llm_concurrency = max(1, args.llm_concurrency)
+
+    paths = list(args.paths)
+    if args.manifest:
+        paths += load_manifest(args.manifest)
+    if not paths:
+        ap.error("give files/directories or --manifest")
+    files = collect_files(paths)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    ckpt = checkpoint_path(args.out)
+    if args.restart:
+        for p in (args.out, ckpt):
+            if os.path.exists(p):
+                os.remove(p)
+    elif os.path.exists(args.out) and os.path.getsize(args.out) and not os.path.exists(ckpt):
+        print(f"{args.out} exists but has no checkpoint; pass --restart to overwrite it.", file=sys.stderr)
+        return 1
+    done, offset = load_checkpoint(ckpt)
+    if done:
+        print(f"Resuming: {len(done)} files already done.", file=sys.stderr)
+
+    if args.save_db:
+        from database import Base, engine
+        from models.migrations import ensure_schema
+
+        Base.metadata.create_all(bind=engine)
+        ensure_schema(engine)
+    writer = DatasetWriter(args.out, offset, save=save_sections if args.save_db else None)
+    progress = Progress(len(files))
+    try:
+        with timing.collect() as t:
+            res = asyncio.run(run(files, writer, done, args, progress))
+    finally:
+        writer.close()
+        progress.finish()
+
+    elapsed = time.perf_counter() - progress.start
+    print(f"{progress.done} files, {progress.sections} sections ({progress.section_errors} extraction errors) "
+          f"in {elapsed:.1f}s -> {args.out}")
+    if args.save_db:
+        print(f"Saved {res['saved']} invoices to DB")
+    stages = t.as_dict()
+    if stages:
+        print("stage seconds: " + ", ".join(f"{name} {s['seconds']:.2f}" for name, s in sorted(stages.items())))
+    for f in res["failures"]:
+        print(f"failed {f['file']}: {f['error']}", file=sys.stderr)
+    return 1 if res["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,361 @@
+# backend/bench_extract.py
+"""
+End-to-end extraction benchmark and accuracy harness.
+
+Replays a corpus through extract_invoice_auto() and reports:
+  - latency percentiles per stage (pdf_parse, render, ocr, llm, json_repair,
+    db_write; see utils.timing) and end to end, over documents
+  - throughput at the chosen concurrency
+  - field-level precision / recall / F1 against a gold file, plus line items
+    matched on (name, total_price)
+  - prompt / completion tokens, LLM calls and retries per document (compare
+    --mode auto with --mode layout via --json / --baseline)
+
+Corpus:
+  files  python bench_extract.py invoices/ scans/*.png --gold corrected_gold.jsonl
+         every PDF / image / text file runs the full pipeline; a file is scored
+         when the gold file holds exactly one record for it
+  text   python bench_extract.py --from-gold corrected_gold.jsonl
+         replays each record's stored "text" from the LLM stage on (no PDF
+         parsing or OCR), scored against that record's model_output
+
+Gold records are what annotate_helper.import_corrected writes (or a
+create_dataset_from_pdf *_dataset.jsonl): {"file", "section_id", "text", "model_output"}.
+
+Options:
+  --concurrency N       documents in flight (default 1); LLM calls are still
+                        capped by LLM_STAGE_CONCURRENCY
+  --mode auto|vision|ocr|layout
+  --save-db             also save each result (adds db_write; uses DATABASE_URL)
+  --ocr-cache           keep the OCR cache on (off by default so OCR is measured)
+  --limit N
+  --json out.json       full results incl. per-document rows, for diffing runs
+  --baseline prev.json  print deltas against an earlier --json output
+
+The extraction cache is always bypassed. To run without LM Studio:
+  python stub_llm_server.py --gold corrected_gold.jsonl --latency 0.5 &
+  LMSTUDIO_URL=http://127.0.0.1:1234/v1/chat/completions python bench_extract.py --from-gold corrected_gold.jsonl
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import ai_extractor
+import rule_extractor
+from ai_extractor import extract_invoice_auto, IMAGE_EXTENSIONS
+from chunked_extractor import HEADER_FIELDS
+from models.normalize import normalize_gstin, parse_amount, parse_date
+from utils import timing
+from utils import ocr_reader
+from utils.ocr_cache import ocr_cache
+
+STAGES = ("pdf_parse", "render", "ocr", "llm", "json_repair", "db_write")
+AMOUNT_FIELDS = ("subtotal", "tax", "total")
+PERCENTILES = (50, 90, 95, 99)
+TOKEN_COUNTS = ("prompt_tokens", "completion_tokens", "llm_calls", "llm_retries")
+DOC_EXTENSIONS = (".pdf", ".txt") + IMAGE_EXTENSIONS
+CENT = Decimal("0.01")
+
+
+# ----------------------
+# corpus
+# ----------------------
+def load_gold(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _file_key(path: str) -> str:
+    return os.path.basename(str(path or "")).lower()
+
+
+def corpus_from_gold(records: list) -> list:
+    return [
+        {
+            "id": f"{_file_key(r.get('file')) or 'record'}#{r.get('section_id', i)}",
+            "input": r["text"],
+            "is_text": True,
+            "gold": r.get("model_output"),
+        }
+        for i, r in enumerate(records)
+        if r.get("text")
+    ]
+
+
+def corpus_from_files(paths: list, records: list) -> list:
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            for root, _, names in os.walk(p):
+                files += [os.path.join(root, n) for n in sorted(names) if n.lower().endswith(DOC_EXTENSIONS)]
+        else:
+            files.append(p)
+    by_file = {}
+    for r in records:
+        by_file.setdefault(_file_key(r.get("file")), []).append(r)
+    docs = []
+    for fp in files:
+        gold = by_file.get(_file_key(fp), [])
+        docs.append({
+            "id": fp,
+            "input": fp,
+            "is_text": False,
+            "gold": gold[0].get("model_output") if len(gold) == 1 else None,
+        })
+    return docs
+
+
+# ----------------------
+# scoring
+# ----------------------
+def _norm_text(v) -> str:
+    return re.sub(r"\s+", " ", str(v)).strip(" .,:;").casefold()
+
+
+def normalize_field(field: str, value):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if field in AMOUNT_FIELDS:
+        d = parse_amount(value)
+        return d.quantize(CENT) if d is not None else _norm_text(value)
+    if field == "date":
+        return parse_date(value) or _norm_text(value)
+    if field == "gst_number":
+        return normalize_gstin(value) or _norm_text(value)
+    return _norm_text(value)
+
+
+def _item_key(it: dict):
+    total = parse_amount(it.get("total_price"))
+    return (_norm_text(it.get("name") or ""), total.quantize(CENT) if total is not None else None)
+
+
+def score_document(pred: dict, gold: dict) -> dict:
+    """
+    {field: Counter(tp, fp, fn)} for header fields and "items".
+    A wrong value counts as both a false positive and a false negative.
+    """
+    out = {}
+    for field in HEADER_FIELDS:
+        p = normalize_field(field, pred.get(field))
+        g = normalize_field(field, gold.get(field))
+        c = Counter()
+        if p is not None and p == g:
+            c["tp"] += 1
+        else:
+            if p is not None:
+                c["fp"] += 1
+            if g is not None:
+                c["fn"] += 1
+        out[field] = c
+    p_items = Counter(_item_key(it) for it in pred.get("items") or [] if isinstance(it, dict))
+    g_items = Counter(_item_key(it) for it in gold.get("items") or [] if isinstance(it, dict))
+    tp = sum((p_items & g_items).values())
+    out["items"] = Counter(tp=tp, fp=sum(p_items.values()) - tp, fn=sum(g_items.values()) - tp)
+    return out
+
+
+def _prf(c: Counter) -> dict:
+    tp, fp, fn = c["tp"], c["fp"], c["fn"]
+    precision = tp / (tp + fp) if tp + fp else None
+    recall = tp / (tp + fn) if tp + fn else None
+    f1 = None
+    if precision is not None and recall is not None:
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"tp": tp, "fp": fp, "fn": fn, "precision": precision, "recall": recall, "f1": f1}
+
+
+# ----------------------
+# timing summary
+# ----------------------
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    s = sorted(values)
+    out = {"count": len(s), "mean": sum(s) / len(s), "max": s[-1]}
+    for p in PERCENTILES:
+        out[f"p{p}"] = s[min(len(s) - 1, max(0, -(-p * len(s) // 100) - 1))]  # nearest rank
+    return out
+
+
+# ----------------------
+# run
+# ----------------------
+def _run_one(doc: dict, mode: str, save_db: bool) -> dict:
+    row = {"id": doc["id"], "error": None}
+    start = time.perf_counter()
+    with timing.collect() as t:
+        try:
+            parsed = extract_invoice_auto(doc["input"], is_text=doc["is_text"], use_cache=False, mode=mode)
+            if not isinstance(parsed, dict):
+                raise RuntimeError("extractor returned a non-object")
+            if save_db:
+                from database import SessionLocal
+                from models.persistence import save_invoice
+
+                try:
+                    save_invoice(SessionLocal(), parsed)
+                finally:
+                    SessionLocal.remove()
+        except Exception as e:
+            parsed = None
+            row["error"] = f"{type(e).__name__}: {e}"
+    row["seconds"] = time.perf_counter() - start
+    row["stages"] = {name: v["seconds"] for name, v in t.as_dict().items()}
+    row["counts"] = {name: t.counts.get(name, 0) for name in TOKEN_COUNTS}
+    if parsed is not None and isinstance(doc.get("gold"), dict):
+        scores = score_document(parsed, doc["gold"])
+        row["scores"] = {f: dict(c) for f, c in scores.items()}
+    return row
+
+
+def run(docs: list, concurrency: int, mode: str, save_db: bool, progress: bool = True) -> dict:
+    rows = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for i, row in enumerate(pool.map(lambda d: _run_one(d, mode, save_db), docs), 1):
+            rows.append(row)
+            if progress:
+                print(f"\r{i}/{len(docs)} documents", end="", file=sys.stderr, flush=True)
+    if progress:
+        print(file=sys.stderr)
+    wall = time.perf_counter() - start
+
+    ok = [r for r in rows if r["error"] is None]
+    latency = {"end_to_end": percentiles([r["seconds"] for r in ok])}
+    names = list(STAGES) + sorted({n for r in ok for n in r["stages"]} - set(STAGES))
+    for name in names:
+        latency[name] = percentiles([r["stages"][name] for r in ok if name in r["stages"]])
+
+    totals = {}
+    for r in rows:
+        for field, c in (r.get("scores") or {}).items():
+            totals.setdefault(field, Counter()).update(c)
+    header = sum((totals.get(f, Counter()) for f in HEADER_FIELDS), Counter())
+    return {
+        "documents": len(rows),
+        "errors": len(rows) - len(ok),
+        "scored": sum(1 for r in rows if "scores" in r),
+        "concurrency": concurrency,
+        "wall_seconds": wall,
+        "throughput_docs_per_sec": len(ok) / wall if wall else 0.0,
+        "latency": latency,
+        "tokens": {name: sum(r["counts"][name] for r in ok) / len(ok) if ok else None for name in TOKEN_COUNTS},
+        "fields": {f: _prf(c) for f, c in totals.items()},
+        "header_micro": _prf(header),
+        "per_document": rows,
+    }
+
+
+def run_config(args) -> dict:
+    return {
+        "mode": args.mode,
+        "source": "text" if args.from_gold else "files",
+        "text_model": ai_extractor.TEXT_MODEL,
+        "vision_model": ai_extractor.VISION_MODEL,
+        "prompt_version": ai_extractor.PROMPT_VERSION[:12],
+        "llm_concurrency": ai_extractor.LLM_STAGE_CONCURRENCY,
+        "rule_extractor": rule_extractor.RULE_EXTRACTOR_ENABLED,
+        "ocr_workers": ocr_reader.OCR_WORKERS,
+        "ocr_preprocess": ocr_reader.OCR_PREPROCESS,
+        "ocr_adaptive_dpi": ocr_reader.OCR_ADAPTIVE_DPI,
+        "ocr_cache": ocr_cache.enabled,
+    }
+
+
+# ----------------------
+# report
+# ----------------------
+def _ms(v) -> str:
+    return f"{v * 1000:9.1f}" if v is not None else f"{'-':>9}"
+
+
+def _pct(v) -> str:
+    return f"{v:7.3f}" if v is not None else f"{'-':>7}"
+
+
+def print_report(res: dict, baseline: dict = None):
+    print(f"documents {res['documents']}  errors {res['errors']}  scored {res['scored']}  "
+          f"concurrency {res['concurrency']}  wall {res['wall_seconds']:.2f}s  "
+          f"throughput {res['throughput_docs_per_sec']:.2f} docs/s")
+    print(f"\n{'stage':<12} {'n':>5} {'p50 ms':>9} {'p90 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for name, p in res["latency"].items():
+        if p["count"]:
+            print(f"{name:<12} {p['count']:>5} {_ms(p['p50'])} {_ms(p['p90'])} {_ms(p['p95'])} {_ms(p['p99'])} {_ms(p['mean'])}")
+    tokens = res.get("tokens") or {}
+    if tokens.get("llm_calls") is not None:
+        print("\nper document: " + "  ".join(f"{name} {tokens[name]:.1f}" for name in TOKEN_COUNTS))
+    if res["fields"]:
+        print(f"\n{'field':<16} {'tp':>5} {'fp':>5} {'fn':>5} {'prec':>7} {'recall':>7} {'f1':>7}")
+        for name, f in list(res["fields"].items()) + [("header (micro)", res["header_micro"])]:
+            print(f"{name:<16} {f['tp']:>5} {f['fp']:>5} {f['fn']:>5} {_pct(f['precision'])} {_pct(f['recall'])} {_pct(f['f1'])}")
+    if baseline:
+        print("\nvs baseline:")
+        b = baseline.get("results", baseline)
+        print(f"  throughput {b['throughput_docs_per_sec']:.2f} -> {res['throughput_docs_per_sec']:.2f} docs/s")
+        for name, p in res["latency"].items():
+            q = b.get("latency", {}).get(name) or {}
+            if p.get("count") and q.get("count"):
+                print(f"  {name:<12} p50 {q['p50'] * 1000:.1f} -> {p['p50'] * 1000:.1f} ms   "
+                      f"p95 {q['p95'] * 1000:.1f} -> {p['p95'] * 1000:.1f} ms")
+        for name in TOKEN_COUNTS:
+            old = (b.get("tokens") or {}).get(name)
+            if old is not None and tokens.get(name) is not None:
+                print(f"  {name:<17} {old:.1f} -> {tokens[name]:.1f} per document")
+        for name, f in res["fields"].items():
+            g = b.get("fields", {}).get(name) or {}
+            if f["f1"] is not None and g.get("f1") is not None:
+                print(f"  {name:<12} f1 {g['f1']:.3f} -> {f['f1']:.3f}")
+    for r in res["per_document"]:
+        if r["error"]:
+            print(f"error {r['id']}: {r['error']}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("paths", nargs="*")
+    ap.add_argument("--gold")
+    ap.add_argument("--from-gold")
+    ap.add_argument("--concurrency", type=int, default=1)
+    ap.add_argument("--mode", default="auto", choices=ai_extractor.EXTRACTION_MODES)
+    ap.add_argument("--save-db", action="store_true")
+    ap.add_argument("--ocr-cache", action="store_true")
+    ap.add_argument("--limit", type=int)
+    ap.add_argument("--json", dest="json_out")
+    ap.add_argument("--baseline")
+    args = ap.parse_args(argv)
+
+    if args.from_gold:
+        docs = corpus_from_gold(load_gold(args.from_gold))
+    elif args.paths:
+        docs = corpus_from_files(args.paths, load_gold(args.gold) if args.gold else [])
+    else:
+        ap.error("give files/directories or --from-gold")
+    docs = docs[:args.limit] if args.limit else docs
+    if not docs:
+        print("Nothing to run.")
+        return 1
+
+    ocr_cache.enabled = args.ocr_cache
+    config = run_config(args)
+    res = run(docs, args.concurrency, args.mode, args.save_db)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(res, baseline)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": res}, f, indent=2, default=str)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+# backend/bench_json_repair.py
+"""
+Correctness / speed benchmark for model-output JSON recovery.
+
+Compares utils.json_repair.parse_json with the regex chain it replaced
+(legacy_parse below) on a corpus of model outputs. The built-in corpus takes a
+few reference invoices and produces the damage models actually emit: code
+fences, surrounding prose, trailing commas, single quotes, Python literals,
+unquoted keys, missing commas and truncation at many points.
+
+For intact documents a case passes when the result equals the reference. For
+truncated ones it passes when every recovered field matches the reference
+(nothing invented); `fields` reports how many top-level fields were recovered.
+
+Usage:
+  python bench_json_repair.py [--corpus outputs.jsonl] [--repeat 20] [--json out.json]
+
+A corpus file holds one {"raw": str, "expected": obj, "truncated": bool} per line.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+
+from utils.json_repair import parse_json
+
+REFERENCE = [
+    {
+        "invoice_number": "INV-2024-0042",
+        "date": "2024-03-18",
+        "vendor_name": "O'Brien & Sons Hardware",
+        "buyer_name": "Acme Traders",
+        "gst_number": "27AAPFU0939F1ZV",
+        "currency": "INR",
+        "subtotal": 1250.0,
+        "tax": 225.0,
+        "total": 1475.0,
+        "items": [
+            {"name": "PVC pipe 1/2\"", "quantity": 10, "unit_price": 45.0, "total_price": 450.0},
+            {"name": "Hammer (claw)", "quantity": 2, "unit_price": 250.0, "total_price": 500.0},
+            {"name": "Screws, box of 100", "quantity": 3, "unit_price": 100.0, "total_price": 300.0},
+        ],
+    },
+    {
+        "invoice_number": "B/7781",
+        "date": "05.01.2024",
+        "vendor_name": "Sri Lakshmi Stores",
+        "buyer_name": None,
+        "gst_number": None,
+        "currency": "INR",
+        "subtotal": None,
+        "tax": None,
+        "total": 899.5,
+        "items": [{"name": "Rice 5kg", "quantity": 1, "unit_price": 899.5, "total_price": 899.5}],
+    },
+]
+
+
+def _single_quoted(obj) -> str:
+    # Python-ish rendering: single quotes, None/True, apostrophes left unescaped
+    if isinstance(obj, dict):
+        return "{" + ", ".join(f"'{k}': {_single_quoted(v)}" for k, v in obj.items()) + "}"
+    if isinstance(obj, list):
+        return "[" + ", ".join(_single_quoted(v) for v in obj) + "]"
+    if isinstance(obj, str):
+        return "'" + obj.replace("\\", "\\\\") + "'"
+    return repr(obj)
+
+
+def _variants(ref: dict):
+    pretty = json.dumps(ref, indent=2, ensure_ascii=False)
+    yield "valid", pretty, False
+    yield "fenced", f"```json\n{pretty}\n```", False
+    yield "prose", f"Sure! Here is the extracted invoice:\n\n{pretty}\n\nLet me know if you need anything else.", False
+    yield "trailing_commas", re.sub(r"(\n\s*[}\]])", r",\1", pretty), False
+    yield "single_quotes", _single_quoted(ref), False
+    yield "missing_commas", re.sub(r",\n", "\n", pretty), False
+    unquoted = re.sub(r'"(\w+)":', r"\1:", pretty)
+    yield "unquoted_keys", unquoted, False
+    for frac in (0.2, 0.35, 0.5, 0.65, 0.8, 0.95):
+        yield f"truncated_{int(frac * 100)}", pretty[: int(len(pretty) * frac)], True
+
+
+def builtin_corpus() -> list:
+    cases = []
+    for i, ref in enumerate(REFERENCE):
+        for name, raw, truncated in _variants(ref):
+            cases.append({"name": f"{i}:{name}", "raw": raw, "expected": ref, "truncated": truncated})
+    return cases
+
+
+# ---- the recovery chain used before utils.json_repair ----
+def _legacy_clean(raw: str) -> str:
+    if raw is None:
+        raise ValueError("Model returned empty response")
+    raw = raw.strip()
+    raw = re.sub(r"```json", "", raw, flags=re.IGNORECASE)
+    raw = re.sub(r"```", "", raw)
+    m = re.search(r"\{[\s\S]*\}", raw)
+    if m:
+        raw = m.group(0)
+    raw = raw.replace("'", "\"")
+    raw = re.sub(r",\s*}", "}", raw)
+    raw = re.sub(r",\s*]", "]", raw)
+    if raw.count("}") < raw.count("{"):
+        raw += "}" * (raw.count("{") - raw.count("}"))
+    if raw.count("]") < raw.count("["):
+        raw += "]" * (raw.count("[") - raw.count("]"))
+    return raw
+
+
+def legacy_parse(raw: str):
+    try:
+        return json.loads(raw)
+    except Exception:
+        pass
+    stripped = raw.strip()
+    if stripped.startswith("{") and stripped.endswith("}"):
+        try:
+            return json.loads(stripped)
+        except Exception:
+            pass
+    cleaned = _legacy_clean(raw)
+    try:
+        return json.loads(cleaned)
+    except Exception:
+        cleaned2 = cleaned.replace("'", "\"")
+        cleaned2 = re.sub(r",\s*}", "}", cleaned2)
+        cleaned2 = re.sub(r",\s*]", "]", cleaned2)
+        return json.loads(cleaned2)
+
+
+# ---- scoring ----
+def _consistent(got, expected) -> bool:
+    if isinstance(expected, dict):
+        return isinstance(got, dict) and all(k in expected and _consistent(v, expected[k]) for k, v in got.items())
+    if isinstance(expected, list):
+        return isinstance(got, list) and len(got) <= len(expected) and all(
+            _consistent(g, e) for g, e in zip(got, expected)
+        )
+    if isinstance(expected, str) and isinstance(got, str):
+        return expected.startswith(got)  # a truncated string is a prefix
+    if isinstance(expected, float) and isinstance(got, (int, float)):
+        return str(expected).startswith(str(got).rstrip("0").rstrip("."))
+    return got == expected
+
+
+def check(case: dict, got) -> bool:
+    if case.get("truncated"):
+        return _consistent(got, case["expected"])
+    return got == case["expected"]
+
+
+def run(parser, cases: list, repeat: int) -> dict:
+    passed = 0
+    fields = 0
+    failures = []
+    for case in cases:
+        try:
+            got = parser(case["raw"])
+        except Exception as e:
+            got = e
+        if not isinstance(got, Exception) and check(case, got):
+            passed += 1
+            fields += len(got) if isinstance(got, dict) else 0
+        else:
+            failures.append(case.get("name", "?"))
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for case in cases:
+            try:
+                parser(case["raw"])
+            except Exception:
+                pass
+    elapsed = time.perf_counter() - start
+    calls = repeat * len(cases)
+    return {
+        "cases": len(cases),
+        "passed": passed,
+        "fields_recovered": fields,
+        "us_per_call": elapsed / calls * 1e6 if calls else 0.0,
+        "failures": failures,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus")
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--json", dest="json_out")
+    args = ap.parse_args(argv)
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            cases = [json.loads(line) for line in f if line.strip()]
+    else:
+        cases = builtin_corpus()
+
+    results = {"legacy": run(legacy_parse, cases, args.repeat), "json_repair": run(parse_json, cases, args.repeat)}
+
+    print(f"{'parser':<12} {'passed':>9} {'fields':>7} {'us/call':>9}")
+    for name, r in results.items():
+        print(f"{name:<12} {r['passed']:>4}/{r['cases']:<4} {r['fields_recovered']:>7} {r['us_per_call']:>9.1f}")
+    for name, r in results.items():
+        if r["failures"]:
+            print(f"{name} failed: {', '.join(r['failures'])}")
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+# backend/bench_ocr.py
+"""
+OCR throughput vs. accuracy benchmark.
+
+Pages of PDFs that have a text layer are rendered and OCR'd under several
+settings; the text layer is the ground truth, so no annotation is needed.
+Each setting reports seconds per page and word-level precision / recall / F1
+against the text layer.
+
+Usage:
+  python bench_ocr.py invoices/*.pdf [--max-pages 50] [--configs baseline,prep] [--json out.json]
+                     [--single-images]
+
+--single-images OCRs every page as a standalone image (the /upload and
+mode=ocr image path: planned per image, no document plan to share) instead of
+one plan per PDF (scanned PDFs); plan time is included either way.
+
+OCR runs inline (one page at a time) so the numbers are per-page Tesseract
+cost; multiply throughput by OCR_WORKERS for the pooled pipeline.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from collections import Counter
+
+import fitz  # pymupdf
+
+from utils import ocr_reader
+from utils.pdf_reader import iter_page_images, ocr_dpi
+
+# name -> (render dpi or "adaptive", preprocess, psm or "auto")
+CONFIGS = {
+    "baseline": (200, False, "3"),        # previous behaviour: fixed 200 DPI, raw page
+    "prep": (200, True, "auto"),          # preprocessing + per-document PSM
+    "adaptive": ("adaptive", True, "auto"),
+    "fast": (150, True, "auto"),
+    "fine": (300, True, "auto"),
+}
+
+_WORD = re.compile(r"[A-Za-z0-9][A-Za-z0-9.,/\-]*")
+
+
+def _words(text: str) -> Counter:
+    return Counter(w.lower().strip(".,") for w in _WORD.findall(text or ""))
+
+
+def score(truth: str, ocr: str) -> dict:
+    t, o = _words(truth), _words(ocr)
+    hit = sum((t & o).values())
+    precision = hit / max(1, sum(o.values()))
+    recall = hit / max(1, sum(t.values()))
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1}
+
+
+def collect_pages(paths: list, max_pages: int) -> list:
+    """
+    [(pdf_path, page_index, truth_text)] for pages with a usable text layer.
+    """
+    out = []
+    for path in paths:
+        with fitz.open(path) as doc:
+            for page in doc:
+                text = page.get_text() or ""
+                if len(text.strip()) >= 30:
+                    out.append((path, page.number, text))
+                if len(out) >= max_pages:
+                    return out
+    return out
+
+
+def run_config(name: str, pages: list, single_images: bool = False) -> dict:
+    dpi, prep, psm = CONFIGS[name]
+    ocr_reader.OCR_PREPROCESS = prep
+    ocr_reader.OCR_PSM = psm
+    ocr_reader.OCR_ADAPTIVE_DPI = dpi == "adaptive"
+
+    by_file = {}
+    for path, idx, truth in pages:
+        by_file.setdefault(path, []).append((idx, truth))
+
+    totals = Counter()
+    elapsed = 0.0
+    dpis = []
+    for path, wanted in by_file.items():
+        truths = dict(wanted)
+        render_dpi = ocr_dpi if dpi == "adaptive" else dpi
+        plan = None
+        for idx, raw in iter_page_images(path, dpi=render_dpi, pages=list(truths), gray=prep):
+            start = time.perf_counter()
+            if single_images:
+                text = ocr_reader.image_to_text(raw)
+            else:
+                if plan is None:
+                    plan = ocr_reader.plan_document(raw)
+                text = ocr_reader.image_to_text(raw, plan=plan)
+            elapsed += time.perf_counter() - start
+            dpis.append(raw["dpi"])
+            s = score(truths[idx], text)
+            totals.update(s)
+            totals["pages"] += 1
+
+    n = max(1, totals["pages"])
+    return {
+        "config": name,
+        "pages": totals["pages"],
+        "seconds_per_page": elapsed / n,
+        "pages_per_second": totals["pages"] / elapsed if elapsed else 0.0,
+        "mean_dpi": sum(dpis) / len(dpis) if dpis else 0,
+        "precision": totals["precision"] / n,
+        "recall": totals["recall"] / n,
+        "f1": totals["f1"] / n,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("pdfs", nargs="+")
+    ap.add_argument("--max-pages", type=int, default=50)
+    ap.add_argument("--configs", default=",".join(CONFIGS))
+    ap.add_argument("--json", dest="json_out")
+    ap.add_argument("--single-images", action="store_true", help="OCR each page as a standalone image")
+    args = ap.parse_args(argv)
+
+    pages = collect_pages(args.pdfs, args.max_pages)
+    if not pages:
+        print("No pages with a text layer found.")
+        return 1
+
+    results = [run_config(name, pages, args.single_images) for name in args.configs.split(",")]
+
+    print(f"{'config':<10} {'pages':>5} {'s/page':>8} {'pages/s':>8} {'dpi':>5} {'prec':>6} {'recall':>6} {'f1':>6}")
+    for r in results:
+        print(f"{r['config']:<10} {r['pages']:>5} {r['seconds_per_page']:>8.3f} {r['pages_per_second']:>8.2f} "
+              f"{r['mean_dpi']:>5.0f} {r['precision']:>6.3f} {r['recall']:>6.3f} {r['f1']:>6.3f}")
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+# backend/bench_split.py
+"""
+Invoice splitter benchmark on large synthetic statements.
+
+Builds a merged statement PDF with PyMuPDF: N invoices, some spanning several
+pages (header and "Page k of n" repeated on each page), some short ones
+stacked on a shared page, each repeating GSTIN / Bill To / Sold By lines.
+Some invoices use other labels: a bare "INVOICE" title, "Bill No" and
+"Amount due" instead of "Tax Invoice", "Invoice No" and "Grand Total".
+Both splitters run on it:
+  legacy  whole-document text split at every boundary keyword
+          (split_text_by_boundaries, what split_pdf_into_sections used to do)
+  pages   page-aware detection (splitter.find_pdf_sections) plus materialising
+          every section's text
+and each reports seconds (PDF parse and splitting separately), sections found,
+and how many invoices came out as exactly one section holding only that invoice.
+
+Usage:
+  python bench_split.py [--invoices 200] [--repeat 3] [--stacked 0.3] [--alt-labels 0.3]
+                        [--keep statement.pdf] [--json out.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import fitz  # pymupdf
+
+import splitter
+from utils.pdf_reader import analyze_pdf
+
+LINES_PER_PAGE = 48
+LINE_HEIGHT = 15
+TOP = 60
+_NUMBER = re.compile(r"(?:Invoice|Bill) No: (INV-\d+)")
+
+
+# ----------------------
+# synthetic statement
+# ----------------------
+def _invoice_lines(rng: random.Random, number: str, items: int, alt: bool = False) -> tuple:
+    vendor = f"{rng.choice(['Acme', 'Globex', 'Initech', 'Umbrella', 'Hooli'])} Traders Pvt Ltd"
+    header = [
+        vendor,
+        "INVOICE" if alt else "TAX INVOICE",
+        f"{'Bill' if alt else 'Invoice'} No: {number}",
+        f"Date: {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024",
+        "GSTIN 27ABCDE1234F1Z5",
+        "Sold By: " + vendor,
+        "Bill To: Buyer Stores, Pune   GSTIN 27AAPFU0939F1ZV",
+        "",
+        "Item                          Qty     Rate     Total",
+    ]
+    body = []
+    total = 0
+    for k in range(items):
+        qty, rate = rng.randint(1, 9), rng.randint(10, 500)
+        total += qty * rate
+        body.append(f"Item {k + 1} {rng.choice(['widget', 'bolt', 'panel', 'cable'])}   {qty}   {rate}.00   {qty * rate}.00")
+    footer = [
+        "",
+        f"{'Taxable value' if alt else 'Sub Total'} {total}.00",
+        f"GST 18% {total * 18 // 100}.00",
+        f"{'Amount due' if alt else 'Grand Total'} {total + total * 18 // 100}.00",
+        "Terms: goods once sold will not be taken back.",
+        "Bank: State Bank, A/c 001122334455, IFSC SBIN0001234",
+    ]
+    return header, body, footer
+
+
+def build_statement(path: str, invoices: int, stacked: float, seed: int = 7, alt_labels: float = 0.0) -> list:
+    """
+    Write the statement PDF; returns the invoice numbers in order.
+    """
+    rng = random.Random(seed)
+    pages = []  # list of line lists
+    numbers = []
+    for n in range(invoices):
+        number = f"INV-{n:05d}"
+        numbers.append(number)
+        short = rng.random() < stacked
+        alt = rng.random() < alt_labels
+        header, body, footer = _invoice_lines(rng, number, rng.randint(2, 6) if short else rng.randint(10, 120), alt)
+        lines = header + body + footer
+        if short and pages and len(pages[-1]) + len(lines) + 2 <= LINES_PER_PAGE:
+            pages[-1] += ["", ""] + lines  # stacked under the previous invoice
+            continue
+        # continuation pages repeat the header; "Page k of n" goes in the footer line
+        per_page = LINES_PER_PAGE - len(header) - 1
+        chunks = [body[i:i + per_page] for i in range(0, max(1, len(body)), per_page)] or [[]]
+        for k, chunk in enumerate(chunks):
+            page = header + chunk
+            if k == len(chunks) - 1:
+                page += footer
+            if len(chunks) > 1:
+                page.append(f"Page {k + 1} of {len(chunks)}")
+            pages.append(page)
+
+    doc = fitz.open()
+    for lines in pages:
+        page = doc.new_page(width=595, height=842)
+        y = TOP
+        for line in lines:
+            if line:
+                page.insert_text((50, y), line, fontsize=10)
+            y += LINE_HEIGHT
+    doc.save(path)
+    doc.close()
+    return numbers
+
+
+# ----------------------
+# splitters
+# ----------------------
+def legacy_split(pdf_path: str) -> tuple:
+    start = time.perf_counter()
+    analysis = analyze_pdf(pdf_path)
+    text = "\n".join(p["text"] for p in analysis["pages"] if p["text"]).strip()
+    parsed = time.perf_counter()
+    text = re.sub(r"\r\n|\r", "\n", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    sections = splitter.split_text_by_boundaries(text)
+    return sections, parsed - start, time.perf_counter() - parsed
+
+
+def pages_split(pdf_path: str) -> tuple:
+    start = time.perf_counter()
+    analysis = analyze_pdf(pdf_path, layout=True)
+    texts = [p["text"] for p in analysis["pages"]]
+    parsed = time.perf_counter()
+    found = splitter.detect_sections(analysis["pages"], texts)
+    sections = [splitter.section_text(texts, s) for s in found]
+    return sections, parsed - start, time.perf_counter() - parsed
+
+
+SPLITTERS = {"legacy": legacy_split, "pages": pages_split}
+
+
+def score(sections: list, numbers: list) -> dict:
+    """
+    An invoice is exact when it appears in one section and that section holds no other invoice.
+    """
+    where = defaultdict(list)
+    found = []
+    for i, text in enumerate(sections):
+        nums = set(_NUMBER.findall(text))
+        found.append(nums)
+        for n in nums:
+            where[n].append(i)
+    exact = sum(1 for n in numbers if len(where[n]) == 1 and found[where[n][0]] == {n})
+    return {
+        "sections": len(sections),
+        "exact": exact,
+        "split": sum(1 for n in numbers if len(where[n]) > 1),
+        "merged": sum(1 for nums in found if len(nums) > 1),
+        "no_invoice": sum(1 for nums in found if not nums),
+    }
+
+
+def run(pdf_path: str, numbers: list, repeat: int) -> list:
+    results = []
+    for name, fn in SPLITTERS.items():
+        parse_s, split_s = [], []
+        for _ in range(repeat):
+            sections, p, s = fn(pdf_path)
+            parse_s.append(p)
+            split_s.append(s)
+        results.append({"splitter": name, "parse_seconds": min(parse_s), "split_seconds": min(split_s),
+                        **score(sections, numbers)})
+    return results
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--invoices", type=int, default=200)
+    ap.add_argument("--stacked", type=float, default=0.3, help="fraction of short invoices sharing a page")
+    ap.add_argument("--alt-labels", type=float, default=0.3,
+                    help='fraction of invoices labelled "INVOICE" / "Bill No" / "Amount due"')
+    ap.add_argument("--repeat", type=int, default=3, help="runs per splitter; the fastest is reported")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--keep", help="write the statement here instead of a temp file")
+    ap.add_argument("--json", dest="json_out")
+    args = ap.parse_args(argv)
+
+    path = args.keep or os.path.join(tempfile.mkdtemp(prefix="dawg_split_"), "statement.pdf")
+    numbers = build_statement(path, args.invoices, args.stacked, args.seed, args.alt_labels)
+    with fitz.open(path) as doc:
+        page_count = doc.page_count
+    print(f"{args.invoices} invoices on {page_count} pages ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+    results = run(path, numbers, max(1, args.repeat))
+    print(f"{'splitter':<8} {'parse s':>8} {'split s':>8} {'sections':>8} {'exact':>6} {'split':>6} {'merged':>6} {'empty':>6}")
+    for r in results:
+        print(f"{r['splitter']:<8} {r['parse_seconds']:>8.3f} {r['split_seconds']:>8.4f} {r['sections']:>8} "
+              f"{r['exact']:>6} {r['split']:>6} {r['merged']:>6} {r['no_invoice']:>6}")
+    if not args.keep:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"invoices": args.invoices, "pages": page_count, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
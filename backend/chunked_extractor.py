@@ -0,0 +1,309 @@
+# backend/chunked_extractor.py
+"""
+Token-aware chunked extraction for invoices too long for one prompt.
+
+When the document text is estimated above EXTRACT_TOKEN_BUDGET tokens, it is
+split into line-aligned windows (over-long lines are cut at whitespace first):
+  - header fields are extracted once, from the start and end of the document
+    (where invoice number, parties and totals live), unless the caller
+    already has them;
+  - line items are extracted per window, concurrently; a window is sized so
+    its expected JSON reply fits EXTRACT_ITEM_MAX_TOKENS, and a window whose
+    reply still comes back truncated is split in half and retried;
+  - items are merged in document order, dropping the duplicates produced by
+    the small line overlap between neighbouring windows.
+The result has the same schema as a single-prompt extraction.
+
+The LLM call is passed in, so this module does not depend on ai_extractor:
+call_llm(prompt, max_tokens) returns (parsed, truncated).
+
+Config (env):
+  EXTRACT_TOKEN_BUDGET      prompt tokens above which chunking kicks in (default 6000)
+  EXTRACT_CHUNK_TOKENS      max input tokens per line-item window (default 2500)
+  EXTRACT_HEADER_TOKENS     tokens of head + tail text for header fields (default 1000)
+  EXTRACT_CHUNK_OVERLAP     lines repeated between windows (default 2)
+  EXTRACT_HEADER_MAX_TOKENS reply tokens for the header call (default 2000)
+  EXTRACT_ITEM_MAX_TOKENS   reply tokens for an item call (default 4000)
+  EXTRACT_ITEM_OUTPUT_RATIO expected reply tokens per window input token (default 1.5)
+  EXTRACT_MAX_RESPLITS      times a truncated window is halved and retried (default 2)
+  CHARS_PER_TOKEN           token estimate ratio (default 4)
+"""
+
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Tuple
+
+EXTRACT_TOKEN_BUDGET = int(os.getenv("EXTRACT_TOKEN_BUDGET", "6000"))
+EXTRACT_CHUNK_TOKENS = int(os.getenv("EXTRACT_CHUNK_TOKENS", "2500"))
+EXTRACT_HEADER_TOKENS = int(os.getenv("EXTRACT_HEADER_TOKENS", "1000"))
+EXTRACT_CHUNK_OVERLAP = int(os.getenv("EXTRACT_CHUNK_OVERLAP", "2"))
+EXTRACT_HEADER_MAX_TOKENS = int(os.getenv("EXTRACT_HEADER_MAX_TOKENS", "2000"))
+EXTRACT_ITEM_MAX_TOKENS = int(os.getenv("EXTRACT_ITEM_MAX_TOKENS", "4000"))
+EXTRACT_ITEM_OUTPUT_RATIO = float(os.getenv("EXTRACT_ITEM_OUTPUT_RATIO", "1.5"))
+EXTRACT_MAX_RESPLITS = int(os.getenv("EXTRACT_MAX_RESPLITS", "2"))
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "4"))
+
+# call_llm(prompt, max_tokens) -> (parsed, truncated)
+LLMCall = Callable[[str, int], Tuple[object, bool]]
+AsyncLLMCall = Callable[[str, int], Awaitable[Tuple[object, bool]]]
+
+HEADER_FIELDS = (
+    "invoice_number", "date", "vendor_name", "buyer_name", "gst_number",
+    "currency", "subtotal", "tax", "total",
+)
+
+HEADER_PROMPT_TEMPLATE = """
+You are an invoice parsing expert. Extract header fields and return ONLY valid JSON (no explanation).
+The text below is the beginning and the end of a long invoice; line items are handled separately.
+
+Schema:
+{{
+  "invoice_number": string or null,
+  "date": string or null,
+  "vendor_name": string or null,
+  "buyer_name": string or null,
+  "gst_number": string or null,
+  "currency": string or null,
+  "subtotal": number or null,
+  "tax": number or null,
+  "total": number or null
+}}
+
+Invoice text:
+\"\"\"{invoice_text}\"\"\"
+"""
+
+ITEMS_PROMPT_TEMPLATE = """
+You are an invoice parsing expert. This is part {part} of {parts} of a long invoice.
+Extract ONLY the line items that appear in this part and return ONLY valid JSON (no explanation).
+
+Schema:
+{{
+  "items": [
+    {{
+      "name": string or null,
+      "quantity": number or null,
+      "unit_price": number or null,
+      "total_price": number or null
+    }}
+  ]
+}}
+
+Invoice text:
+\"\"\"{invoice_text}\"\"\"
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def needs_chunking(text: str, budget: int = None) -> bool:
+    return estimate_tokens(text) > (budget or EXTRACT_TOKEN_BUDGET)
+
+
+def _budget_chars(tokens: int) -> int:
+    return int(tokens * CHARS_PER_TOKEN)
+
+
+def window_tokens() -> int:
+    """
+    Input tokens per item window: EXTRACT_CHUNK_TOKENS, lowered when the
+    items reply for that much text would not fit EXTRACT_ITEM_MAX_TOKENS.
+    """
+    by_output = int(EXTRACT_ITEM_MAX_TOKENS / max(EXTRACT_ITEM_OUTPUT_RATIO, 0.1))
+    return max(100, min(EXTRACT_CHUNK_TOKENS, by_output))
+
+
+def header_region(text: str, header_tokens: int = None) -> str:
+    limit = _budget_chars(header_tokens or EXTRACT_HEADER_TOKENS)
+    if len(text) <= limit:
+        return text
+    head = text[: limit * 2 // 3]
+    tail = text[-(limit // 3):]
+    return head + "\n...\n" + tail
+
+
+def _line_pieces(line: str, max_chars: int) -> List[str]:
+    """
+    Cut a line longer than max_chars at whitespace (inside a longer word: hard).
+    """
+    pieces = []
+    while len(line) > max_chars:
+        cut = max(line.rfind(" ", 0, max_chars + 1), line.rfind("\t", 0, max_chars + 1))
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(line[:cut])
+        line = line[cut:].lstrip()
+    if line or not pieces:
+        pieces.append(line)
+    return pieces
+
+
+def split_windows(text: str, chunk_tokens: int = None, overlap: int = None) -> List[dict]:
+    """
+    Split text into line-aligned windows of about `chunk_tokens` tokens
+    (default: window_tokens()).
+    Each window repeats the last `overlap` lines of the previous one so rows
+    are never cut in half. Lines over half a window (OCR text with few
+    newlines) are first cut at whitespace, and the repeated lines are capped
+    at a quarter of a window, so no window goes over budget.
+    Returns [{"text": str, "overlap": str}, ...].
+    """
+    limit = _budget_chars(chunk_tokens or window_tokens())
+    overlap = EXTRACT_CHUNK_OVERLAP if overlap is None else overlap
+    overlap_chars = limit // 4
+    windows = []
+    current = []
+    size = 0
+    carried = []
+    for text_line in text.splitlines():
+        for line in _line_pieces(text_line, max(1, limit // 2)):
+            if current and size + len(line) + 1 > limit:
+                windows.append({"text": "\n".join(current), "overlap": "\n".join(carried)})
+                carried = []
+                kept = 0
+                for prev in reversed(current[-overlap:] if overlap else []):
+                    kept += len(prev) + 1
+                    if kept > overlap_chars:
+                        break
+                    carried.insert(0, prev)
+                current = list(carried)
+                size = sum(len(l) + 1 for l in current)
+            current.append(line)
+            size += len(line) + 1
+    if current and (not windows or len(current) > len(carried)):
+        windows.append({"text": "\n".join(current), "overlap": "\n".join(carried)})
+    return windows
+
+
+def _item_key(it: dict):
+    name = " ".join(str(it.get("name") or "").lower().split())
+    return (name, it.get("quantity"), it.get("unit_price"), it.get("total_price"))
+
+
+def merge_results(header: dict, chunk_items: List[list], windows: List[dict]) -> dict:
+    """
+    Combine header fields with per-window items. An item is treated as an
+    overlap duplicate when the previous window produced the same row and its
+    name occurs in the shared overlap lines.
+    """
+    merged = {f: header.get(f) for f in HEADER_FIELDS}
+    items = []
+    prev_keys = set()
+    for items_i, window in zip(chunk_items, windows):
+        overlap_text = window["overlap"].lower()
+        keys = set()
+        for it in items_i or []:
+            if not isinstance(it, dict):
+                continue
+            k = _item_key(it)
+            keys.add(k)
+            if k in prev_keys and k[0] and k[0] in " ".join(overlap_text.split()):
+                continue
+            items.append(it)
+        prev_keys = keys
+    merged["items"] = items
+    return merged
+
+
+def _items_of(parsed) -> list:
+    if isinstance(parsed, dict):
+        return parsed.get("items") or []
+    if isinstance(parsed, list):
+        return parsed
+    return []
+
+
+def _items_prompt(part, parts: int, text: str) -> str:
+    return ITEMS_PROMPT_TEMPLATE.format(part=part, parts=parts, invoice_text=text)
+
+
+def _halves(text: str) -> List[dict]:
+    """
+    Re-split a window whose reply was truncated; [] when it cannot be split.
+    """
+    sub = split_windows(text, max(1, estimate_tokens(text) // 2))
+    return sub if len(sub) > 1 else []
+
+
+def _window_items(text: str, part, parts: int, call_llm: LLMCall, depth: int = 0) -> Tuple[list, int]:
+    """
+    Items of one window. A truncated reply is discarded and the window is
+    halved and retried, up to EXTRACT_MAX_RESPLITS times; past that the
+    recovered items are kept. Returns (items, windows still truncated).
+    """
+    parsed, truncated = call_llm(_items_prompt(part, parts, text), EXTRACT_ITEM_MAX_TOKENS)
+    sub = _halves(text) if truncated and depth < EXTRACT_MAX_RESPLITS else []
+    if not sub:
+        return _items_of(parsed), int(truncated)
+    results = [
+        _window_items(w["text"], f"{part}.{i + 1}", parts, call_llm, depth + 1)
+        for i, w in enumerate(sub)
+    ]
+    items = merge_results({}, [r[0] for r in results], sub)["items"]
+    return items, sum(r[1] for r in results)
+
+
+async def _window_items_async(text: str, part, parts: int, call_llm: AsyncLLMCall,
+                              depth: int = 0) -> Tuple[list, int]:
+    parsed, truncated = await call_llm(_items_prompt(part, parts, text), EXTRACT_ITEM_MAX_TOKENS)
+    sub = _halves(text) if truncated and depth < EXTRACT_MAX_RESPLITS else []
+    if not sub:
+        return _items_of(parsed), int(truncated)
+    results = await asyncio.gather(*[
+        _window_items_async(w["text"], f"{part}.{i + 1}", parts, call_llm, depth + 1)
+        for i, w in enumerate(sub)
+    ])
+    items = merge_results({}, [r[0] for r in results], sub)["items"]
+    return items, sum(r[1] for r in results)
+
+
+def _header_prompt(text: str) -> str:
+    return HEADER_PROMPT_TEMPLATE.format(invoice_text=header_region(text))
+
+
+def _merge_chunked(text: str, header, window_results: List[tuple], windows: List[dict]) -> dict:
+    merged = merge_results(header if isinstance(header, dict) else {},
+                           [r[0] for r in window_results], windows)
+    merged["chunked"] = {
+        "chunks": len(windows),
+        "estimated_tokens": estimate_tokens(text),
+        "truncated_windows": sum(r[1] for r in window_results),
+    }
+    return merged
+
+
+def extract_chunked(text: str, call_llm: LLMCall, max_workers: int = 4, header: bool = True) -> dict:
+    """
+    Blocking chunked extraction; window calls run on a small thread pool (the
+    LLM client still caps in-flight requests). header=False skips the header
+    call when the caller already has those fields.
+    """
+    windows = split_windows(text)
+    tasks = [
+        (lambda i=i, w=w: _window_items(w["text"], i + 1, len(windows), call_llm))
+        for i, w in enumerate(windows)
+    ]
+    if header:
+        tasks.insert(0, lambda: call_llm(_header_prompt(text), EXTRACT_HEADER_MAX_TOKENS))
+    contexts = [contextvars.copy_context() for _ in tasks]  # keep stage timings
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(lambda ctx, task: ctx.run(task), contexts, tasks))
+    head = results.pop(0)[0] if header else None
+    return _merge_chunked(text, head, results, windows)
+
+
+async def extract_chunked_async(text: str, call_llm: AsyncLLMCall, header: bool = True) -> dict:
+    windows = split_windows(text)
+    tasks = [
+        _window_items_async(w["text"], i + 1, len(windows), call_llm)
+        for i, w in enumerate(windows)
+    ]
+    if header:
+        tasks.insert(0, call_llm(_header_prompt(text), EXTRACT_HEADER_MAX_TOKENS))
+    results = list(await asyncio.gather(*tasks))
+    head = results.pop(0)[0] if header else None
+    return _merge_chunked(text, head, results, windows)
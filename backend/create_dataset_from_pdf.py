@@ -7,35 +7,54 @@ from ai_extractor import extract_invoice_auto
 OUT_DIR = os.environ.get("TMP_DIR", "/tmp/invoice_extractor")
 os.makedirs(OUT_DIR, exist_ok=True)
 
-def process_pdf(pdf_path: str, output_prefix: str = None):
+def process_pdf(pdf_path: str, output_prefix: str = None, save_to_db: bool = False):
     base = output_prefix or os.path.basename(pdf_path).rsplit(".",1)[0]
+    # scanned pages are served from the OCR cache when this corpus was seen before
     sections = split_pdf_into_sections(pdf_path)
     results = []
-    for sid, text in sections:
-        try:
-            # use text-mode extraction to avoid re-OCRing; pass is_text=True
-            parsed = extract_invoice_auto(text, is_text=True)
-        except Exception as e:
-            parsed = {"error": str(e)}
-        rec = {
-            "file": pdf_path,
-            "section_id": sid,
-            "text": text,
-            "model_output": parsed
-        }
-        results.append(rec)
-        # append to JSONL
-        out_file = os.path.join(OUT_DIR, f"{base}_dataset.jsonl")
-        with open(out_file, "a", encoding="utf-8") as f:
+    out_file = os.path.join(OUT_DIR, f"{base}_dataset.jsonl")
+    with open(out_file, "a", encoding="utf-8") as f:
+        for sid, text in sections:
+            try:
+                # use text-mode extraction to avoid re-OCRing; pass is_text=True
+                parsed = extract_invoice_auto(text, is_text=True)
+            except Exception as e:
+                parsed = {"error": str(e)}
+            rec = {
+                "file": pdf_path,
+                "section_id": sid,
+                "text": text,
+                "model_output": parsed
+            }
+            results.append(rec)
+            # append to JSONL
             f.write(json.dumps(rec, ensure_ascii=False) + "\n")
-        print(f"Wrote section {sid} → {out_file}")
+            f.flush()
+            print(f"Wrote section {sid} → {out_file}")
+    if save_to_db:
+        _save_results(results)
     return results
 
+def _save_results(results: list):
+    """Bulk-insert every successfully parsed section in one transaction."""
+    from database import SessionLocal
+    from models.persistence import save_invoices
+
+    parsed = [r["model_output"] for r in results if "error" not in r["model_output"]]
+    db = SessionLocal()
+    try:
+        ids = save_invoices(db, parsed)
+    finally:
+        db.close()
+    print(f"Saved {len(ids)} invoices to DB")
+
 if __name__ == "__main__":
     import sys
-    if len(sys.argv) < 2:
-        print("Usage: python create_dataset_from_pdf.py path/to/file.pdf")
+    args = [a for a in sys.argv[1:] if a != "--save-db"]
+    if len(args) < 1:
+        print("Usage: python create_dataset_from_pdf.py path/to/file.pdf [--save-db]")
         raise SystemExit(1)
-    path = sys.argv[1]
-    process_pdf(path)
+    path = args[0]
+    # for a directory or many PDFs use batch_extract.py (parallel, resumable)
+    process_pdf(path, save_to_db="--save-db" in sys.argv)
     print("Done.")
@@ -19,8 +19,12 @@ DATABASE_URL = os.getenv(
 # Create engine (use future=True for 2.0 style)
 engine = create_engine(DATABASE_URL, echo=False, future=True)
 
-# Session factory (scoped for thread-safety)
-SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
+# Plain session factory: one independent Session per call. Request handlers and
+# background jobs use this, since concurrent requests can share a threadpool thread.
+SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Thread-local sessions for scripts (call SessionLocal.remove() when done)
+SessionLocal = scoped_session(SessionFactory)
 
 # Base class for declarative models
 Base = declarative_base()
@@ -0,0 +1,66 @@
+# backend/extraction_cache.py
+"""
+Content-addressed cache for structured extraction results.
+
+Keys combine the document identity (SHA-256 of the file bytes, or of the
+whitespace-normalised text for text input) with the prompt version and the
+text/vision model names, so changing any of them naturally misses.
+
+Config (env):
+  EXTRACT_CACHE_ENABLED       1/0 (default 1)
+  EXTRACT_CACHE_MEMORY_ITEMS  in-memory LRU size (default 256)
+  EXTRACT_CACHE_PATH          SQLite file for the persistent tier ("" disables it)
+  EXTRACT_CACHE_TTL           seconds (default 30 days)
+  EXTRACT_CACHE_MAX_ENTRIES   persistent tier entry cap (default 50000)
+  EXTRACT_CACHE_MAX_MB        persistent tier size cap (default 512)
+"""
+
+import hashlib
+import os
+import re
+
+from utils.cache import LRUCache, DiskCache, TieredCache
+from utils.env import env_flag
+
+TMP_DIR = os.getenv("TMP_DIR", "/tmp/invoice_extractor")
+
+EXTRACT_CACHE_ENABLED = env_flag("EXTRACT_CACHE_ENABLED")
+EXTRACT_CACHE_MEMORY_ITEMS = int(os.getenv("EXTRACT_CACHE_MEMORY_ITEMS", "256"))
+EXTRACT_CACHE_PATH = os.getenv("EXTRACT_CACHE_PATH", os.path.join(TMP_DIR, "extraction_cache.sqlite3"))
+EXTRACT_CACHE_TTL = float(os.getenv("EXTRACT_CACHE_TTL", str(30 * 86400)))
+EXTRACT_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACT_CACHE_MAX_ENTRIES", "50000"))
+EXTRACT_CACHE_MAX_MB = int(os.getenv("EXTRACT_CACHE_MAX_MB", "512"))
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def text_sha256(text: str) -> str:
+    normalized = re.sub(r"\s+", " ", text).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def make_key(content_hash: str, prompt_version: str, text_model: str, vision_model: str, mode: str = "") -> str:
+    return "|".join([content_hash, prompt_version, text_model, vision_model, mode])
+
+
+def _build_cache() -> TieredCache:
+    disk = None
+    if EXTRACT_CACHE_ENABLED and EXTRACT_CACHE_PATH:
+        disk = DiskCache(
+            EXTRACT_CACHE_PATH,
+            ttl=EXTRACT_CACHE_TTL,
+            max_entries=EXTRACT_CACHE_MAX_ENTRIES,
+            max_bytes=EXTRACT_CACHE_MAX_MB * 1024 * 1024,
+        )
+    return TieredCache(LRUCache(EXTRACT_CACHE_MEMORY_ITEMS), disk, enabled=EXTRACT_CACHE_ENABLED)
+
+
+extraction_cache = _build_cache()
@@ -0,0 +1,142 @@
+# backend/jobs.py
+"""
+In-process background job queue for extractions.
+
+POST /invoices/jobs enqueues work and returns a job id immediately; a bounded
+pool of asyncio workers drains the queue and the client polls
+GET /invoices/jobs/{id}. Jobs carry a dedup key (document hash + prompt
+version + models), so re-submitting the same document while its job is
+queued, running or done returns the existing job instead of starting a
+second extraction.
+
+Job state lives in this process only; finished jobs are dropped after
+JOB_RETENTION seconds.
+
+Config (env):
+  JOB_WORKERS     concurrent jobs per process (default 4)
+  JOB_QUEUE_MAX   queued jobs before submissions are rejected (default 1000)
+  JOB_RETENTION   seconds to keep finished jobs (default 3600)
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "1000"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "3600"))
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobQueue:
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_MAX, retention: float = JOB_RETENTION):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention = retention
+        self.jobs = {}
+        self._by_dedup = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._handler = None
+
+    async def start(self, handler: Callable[[dict], Awaitable[dict]]):
+        """
+        Start the worker tasks. `handler(job)` does the work and returns the result dict.
+        """
+        self._handler = handler
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, payload: dict, dedup_key: str = None) -> (dict, bool):
+        """
+        Enqueue a job. Returns (job, deduplicated). Raises QueueFullError when
+        the queue is at capacity.
+        """
+        if self._queue is None:
+            raise RuntimeError("Job queue is not running.")
+        self._expire()
+        if dedup_key:
+            existing = self.jobs.get(self._by_dedup.get(dedup_key))
+            if existing and existing["status"] != FAILED:
+                return existing, True
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": QUEUED,
+            "dedup_key": dedup_key,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+            "payload": payload,
+        }
+        try:
+            self._queue.put_nowait(job["id"])
+        except asyncio.QueueFull:
+            raise QueueFullError("Extraction queue is full, retry later.")
+        self.jobs[job["id"]] = job
+        if dedup_key:
+            self._by_dedup[dedup_key] = job["id"]
+        return job, False
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.jobs.get(job_id)
+
+    @staticmethod
+    def public_view(job: dict) -> dict:
+        return {k: v for k, v in job.items() if k not in ("payload", "dedup_key")}
+
+    def _expire(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j["id"] for j in self.jobs.values() if j["finished_at"] and j["finished_at"] < cutoff]:
+            job = self.jobs.pop(job_id)
+            if job["dedup_key"] and self._by_dedup.get(job["dedup_key"]) == job_id:
+                del self._by_dedup[job["dedup_key"]]
+
+    async def _worker(self, n: int):
+        while True:
+            job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            try:
+                if job is None:
+                    continue
+                job["status"] = RUNNING
+                job["started_at"] = time.time()
+                try:
+                    job["result"] = await self._handler(job)
+                    job["status"] = DONE
+                except Exception as e:
+                    logger.exception("Job %s failed", job_id)
+                    job["error"] = str(e)
+                    job["status"] = FAILED
+                job["finished_at"] = time.time()
+                job["payload"] = None
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for j in self.jobs.values():
+            counts[j["status"]] += 1
+        counts["workers"] = self.workers
+        return counts
+
+
+job_queue = JobQueue()
@@ -0,0 +1,297 @@
+# backend/llm_client.py
+"""
+Reusable HTTP client for OpenAI-compatible chat endpoints (LM Studio / OpenRouter).
+
+One LLMClient keeps pooled keep-alive connections (requests.Session for sync
+callers, httpx.AsyncClient for async ones), caps how many calls are in flight
+at once so the model server's parallel slots are not oversubscribed, retries
+transient failures (connection errors and connect timeouts, 429 and 5xx) with
+exponential backoff, and records latency / token usage per call. A read
+timeout is not retried: the call already took the full timeout, and retrying
+a stuck generation would block the caller for max_retries more of them.
+
+stream_chat_async() consumes `stream: true` (server-sent events) responses and
+yields content deltas as they arrive.
+
+The sync and async paths have separate concurrency caps; a process that uses
+both can have up to 2 * max_concurrency calls in flight.
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+
+from utils import metrics, timing
+
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class LLMClient:
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        timeout: float = 300,
+        pool_size: int = 10,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.pool_size = pool_size
+
+        self._session: Optional[requests.Session] = None
+        self._session_lock = threading.Lock()
+        self._sync_sem = threading.BoundedSemaphore(max_concurrency)
+
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_sems = {}
+
+        self._stats_lock = threading.Lock()
+        self._totals = {
+            "calls": 0,
+            "errors": 0,
+            "retries": 0,
+            "latency_ms_total": 0.0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        }
+        self.recent_calls = deque(maxlen=100)
+
+    # ----------------------
+    # connections
+    # ----------------------
+    def _get_session(self) -> requests.Session:
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    s = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    s.mount("http://", adapter)
+                    s.mount("https://", adapter)
+                    self._session = s
+        return self._session
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None or self._async_client.is_closed:
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            self._async_client = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+        return self._async_client
+
+    def _async_semaphore(self) -> asyncio.Semaphore:
+        # asyncio primitives bind to the running loop, so keep one per loop
+        key = id(asyncio.get_running_loop())
+        sem = self._async_sems.get(key)
+        if sem is None:
+            sem = self._async_sems[key] = asyncio.Semaphore(self.max_concurrency)
+        return sem
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self.close()
+
+    # ----------------------
+    # retry policy
+    # ----------------------
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
+
+    @staticmethod
+    def _retryable_status(status: int) -> bool:
+        return status in RETRY_STATUS
+
+    @staticmethod
+    def _read_timed_out(e: BaseException) -> bool:
+        """
+        True for a read timeout that requests reports as a ConnectionError
+        (one hit while reading the body wraps urllib3's ReadTimeoutError).
+        """
+        seen = set()
+        todo = [e]
+        while todo:
+            err = todo.pop()
+            if id(err) in seen:
+                continue
+            seen.add(id(err))
+            if isinstance(err, (ReadTimeoutError, requests.ReadTimeout)):
+                return True
+            todo += [a for a in getattr(err, "args", ()) if isinstance(a, BaseException)]
+            todo += [c for c in (err.__cause__, err.__context__) if c is not None]
+        return False
+
+    # ----------------------
+    # calls
+    # ----------------------
+    def post_chat(self, payload: dict, url: str, headers: dict = None, timeout: float = None) -> dict:
+        headers = headers or {"Content-Type": "application/json"}
+        timeout = timeout or self.timeout
+        session = self._get_session()
+        attempt = 0
+        with self._sync_sem:
+            start = time.perf_counter()
+            while True:
+                try:
+                    r = session.post(url, json=payload, headers=headers, timeout=timeout)
+                    if self._retryable_status(r.status_code) and attempt < self.max_retries:
+                        raise _Retry(f"HTTP {r.status_code}")
+                    r.raise_for_status()
+                    resp = r.json()
+                    self._record(start, attempt, resp, None)
+                    return resp
+                except (_Retry, requests.ConnectionError) as e:  # incl. ConnectTimeout, not ReadTimeout
+                    if self._read_timed_out(e) or attempt >= self.max_retries:
+                        self._record(start, attempt, None, e)
+                        raise
+                    time.sleep(self._backoff(attempt))
+                    attempt += 1
+                except Exception as e:
+                    self._record(start, attempt, None, e)
+                    raise
+
+    async def post_chat_async(self, payload: dict, url: str, headers: dict = None, timeout: float = None) -> dict:
+        headers = headers or {"Content-Type": "application/json"}
+        timeout = timeout or self.timeout
+        client = self._get_async_client()
+        attempt = 0
+        async with self._async_semaphore():
+            start = time.perf_counter()
+            while True:
+                try:
+                    r = await client.post(url, json=payload, headers=headers, timeout=timeout)
+                    if self._retryable_status(r.status_code) and attempt < self.max_retries:
+                        raise _Retry(f"HTTP {r.status_code}")
+                    r.raise_for_status()
+                    resp = r.json()
+                    self._record(start, attempt, resp, None)
+                    return resp
+                except (_Retry, httpx.TransportError) as e:
+                    if isinstance(e, httpx.ReadTimeout) or attempt >= self.max_retries:
+                        self._record(start, attempt, None, e)
+                        raise
+                    await asyncio.sleep(self._backoff(attempt))
+                    attempt += 1
+                except Exception as e:
+                    self._record(start, attempt, None, e)
+                    raise
+
+    async def stream_chat_async(self, payload: dict, url: str, headers: dict = None, timeout: float = None):
+        """
+        Stream a chat completion and yield content deltas (str) as they arrive.
+        Retries apply only until the first delta; after that a failure is
+        raised to the caller. Closing the generator early (e.g. once the JSON
+        is complete) drops the connection, which stops generation server-side.
+        """
+        headers = headers or {"Content-Type": "application/json"}
+        timeout = timeout or self.timeout
+        payload = dict(payload, stream=True, stream_options={"include_usage": True})
+        client = self._get_async_client()
+        attempt = 0
+        started = False
+        usage = {}
+        error = None
+        async with self._async_semaphore():
+            start = time.perf_counter()
+            try:
+                while True:
+                    try:
+                        async with client.stream("POST", url, json=payload, headers=headers, timeout=timeout) as r:
+                            if self._retryable_status(r.status_code) and attempt < self.max_retries:
+                                raise _Retry(f"HTTP {r.status_code}")
+                            r.raise_for_status()
+                            async for line in r.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[5:].strip()
+                                if data == "[DONE]":
+                                    break
+                                try:
+                                    chunk = json.loads(data)
+                                except ValueError:
+                                    continue
+                                usage = chunk.get("usage") or usage
+                                for choice in chunk.get("choices") or []:
+                                    delta = (choice.get("delta") or {}).get("content") or choice.get("text")
+                                    if delta:
+                                        started = True
+                                        yield delta
+                        return
+                    except (_Retry, httpx.TransportError) as e:
+                        if started or isinstance(e, httpx.ReadTimeout) or attempt >= self.max_retries:
+                            raise
+                        await asyncio.sleep(self._backoff(attempt))
+                        attempt += 1
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                self._record(start, attempt, {"usage": usage}, error)
+
+    # ----------------------
+    # accounting
+    # ----------------------
+    def _record(self, start: float, retries: int, resp: Optional[dict], error: Optional[Exception]):
+        latency_ms = (time.perf_counter() - start) * 1000
+        timing.record("llm", latency_ms / 1000)
+        usage = (resp or {}).get("usage") or {}
+        call = {
+            "latency_ms": round(latency_ms, 1),
+            "retries": retries,
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens"),
+            "error": f"{type(error).__name__}: {error}" if error else None,
+        }
+        metrics.LLM_REQUESTS.inc(outcome="error" if error else "ok")
+        metrics.LLM_RETRIES.inc(retries)
+        metrics.LLM_TOKENS.inc(usage.get("prompt_tokens") or 0, kind="prompt")
+        metrics.LLM_TOKENS.inc(usage.get("completion_tokens") or 0, kind="completion")
+        timing.count("llm_calls")
+        timing.count("llm_retries", retries)
+        timing.count("prompt_tokens", usage.get("prompt_tokens") or 0)
+        timing.count("completion_tokens", usage.get("completion_tokens") or 0)
+        with self._stats_lock:
+            t = self._totals
+            t["calls"] += 1
+            t["retries"] += retries
+            t["latency_ms_total"] += latency_ms
+            t["prompt_tokens"] += usage.get("prompt_tokens") or 0
+            t["completion_tokens"] += usage.get("completion_tokens") or 0
+            if error:
+                t["errors"] += 1
+            self.recent_calls.append(call)
+
+    def stats(self) -> dict:
+        """
+        Totals since start plus the most recent per-call records.
+        """
+        with self._stats_lock:
+            t = dict(self._totals)
+            recent = list(self.recent_calls)
+        t["latency_ms_avg"] = round(t["latency_ms_total"] / t["calls"], 1) if t["calls"] else None
+        t["latency_ms_total"] = round(t["latency_ms_total"], 1)
+        t["max_concurrency"] = self.max_concurrency
+        t["recent_calls"] = recent
+        return t
+
+
+class _Retry(Exception):
+    """Internal signal: response status is retryable."""
@@ -6,9 +6,18 @@ FastAPI app init. Includes routers and auto-create tables on startup.
 import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 from database import engine, Base
-from routes.upload import router as invoice_router
+from models.invoice import ensure_indexes
+from models.migrations import ensure_schema
+from models import search
+from routes.upload import router as invoice_router, run_extraction_job
+from ai_extractor import close_llm_client, llm
+from extraction_cache import extraction_cache
+from jobs import job_queue
+from utils import metrics
+from utils.ocr_cache import ocr_cache
 
 FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "http://localhost:5173")
 
@@ -28,6 +37,45 @@ app.include_router(invoice_router)
 def on_startup():
     # Create database tables if not present
     Base.metadata.create_all(bind=engine)
+    ensure_schema(engine)
+    ensure_indexes(engine)
+    if search.SEARCH_INDEX_ENABLED:
+        search.ensure_search_index(engine)
+
+@app.on_event("startup")
+async def start_job_workers():
+    await job_queue.start(run_extraction_job)
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await job_queue.stop()
+    await close_llm_client()
+
+def _scrape_time_metrics():
+    caches = {"extraction": extraction_cache.stats(), "ocr": ocr_cache.stats()}
+    lookups = {}
+    for name, st in caches.items():
+        lookups[(name, "hit")] = st["hits_memory"] + st["hits_disk"]
+        lookups[(name, "miss")] = st["misses"]
+    yield from metrics.sample_lines(
+        "dawg_cache_lookups_total", "Extraction / OCR cache lookups", lookups, ("cache", "result"), kind="counter"
+    )
+    yield from metrics.sample_lines(
+        "dawg_cache_entries", "Entries in the in-memory cache tier",
+        {(name,): st["memory_entries"] for name, st in caches.items()}, ("cache",),
+    )
+    yield from metrics.sample_lines("dawg_llm_max_concurrency", "LLM calls allowed in flight", {(): llm.max_concurrency})
+
+
+if metrics.METRICS_ENABLED:
+    metrics.register_callback(_scrape_time_metrics)
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    def prometheus_metrics():
+        """
+        Prometheus text exposition of stage timings, pipeline counters and cache stats.
+        """
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.get("/")
 def root():
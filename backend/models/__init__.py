@@ -1,2 +1,2 @@
 # Import models here for Alembic autogenerate convenience
-from .invoice import Invoice, Item  # noqa
+from .invoice import Vendor, Invoice, Item  # noqa
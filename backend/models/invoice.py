@@ -1,12 +1,34 @@
 # backend/models/invoice.py
 """
-SQLAlchemy models for Invoice and Item.
+SQLAlchemy models for Vendor, Invoice and Item.
+
+Money columns are Numeric (exact), invoice_date is a real Date parsed from the
+printed date (kept verbatim in `date`), and vendors are deduplicated by
+models.normalize.vendor_key (GSTIN, else normalized name).
 """
 
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Numeric, Date, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
+MONEY = Numeric(14, 2)
+
+
+class Vendor(Base):
+    __tablename__ = "vendors"
+
+    id = Column(Integer, primary_key=True, index=True)
+    vendor_key = Column(String(300), unique=True, nullable=False)
+    name = Column(String(256), nullable=True)  # first spelling seen
+    normalized_name = Column(String(256), index=True, nullable=True)
+    gstin = Column(String(15), index=True, nullable=True)
+
+    invoices = relationship("Invoice", back_populates="vendor")
+
+    def __repr__(self):
+        return f"<Vendor(id={self.id}, vendor_key={self.vendor_key})>"
+
+
 class Invoice(Base):
     __tablename__ = "invoices"
 
@@ -14,15 +36,26 @@ class Invoice(Base):
     invoice_number = Column(String(128), index=True, nullable=True)
     vendor_name = Column(String(256), nullable=True)
     buyer_name = Column(String(256), nullable=True)
-    date = Column(String(50), nullable=True)  # flexible format
-    subtotal = Column(Float, nullable=True)
-    tax = Column(Float, nullable=True)
-    total = Column(Float, nullable=True)
+    date = Column(String(50), nullable=True)  # as printed on the invoice
+    invoice_date = Column(Date, nullable=True)  # parsed from `date`
+    vendor_id = Column(Integer, ForeignKey("vendors.id"), nullable=True)
+    subtotal = Column(MONEY, nullable=True)
+    tax = Column(MONEY, nullable=True)
+    total = Column(MONEY, nullable=True)
     currency = Column(String(16), nullable=True)
     raw_text = Column(Text, nullable=True)
 
+    vendor = relationship("Vendor", back_populates="invoices")
     items = relationship("Item", back_populates="invoice", cascade="all, delete-orphan")
 
+    # Listing filters + keyset pagination on id (see models.queries)
+    __table_args__ = (
+        Index("ix_invoices_vendor_name_id", "vendor_name", "id"),
+        Index("ix_invoices_invoice_date_id", "invoice_date", "id"),
+        Index("ix_invoices_vendor_id_invoice_date", "vendor_id", "invoice_date", "id"),
+        Index("ix_invoices_total_id", "total", "id"),
+    )
+
     def __repr__(self):
         return f"<Invoice(id={self.id}, invoice_number={self.invoice_number})>"
 
@@ -31,13 +64,23 @@ class Item(Base):
     __tablename__ = "items"
 
     id = Column(Integer, primary_key=True, index=True)
-    invoice_id = Column(Integer, ForeignKey("invoices.id", ondelete="CASCADE"), nullable=False)
+    invoice_id = Column(Integer, ForeignKey("invoices.id", ondelete="CASCADE"), nullable=False, index=True)
     name = Column(String(512), nullable=True)
-    quantity = Column(Float, nullable=True)
-    unit_price = Column(Float, nullable=True)
-    total_price = Column(Float, nullable=True)
+    quantity = Column(Numeric(14, 3), nullable=True)
+    unit_price = Column(Numeric(14, 4), nullable=True)
+    total_price = Column(MONEY, nullable=True)
 
     invoice = relationship("Invoice", back_populates="items")
 
     def __repr__(self):
         return f"<Item(id={self.id}, name={self.name})>"
+
+
+def ensure_indexes(engine):
+    """
+    create_all() only indexes tables it creates; add indexes that were
+    introduced after a table already existed.
+    """
+    for table in (Vendor.__table__, Invoice.__table__, Item.__table__):
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
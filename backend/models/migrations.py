@@ -0,0 +1,135 @@
+# backend/models/migrations.py
+"""
+Schema upgrades for databases created before a column existed.
+
+ensure_schema() runs at startup: it adds missing nullable columns
+(ALTER TABLE ... ADD COLUMN is cheap on both PostgreSQL and SQLite), so the app
+works against an old database straight away.
+
+The normalization upgrade is run once by hand:
+  python -m models.migrations normalize [--batch 1000]
+which
+  1. on PostgreSQL converts the old float money columns to numeric (this
+     rewrites invoices/items, so run it off-peak; SQLite needs no conversion)
+  2. backfills invoice_date and vendor_id batch by batch (keyset on id, one
+     commit per batch, so it can be interrupted and re-run)
+  3. replaces the string-date index with the (invoice_date) and
+     (vendor_id, invoice_date) indexes
+"""
+
+from sqlalchemy import inspect, select, update, or_
+from sqlalchemy.orm import Session
+
+from .invoice import Invoice, Item, ensure_indexes
+from .normalize import parse_date
+from .persistence import resolve_vendors, vendor_row
+
+BACKFILL_BATCH = 1000
+
+# column -> numeric type for the float -> numeric conversion (PostgreSQL)
+NUMERIC_COLUMNS = {
+    "invoices": {"subtotal": "numeric(14,2)", "tax": "numeric(14,2)", "total": "numeric(14,2)"},
+    "items": {"quantity": "numeric(14,3)", "unit_price": "numeric(14,4)", "total_price": "numeric(14,2)"},
+}
+DROPPED_INDEXES = ("ix_invoices_date_id",)
+
+
+def ensure_schema(engine):
+    """
+    Add columns the models define but the existing tables lack.
+    """
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in (Invoice.__table__, Item.__table__):
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(dialect=engine.dialect)}"
+                for fk in col.foreign_keys:
+                    ddl += f" REFERENCES {fk.column.table.name}({fk.column.name})"
+                conn.exec_driver_sql(ddl)
+
+
+def convert_numeric_columns(engine):
+    if engine.dialect.name != "postgresql":
+        return
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table, columns in NUMERIC_COLUMNS.items():
+            types = {c["name"]: c["type"] for c in insp.get_columns(table)}
+            for col, numeric in columns.items():
+                if col not in types or type(types[col]).__name__ == "NUMERIC":
+                    continue
+                # values that do not fit (or NaN) become NULL instead of failing the whole ALTER
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {table} ALTER COLUMN {col} TYPE {numeric} "
+                    f"USING CASE WHEN abs({col}) < 1e12 THEN round({col}::numeric, 4) END"
+                )
+
+
+def backfill(db: Session, batch_size: int = BACKFILL_BATCH) -> int:
+    """
+    Fill invoice_date and vendor_id for rows saved before they existed.
+    Older rows have no stored GSTIN, so their vendors are matched by normalized
+    name (joining GSTIN-keyed vendors of the same name, see resolve_vendors).
+    Returns the number of rows visited.
+    """
+    done = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(Invoice.id, Invoice.date, Invoice.vendor_name, Invoice.invoice_date, Invoice.vendor_id)
+            .where(Invoice.id > last_id, or_(Invoice.invoice_date.is_(None), Invoice.vendor_id.is_(None)))
+            .order_by(Invoice.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            db.commit()  # end the read transaction; DDL follows on other connections
+            return done
+        vendor_ids = resolve_vendors(
+            db, [vendor_row(r.vendor_name) if r.vendor_id is None else None for r in rows]
+        )
+        updates = [
+            {
+                "id": r.id,
+                "invoice_date": r.invoice_date or parse_date(r.date),
+                "vendor_id": r.vendor_id or vid,
+            }
+            for r, vid in zip(rows, vendor_ids)
+        ]
+        db.execute(update(Invoice), updates)
+        db.commit()
+        done += len(rows)
+        last_id = rows[-1].id
+
+
+def normalize(engine, db: Session, batch_size: int = BACKFILL_BATCH) -> int:
+    ensure_schema(engine)
+    convert_numeric_columns(engine)
+    done = backfill(db, batch_size)
+    with engine.begin() as conn:
+        for name in DROPPED_INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+    ensure_indexes(engine)
+    return done
+
+
+if __name__ == "__main__":
+    import sys
+
+    args = sys.argv[1:]
+    if not args or args[0] != "normalize":
+        print("Usage: python -m models.migrations normalize [--batch N]")
+        raise SystemExit(1)
+    batch = int(args[args.index("--batch") + 1]) if "--batch" in args else BACKFILL_BATCH
+    from database import Base, SessionLocal, engine
+
+    Base.metadata.create_all(bind=engine)  # vendors table
+    db = SessionLocal()
+    try:
+        print(f"Normalized {normalize(engine, db, batch)} invoices.")
+    finally:
+        db.close()
@@ -0,0 +1,175 @@
+# backend/models/normalize.py
+"""
+Normalization between extraction and persistence.
+
+Model output keeps whatever the invoice printed ("18/03/2024", "₹ 1,20,000.50",
+"ACME Pvt. Ltd."). Before saving, values are turned into typed columns:
+  parse_date()     -> datetime.date  (day-first unless DATE_DAY_FIRST=0)
+  parse_amount()   -> Decimal        (currency marks, Indian/Western/European
+                                      grouping, (123.45) negatives, "500/-")
+  vendor_key()     -> dedup key for the vendors table: the GSTIN when there is
+                      a valid one, otherwise the normalized name
+"""
+
+import math
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+from utils.env import env_flag
+
+DATE_DAY_FIRST = env_flag("DATE_DAY_FIRST")
+
+_MONTHS = {
+    m: i + 1
+    for i, names in enumerate((
+        ("jan", "january"), ("feb", "february"), ("mar", "march"), ("apr", "april"),
+        ("may",), ("jun", "june"), ("jul", "july"), ("aug", "august"),
+        ("sep", "sept", "september"), ("oct", "october"), ("nov", "november"), ("dec", "december"),
+    ))
+    for m in names
+}
+
+RE_YMD = re.compile(r"^(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})")
+RE_NUMERIC_DATE = re.compile(r"^(\d{1,2})[-/.](\d{1,2})[-/.](\d{2}|\d{4})$")
+RE_DAY_MONTH_NAME = re.compile(r"^(\d{1,2})(?:st|nd|rd|th)?[-/.\s]+([A-Za-z]+)\.?,?[-/.\s]+(\d{2}|\d{4})$")
+RE_MONTH_NAME_DAY = re.compile(r"^([A-Za-z]+)\.?[-/.\s]+(\d{1,2})(?:st|nd|rd|th)?,?[-/.\s]+(\d{2}|\d{4})$")
+
+RE_PLAIN_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+RE_CURRENCY_WORD = re.compile(r"[A-Za-z]+\.?")  # Rs. / INR / USD, with an abbreviation dot
+RE_AMOUNT_NOISE = re.compile(r"[^\d.,\-()]")
+RE_AMOUNT_SUFFIX = re.compile(r"-?/[-=]\s*$")  # "Rs. 5,000/-", "5,000-/-": no paise, not a sign
+RE_TRAILING_MINUS = re.compile(r"\d-\s*$")  # "123.45-", a credit
+RE_GSTIN = re.compile(r"^\d{2}[A-Z]{5}\d{4}[A-Z][A-Z\d]Z[A-Z\d]$")
+
+LEGAL_SUFFIXES = (
+    "private limited", "pvt ltd", "pvt", "limited", "ltd", "llp", "llc",
+    "inc", "incorporated", "corp", "corporation", "co", "company", "gmbh", "plc",
+)
+_RE_SUFFIX = re.compile(r"(?:\s+(?:" + "|".join(re.escape(s) for s in LEGAL_SUFFIXES) + r"))+$")
+
+
+def _year(y: str) -> int:
+    y = int(y)
+    return y + 2000 if y < 100 else y
+
+
+def _make_date(y: int, m: int, d: int) -> Optional[date]:
+    try:
+        return date(y, m, d)
+    except ValueError:
+        return None
+
+
+def parse_date(value, day_first: bool = None) -> Optional[date]:
+    """
+    Parse an invoice date. Numeric dates are read day-first (dd/mm/yyyy) unless
+    that is impossible (e.g. 03/18/2024) or day_first is False.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    s = str(value).strip()
+    if not s:
+        return None
+    day_first = DATE_DAY_FIRST if day_first is None else day_first
+
+    m = RE_YMD.match(s)
+    if m:
+        return _make_date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+
+    m = RE_NUMERIC_DATE.match(s)
+    if m:
+        a, b, y = int(m.group(1)), int(m.group(2)), _year(m.group(3))
+        first, second = (b, a) if day_first else (a, b)  # (month, day)
+        return _make_date(y, first, second) or _make_date(y, second, first)
+
+    m = RE_DAY_MONTH_NAME.match(s)
+    if m and m.group(2).lower() in _MONTHS:
+        return _make_date(_year(m.group(3)), _MONTHS[m.group(2).lower()], int(m.group(1)))
+
+    m = RE_MONTH_NAME_DAY.match(s)
+    if m and m.group(1).lower() in _MONTHS:
+        return _make_date(_year(m.group(3)), _MONTHS[m.group(1).lower()], int(m.group(2)))
+    return None
+
+
+def parse_amount(value) -> Optional[Decimal]:
+    """
+    Parse a money/quantity value into Decimal.
+
+    Handles currency symbols and codes, "1,20,000.50" and "1,200.50"
+    grouping, European "1.200,50", a lone decimal comma ("12,5"), and
+    accounting negatives "(123.45)". A trailing "/-" or "-/-" is decoration;
+    a trailing "-" is a sign only right after a digit ("123.45-").
+    Returns None when there is no number.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, (int, float)):
+        return Decimal(str(value)) if math.isfinite(value) else None
+    if RE_PLAIN_NUMBER.fullmatch(str(value).strip()):
+        return Decimal(str(value).strip())
+
+    s = RE_AMOUNT_SUFFIX.sub("", RE_CURRENCY_WORD.sub("", str(value)).strip())
+    trailing_minus = RE_TRAILING_MINUS.search(s) is not None
+    s = RE_AMOUNT_NOISE.sub("", s)
+    negative = s.startswith("(") and s.endswith(")") or s.startswith("-") or trailing_minus
+    s = s.strip("()-")
+    if not s or not any(c.isdigit() for c in s):
+        return None
+
+    if "," in s and "." in s:
+        # whichever separator comes last is the decimal point
+        if s.rfind(",") > s.rfind("."):
+            s = s.replace(".", "").replace(",", ".")
+        else:
+            s = s.replace(",", "")
+    elif "," in s:
+        head, _, tail = s.rpartition(",")
+        if s.count(",") == 1 and len(tail) in (1, 2):
+            s = head + "." + tail
+        else:
+            s = s.replace(",", "")
+    elif s.count(".") > 1:
+        s = s.replace(".", "")
+
+    try:
+        d = Decimal(s)
+    except InvalidOperation:
+        return None
+    return -d if negative else d
+
+
+def normalize_gstin(value) -> Optional[str]:
+    if not value:
+        return None
+    g = re.sub(r"[^0-9A-Za-z]", "", str(value)).upper()
+    return g if RE_GSTIN.match(g) else None
+
+
+def normalize_name(name) -> Optional[str]:
+    """
+    Case/punctuation/legal-suffix insensitive form: "ACME Pvt. Ltd." -> "acme".
+    """
+    if not name:
+        return None
+    n = str(name).casefold().replace("&", " and ")
+    n = re.sub(r"[^\w\s]", " ", n)
+    n = " ".join(n.split())
+    n = _RE_SUFFIX.sub("", n).strip()
+    return n or None
+
+
+def vendor_key(name, gstin=None) -> Optional[str]:
+    g = normalize_gstin(gstin)
+    if g:
+        return f"gstin:{g}"
+    n = normalize_name(name)
+    return f"name:{n}" if n else None
@@ -0,0 +1,251 @@
+# backend/models/persistence.py
+"""
+Set-based persistence for extracted invoices.
+
+save_invoices() writes any number of invoices and all of their items in one
+transaction with two statements: a multi-row INSERT ... RETURNING for the
+invoices and an executemany INSERT for the items. On PostgreSQL, item batches
+of COPY_THRESHOLD rows or more are streamed with COPY instead. Full-text
+search documents (models.search) are written in the same transaction.
+
+Values are normalized on the way in (models.normalize): amounts become
+Decimal, the printed date is parsed into invoice_date, and each invoice is
+linked to a deduplicated vendors row (matched by GSTIN or normalized name,
+see resolve_vendors), created on first sight with one INSERT ... ON CONFLICT
+DO NOTHING per batch.
+"""
+
+import io
+import os
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from utils import timing
+from .invoice import Invoice, Item, Vendor
+from .normalize import normalize_gstin, normalize_name, parse_amount, parse_date, vendor_key
+from . import search
+
+COPY_THRESHOLD = int(os.getenv("DB_COPY_THRESHOLD", "1000"))
+
+ITEM_COLUMNS = ("invoice_id", "name", "quantity", "unit_price", "total_price")
+
+
+_MONEY = Decimal("0.01")
+_MAX_AMOUNT = Decimal("1e12")  # Numeric(14, 2) holds 12 integer digits
+
+
+def _amount(val, places: Decimal = _MONEY) -> Optional[Decimal]:
+    d = parse_amount(val)
+    if d is None or not d.is_finite() or abs(d) >= _MAX_AMOUNT:
+        return None
+    return d.quantize(places)
+
+
+def invoice_row(structured: dict, vendor_id: Optional[int] = None) -> dict:
+    return {
+        "invoice_number": structured.get("invoice_number"),
+        "vendor_name": structured.get("vendor_name"),
+        "buyer_name": structured.get("buyer_name"),
+        "date": structured.get("date"),
+        "invoice_date": parse_date(structured.get("date")),
+        "vendor_id": vendor_id,
+        "subtotal": _amount(structured.get("subtotal")),
+        "tax": _amount(structured.get("tax")),
+        "total": _amount(structured.get("total")),
+        "currency": structured.get("currency"),
+        "raw_text": structured.get("raw_text"),
+    }
+
+
+def item_rows(structured: dict, invoice_id: int) -> List[dict]:
+    return [
+        {
+            "invoice_id": invoice_id,
+            "name": it.get("name"),
+            "quantity": _amount(it.get("quantity"), Decimal("0.001")),
+            "unit_price": _amount(it.get("unit_price"), Decimal("0.0001")),
+            "total_price": _amount(it.get("total_price")),
+        }
+        for it in structured.get("items") or []
+        if isinstance(it, dict)
+    ]
+
+
+def vendor_row(name, gstin=None) -> Optional[dict]:
+    key = vendor_key(name, gstin)
+    if key is None:
+        return None
+    return {
+        "vendor_key": key,
+        "name": str(name).strip() if name else None,
+        "normalized_name": normalize_name(name),
+        "gstin": normalize_gstin(gstin),
+    }
+
+
+def resolve_vendors(db: Session, vendors: List[Optional[dict]]) -> List[Optional[int]]:
+    """
+    Map vendor_row() dicts to vendors.id, inserting unseen vendors. Returns
+    ids in input order (None where the row was None).
+
+    A vendor whose GSTIN was missed on some invoices is keyed "name:..." there
+    and "gstin:..." elsewhere, so keys alone would split it in two. Before
+    inserting, a GSTIN-keyed vendor reuses an existing row with its GSTIN or,
+    failing that, a GSTIN-less row with its normalized name (which then gets
+    the GSTIN); a name-keyed vendor reuses any row with its normalized name.
+    The same applies between vendors of one batch.
+    """
+    new: Dict[str, dict] = {}
+    for v in vendors:
+        if v is not None and v["vendor_key"] not in new:
+            new[v["vendor_key"]] = v
+    if not new:
+        return [None] * len(vendors)
+
+    ids = _match_vendors(db, new)
+    # within the batch, a name-only vendor joins a GSTIN-keyed one of the same name
+    aliases = {}
+    taxed = {}
+    for key, v in new.items():
+        if key not in ids and v["gstin"] and v["normalized_name"]:
+            taxed.setdefault(v["normalized_name"], key)
+    for key, v in new.items():
+        if key not in ids and not v["gstin"] and v["normalized_name"] in taxed:
+            aliases[key] = taxed[v["normalized_name"]]
+    missing = [v for key, v in new.items() if key not in ids and key not in aliases]
+    if missing:
+        ids.update(_insert_vendors(db, missing))
+    for key, target in aliases.items():
+        ids[key] = ids.get(target)
+    return [ids.get(v["vendor_key"]) if v is not None else None for v in vendors]
+
+
+def _match_vendors(db: Session, new: Dict[str, dict]) -> Dict[str, int]:
+    """
+    vendor_key -> id of an existing vendors row for each of `new` that has one.
+    """
+    names = {v["normalized_name"] for v in new.values() if v["normalized_name"]}
+    gstins = {v["gstin"] for v in new.values() if v["gstin"]}
+    rows = db.execute(
+        select(Vendor.id, Vendor.vendor_key, Vendor.normalized_name, Vendor.gstin)
+        .where(or_(Vendor.vendor_key.in_(list(new)), Vendor.normalized_name.in_(names), Vendor.gstin.in_(gstins)))
+        .order_by(Vendor.id)
+    ).all()
+    by_key = {r.vendor_key: r.id for r in rows}
+    by_gstin: Dict[str, int] = {}
+    by_name: Dict[str, int] = {}
+    untaxed_by_name: Dict[str, int] = {}
+    for r in rows:
+        if r.gstin:
+            by_gstin.setdefault(r.gstin, r.id)
+        if r.normalized_name:
+            by_name.setdefault(r.normalized_name, r.id)
+            if not r.gstin:
+                untaxed_by_name.setdefault(r.normalized_name, r.id)
+
+    ids = {}
+    gstin_updates = {}
+    for key, v in new.items():
+        vid = by_key.get(key)
+        if vid is None and v["gstin"]:
+            vid = by_gstin.get(v["gstin"])
+            if vid is None and v["normalized_name"] in untaxed_by_name:
+                vid = untaxed_by_name.pop(v["normalized_name"])
+                gstin_updates[vid] = v["gstin"]
+        elif vid is None:
+            vid = by_name.get(v["normalized_name"])
+        if vid is not None:
+            ids[key] = vid
+    if gstin_updates:
+        db.execute(update(Vendor), [{"id": vid, "gstin": g} for vid, g in gstin_updates.items()])
+    return ids
+
+
+def _insert_vendors(db: Session, missing: List[dict]) -> Dict[str, int]:
+    keys = [v["vendor_key"] for v in missing]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        # a concurrent save may have inserted the same key meanwhile
+        db.execute(dialect_insert(Vendor).on_conflict_do_nothing(index_elements=["vendor_key"]), missing)
+        return dict(db.execute(select(Vendor.vendor_key, Vendor.id).where(Vendor.vendor_key.in_(keys))).all())
+    result = db.execute(insert(Vendor).returning(Vendor.vendor_key, Vendor.id, sort_by_parameter_order=True), missing)
+    return dict(result.all())
+
+
+def _csv_field(value) -> str:
+    # COPY ... CSV reads an unquoted empty field as NULL and a quoted one as
+    # the empty string, so strings are always quoted (name "" stays "", as
+    # with the executemany path)
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    return str(value)
+
+
+def _copy_items(db: Session, rows: List[dict]):
+    buf = io.StringIO()
+    for r in rows:
+        buf.write(",".join(_csv_field(r[c]) for c in ITEM_COLUMNS) + "\n")
+    buf.seek(0)
+    raw = db.connection().connection  # DBAPI (psycopg2) connection of this transaction
+    with raw.cursor() as cur:
+        cur.copy_expert(f"COPY {Item.__tablename__} ({', '.join(ITEM_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def _insert_items(db: Session, rows: List[dict]):
+    if not rows:
+        return
+    if len(rows) >= COPY_THRESHOLD and db.get_bind().dialect.name == "postgresql":
+        _copy_items(db, rows)
+    else:
+        db.execute(insert(Item), rows)
+
+
+def save_invoices(db: Session, structured_list: List[dict], commit: bool = True) -> List[int]:
+    """
+    Insert invoices and their items set-wise. Returns invoice ids in input order.
+    Rolls back and re-raises on failure. With commit=False the caller owns the
+    transaction.
+    """
+    if not structured_list:
+        return []
+    with timing.stage("db_write"):
+        return _save_invoices(db, structured_list, commit)
+
+
+def _save_invoices(db: Session, structured_list: List[dict], commit: bool) -> List[int]:
+    try:
+        vendor_ids = resolve_vendors(
+            db, [vendor_row(st.get("vendor_name"), st.get("gst_number")) for st in structured_list]
+        )
+        rows = [invoice_row(st, vid) for st, vid in zip(structured_list, vendor_ids)]
+        result = db.execute(
+            insert(Invoice).returning(Invoice.id, sort_by_parameter_order=True),
+            rows,
+        )
+        ids = [r[0] for r in result]
+
+        items = []
+        for st, invoice_id in zip(structured_list, ids):
+            items.extend(item_rows(st, invoice_id))
+        _insert_items(db, items)
+        search.index_invoices(db, ids, structured_list)
+
+        if commit:
+            db.commit()
+        return ids
+    except Exception:
+        db.rollback()
+        raise
+
+
+def save_invoice(db: Session, structured: dict, commit: bool = True) -> int:
+    return save_invoices(db, [structured], commit=commit)[0]
@@ -0,0 +1,104 @@
+# backend/models/queries.py
+"""
+Read queries for invoices.
+
+list_invoices() pages with a keyset cursor on id (WHERE id > :after_id ORDER BY
+id LIMIT n) instead of OFFSET, so page 10,000 costs the same as page 1. The
+unbounded raw_text column is deferred, and items are loaded for the whole page
+with one extra SELECT ... WHERE invoice_id IN (...) when requested.
+"""
+
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, defer, selectinload
+
+from .invoice import Invoice, Item
+
+MAX_PAGE_SIZE = 500
+
+LIST_COLUMNS = (
+    "id", "invoice_number", "vendor_id", "vendor_name", "buyer_name", "date",
+    "invoice_date", "subtotal", "tax", "total", "currency",
+)
+ITEM_COLUMNS = ("id", "name", "quantity", "unit_price", "total_price")
+
+
+def list_invoices(
+    db: Session,
+    after_id: Optional[int] = None,
+    limit: int = 50,
+    descending: bool = False,
+    vendor: Optional[str] = None,
+    vendor_id: Optional[int] = None,
+    invoice_number: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    min_total: Optional[float] = None,
+    max_total: Optional[float] = None,
+    include_items: bool = False,
+) -> dict:
+    """
+    One page of invoices matching the filters. `after_id` is the cursor
+    returned as `next_after_id` by the previous page (ids continue in the
+    requested order). Date bounds apply to the parsed invoice_date; invoices
+    whose printed date could not be parsed never match a date filter.
+
+    Returns {"invoices": [...], "next_after_id": int or None}.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    stmt = select(Invoice).options(defer(Invoice.raw_text))
+    if include_items:
+        stmt = stmt.options(selectinload(Invoice.items))
+
+    if vendor is not None:
+        stmt = stmt.where(Invoice.vendor_name == vendor)
+    if vendor_id is not None:
+        stmt = stmt.where(Invoice.vendor_id == vendor_id)
+    if invoice_number is not None:
+        stmt = stmt.where(Invoice.invoice_number == invoice_number)
+    if date_from is not None:
+        stmt = stmt.where(Invoice.invoice_date >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(Invoice.invoice_date <= date_to)
+    if min_total is not None:
+        stmt = stmt.where(Invoice.total >= min_total)
+    if max_total is not None:
+        stmt = stmt.where(Invoice.total <= max_total)
+
+    if after_id is not None:
+        stmt = stmt.where(Invoice.id < after_id if descending else Invoice.id > after_id)
+    stmt = stmt.order_by(Invoice.id.desc() if descending else Invoice.id).limit(limit + 1)
+
+    rows = db.execute(stmt).scalars().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "invoices": [invoice_dict(inv, include_items) for inv in rows],
+        "next_after_id": rows[-1].id if has_more else None,
+    }
+
+
+def get_invoice(db: Session, invoice_id: int, include_raw_text: bool = False) -> Optional[dict]:
+    opts = [selectinload(Invoice.items)]
+    if not include_raw_text:
+        opts.append(defer(Invoice.raw_text))
+    inv = db.execute(select(Invoice).where(Invoice.id == invoice_id).options(*opts)).scalar_one_or_none()
+    if inv is None:
+        return None
+    out = invoice_dict(inv, include_items=True)
+    if include_raw_text:
+        out["raw_text"] = inv.raw_text
+    return out
+
+
+def invoice_dict(inv: Invoice, include_items: bool = False) -> dict:
+    out = {c: getattr(inv, c) for c in LIST_COLUMNS}
+    if include_items:
+        out["items"] = [item_dict(it) for it in inv.items]
+    return out
+
+
+def item_dict(it: Item) -> dict:
+    return {c: getattr(it, c) for c in ITEM_COLUMNS}
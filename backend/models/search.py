@@ -0,0 +1,271 @@
+# backend/models/search.py
+"""
+Full-text search over invoices.
+
+Each invoice gets one search document with three weighted parts:
+  head   invoice number, vendor, buyer, GSTIN   (highest weight)
+  items  line item names
+  body   raw_text (OCR / PDF text), capped at SEARCH_MAX_BODY_CHARS
+
+PostgreSQL: table invoice_search(invoice_id, document tsvector) with a GIN
+index, queried with websearch_to_tsquery and ranked by ts_rank_cd.
+SQLite (local dev): FTS5 table invoice_fts with rowid = invoice id, ranked
+by bm25.
+
+Documents are written by models.persistence.save_invoices() in the same
+transaction as the invoice. For existing data run:
+  python -m models.search rebuild
+
+Config (env):
+  SEARCH_INDEX_ENABLED    1/0 (default 1)
+  SEARCH_TS_CONFIG        Postgres text search config (default "simple")
+  SEARCH_MAX_BODY_CHARS   raw_text characters indexed per invoice (default 200000)
+"""
+
+import logging
+import os
+import re
+from typing import List, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session, defer, selectinload
+
+from utils.env import env_flag
+
+from .invoice import Invoice, Item
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_ENABLED = env_flag("SEARCH_INDEX_ENABLED")
+SEARCH_TS_CONFIG = os.getenv("SEARCH_TS_CONFIG", "simple")
+SEARCH_MAX_BODY_CHARS = int(os.getenv("SEARCH_MAX_BODY_CHARS", "200000"))
+
+REBUILD_BATCH = 1000
+
+_PG_DDL = (
+    """CREATE TABLE IF NOT EXISTS invoice_search (
+        invoice_id integer PRIMARY KEY REFERENCES invoices(id) ON DELETE CASCADE,
+        document tsvector NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_invoice_search_document ON invoice_search USING gin (document)",
+)
+_PG_UPSERT = """
+    INSERT INTO invoice_search (invoice_id, document) VALUES (
+        :invoice_id,
+        setweight(to_tsvector(CAST(:cfg AS regconfig), :head), 'A')
+        || setweight(to_tsvector(CAST(:cfg AS regconfig), :items), 'B')
+        || setweight(to_tsvector(CAST(:cfg AS regconfig), :body), 'D')
+    )
+    ON CONFLICT (invoice_id) DO UPDATE SET document = EXCLUDED.document
+"""
+
+_SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS invoice_fts USING fts5(head, items, body, tokenize='unicode61')",
+)
+_SQLITE_UPSERT = "INSERT OR REPLACE INTO invoice_fts (rowid, head, items, body) VALUES (:invoice_id, :head, :items, :body)"
+
+_ready = set()
+_skipped = set()
+
+
+class SearchUnavailableError(RuntimeError):
+    pass
+
+
+def _dialect(bind) -> str:
+    name = bind.dialect.name
+    if name not in ("postgresql", "sqlite"):
+        raise SearchUnavailableError(f"Full-text search is not supported on {name}.")
+    return name
+
+
+def _unsupported(bind) -> bool:
+    """
+    True (logged once per dialect) when this database has no search backend;
+    writes then skip indexing instead of failing the save.
+    """
+    name = bind.dialect.name
+    if name in ("postgresql", "sqlite"):
+        return False
+    if name not in _skipped:
+        _skipped.add(name)
+        logger.warning("Full-text search is not supported on %s; invoices will not be indexed.", name)
+    return True
+
+
+def ensure_search_index(bind):
+    """
+    Create the search table/index for this database if missing (idempotent).
+    No-op on databases without a search backend.
+    """
+    key = str(bind.engine.url)
+    if key in _ready or _unsupported(bind):
+        return
+    ddl = _PG_DDL if _dialect(bind) == "postgresql" else _SQLITE_DDL
+    if hasattr(bind, "exec_driver_sql"):  # a Connection inside the caller's transaction
+        for stmt in ddl:
+            bind.exec_driver_sql(stmt)
+    else:
+        with bind.begin() as conn:
+            for stmt in ddl:
+                conn.exec_driver_sql(stmt)
+    _ready.add(key)
+
+
+def search_document(structured: dict) -> dict:
+    head = " ".join(
+        str(structured.get(f))
+        for f in ("invoice_number", "vendor_name", "buyer_name", "gst_number")
+        if structured.get(f)
+    )
+    items = "\n".join(
+        str(it.get("name"))
+        for it in structured.get("items") or []
+        if isinstance(it, dict) and it.get("name")
+    )
+    body = (structured.get("raw_text") or "")[:SEARCH_MAX_BODY_CHARS]
+    return {"head": head, "items": items, "body": body}
+
+
+def index_invoices(db: Session, ids: List[int], structured_list: List[dict]):
+    """
+    Write search documents for freshly saved invoices, inside the caller's transaction.
+    """
+    if not SEARCH_INDEX_ENABLED or not ids:
+        return
+    conn = db.connection()
+    if _unsupported(conn):
+        return
+    ensure_search_index(conn)
+    rows = [dict(search_document(st), invoice_id=i) for i, st in zip(ids, structured_list)]
+    if conn.dialect.name == "postgresql":
+        for r in rows:
+            r["cfg"] = SEARCH_TS_CONFIG
+        db.execute(text(_PG_UPSERT), rows)
+    else:
+        db.execute(text(_SQLITE_UPSERT), rows)
+
+
+def _fts5_query(q: str) -> str:
+    # every word must match; words are quoted so user input is never FTS5 syntax
+    words = re.findall(r"\w+", q, flags=re.UNICODE)
+    return " ".join('"' + w.replace('"', '""') + '"' for w in words)
+
+
+def search_invoices(
+    db: Session,
+    q: str,
+    limit: int = 20,
+    offset: int = 0,
+    vendor: Optional[str] = None,
+    include_items: bool = False,
+) -> dict:
+    """
+    Ranked search. Returns {"results": [{"rank", "invoice": {...}}], "offset",
+    "limit"}; `rank` is higher-is-better on both backends.
+    """
+    from .queries import invoice_dict
+
+    conn = db.connection()
+    _dialect(conn)
+    ensure_search_index(conn)
+    vendor_sql = " AND i.vendor_name = :vendor" if vendor is not None else ""
+    params = {"q": q, "limit": limit, "offset": offset, "vendor": vendor}
+    if conn.dialect.name == "postgresql":
+        sql = f"""
+            SELECT s.invoice_id, ts_rank_cd(s.document, query) AS rank
+            FROM invoice_search s
+            JOIN invoices i ON i.id = s.invoice_id,
+                 websearch_to_tsquery(CAST(:cfg AS regconfig), :q) query
+            WHERE s.document @@ query{vendor_sql}
+            ORDER BY rank DESC, s.invoice_id DESC
+            LIMIT :limit OFFSET :offset
+        """
+        params["cfg"] = SEARCH_TS_CONFIG
+    else:
+        params["q"] = _fts5_query(q)
+        if not params["q"]:
+            return {"results": [], "offset": offset, "limit": limit}
+        sql = f"""
+            SELECT f.rowid AS invoice_id, -bm25(invoice_fts, 10.0, 5.0, 1.0) AS rank
+            FROM invoice_fts f
+            JOIN invoices i ON i.id = f.rowid
+            WHERE invoice_fts MATCH :q{vendor_sql}
+            ORDER BY rank DESC, f.rowid DESC
+            LIMIT :limit OFFSET :offset
+        """
+    hits = db.execute(text(sql), params).all()
+    if not hits:
+        return {"results": [], "offset": offset, "limit": limit}
+
+    stmt = select(Invoice).where(Invoice.id.in_([h[0] for h in hits])).options(defer(Invoice.raw_text))
+    if include_items:
+        stmt = stmt.options(selectinload(Invoice.items))
+    by_id = {inv.id: inv for inv in db.execute(stmt).scalars()}
+    results = [
+        {"rank": float(rank), "invoice": invoice_dict(by_id[iid], include_items)}
+        for iid, rank in hits
+        if iid in by_id
+    ]
+    return {"results": results, "offset": offset, "limit": limit}
+
+
+def rebuild(db: Session, batch_size: int = REBUILD_BATCH) -> int:
+    """
+    Re-index every invoice, batch by batch (keyset on id). Returns the count.
+    """
+    conn = db.connection()
+    _dialect(conn)
+    ensure_search_index(conn)
+    if conn.dialect.name == "postgresql":
+        db.execute(text("TRUNCATE invoice_search"))
+    else:
+        db.execute(text("DELETE FROM invoice_fts"))
+    db.commit()
+
+    done = 0
+    last_id = 0
+    while True:
+        invoices = db.execute(
+            select(Invoice.id, Invoice.invoice_number, Invoice.vendor_name, Invoice.buyer_name, Invoice.raw_text)
+            .where(Invoice.id > last_id)
+            .order_by(Invoice.id)
+            .limit(batch_size)
+        ).all()
+        if not invoices:
+            return done
+        ids = [r.id for r in invoices]
+        names = {}
+        for invoice_id, name in db.execute(
+            select(Item.invoice_id, Item.name).where(Item.invoice_id.in_(ids)).order_by(Item.id)
+        ):
+            names.setdefault(invoice_id, []).append({"name": name})
+        structured = [
+            {
+                "invoice_number": r.invoice_number,
+                "vendor_name": r.vendor_name,
+                "buyer_name": r.buyer_name,
+                "raw_text": r.raw_text,
+                "items": names.get(r.id, []),
+            }
+            for r in invoices
+        ]
+        index_invoices(db, ids, structured)
+        db.commit()
+        done += len(ids)
+        last_id = ids[-1]
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print("Usage: python -m models.search rebuild")
+        raise SystemExit(1)
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(f"Indexed {rebuild(db)} invoices.")
+    finally:
+        db.close()
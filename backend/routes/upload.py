@@ -3,26 +3,48 @@
 Upload and extraction routes.
 - POST /upload: accepts a file (pdf, image) or text and returns extracted text.
 - POST /extract: accepts file or raw text, extracts structured JSON and saves to DB.
+- POST /jobs: same input as /extract, but queued; returns a job id immediately.
+- GET  /jobs/{job_id}: job status and, once done, the /extract-style result.
+- POST /extract-batch: multi-invoice PDF; sections are extracted concurrently and
+  streamed back as NDJSON, then saved as one Invoice per section.
+- GET  /invoices: keyset-paginated, filterable listing (raw_text not loaded).
+- GET  /invoices/search: ranked full-text search over invoice text and items.
+- GET  /invoices/{invoice_id}: one invoice with its items.
 """
 
 import os
-import shutil
-import uuid
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
-from fastapi.responses import JSONResponse
+import json
+import time
+import asyncio
+from contextlib import contextmanager
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from typing import Optional
+from datetime import date
 
-from database import SessionLocal
-from models.invoice import Invoice, Item
-from ai_extractor import extract_invoice_auto
+from database import SessionFactory
+from models.persistence import save_invoice, save_invoices, invoice_row, item_rows
+from models import queries, search
+from ai_extractor import (
+    extract_invoice_auto_async, extract_invoice_stream, extract_section_async, extraction_key, _check_mode,
+)
+from extraction_cache import extraction_cache
+from jobs import job_queue, QueueFullError
+from splitter import split_pdf_into_sections
+from utils.file_utils import stream_upload_to_disk, cleanup_tmp_file, UploadTooLargeError
+from utils.ocr_cache import ocr_cache
+from utils import metrics, timing
+from utils.env import env_flag
 
 # Router for invoice endpoints
 router = APIRouter(prefix="/invoices", tags=["invoices"])
 
 # Dependency to get DB session
 def get_db():
-    db = SessionLocal()
+    db = SessionFactory()
     try:
         yield db
     finally:
@@ -32,6 +54,13 @@ def get_db():
 UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "/tmp/invoice_uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Sections of one batch upload extracted at the same time (the LLM client
+# still caps total in-flight model calls across all requests).
+BATCH_SECTION_CONCURRENCY = int(os.environ.get("BATCH_SECTION_CONCURRENCY", "4"))
+
+# Attach a per-stage timing breakdown ("timings") to /extract responses.
+DEBUG_TIMINGS = env_flag("DEBUG_TIMINGS", "0")
+
 
 @router.post("/upload")
 async def upload_file(file: Optional[UploadFile] = File(None), text: Optional[str] = Form(None)):
@@ -46,133 +75,436 @@ async def upload_file(file: Optional[UploadFile] = File(None), text: Optional[st
         return {"text": text}
 
     # Save file
-    filename = f"{uuid.uuid4().hex}_{file.filename}"
-    dest_path = os.path.join(UPLOAD_DIR, filename)
-    with open(dest_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    saved = await _ingest_upload(file)
 
-    lower = file.filename.lower()
     try:
-        if lower.endswith(".pdf"):
-            from utils.pdf_reader import pdf_to_text
-            extracted = pdf_to_text(dest_path)
-        elif lower.endswith((".png", ".jpg", ".jpeg", ".tiff", ".bmp")):
-            from utils.ocr_reader import image_to_text
-            extracted = image_to_text(dest_path)
-        else:
-            with open(dest_path, "r", encoding="utf-8", errors="ignore") as f:
-                extracted = f.read()
+        extracted = await run_in_threadpool(_extract_raw_text, saved, file.filename.lower())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to extract text: {e}")
+    finally:
+        cleanup_tmp_file(saved["path"])
 
     return {"text": extracted}
 
 
+async def _ingest_upload(file: UploadFile) -> dict:
+    """
+    Stream the upload to UPLOAD_DIR, hashing it on the way (see stream_upload_to_disk).
+    """
+    try:
+        return await stream_upload_to_disk(file, UPLOAD_DIR)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+def _extract_raw_text(saved: dict, lower: str) -> str:
+    dest_path = saved["path"]
+    if lower.endswith(".pdf"):
+        from utils.pdf_reader import pdf_to_text
+        return pdf_to_text(saved["data"] if saved["data"] is not None else dest_path)
+    if lower.endswith((".png", ".jpg", ".jpeg", ".tiff", ".bmp")):
+        from utils.ocr_reader import image_to_text
+        return image_to_text(dest_path)
+    with open(dest_path, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
 @router.post("/extract")
 async def extract_and_save(
     file: Optional[UploadFile] = File(None),
     text: Optional[str] = Form(None),
+    mode: Optional[str] = Form("auto"),
     db: Session = Depends(get_db)
 ):
     """
     Accepts either text or a file (PDF/image). Runs extraction and saves Invoice + Items to DB.
+    Extraction is fully async (see extract_invoice_auto_async); DB work runs in the threadpool.
+    `mode`: auto (default), vision (PDF pages to the VLM), ocr (images via Tesseract) or
+    layout (PDF text with table rows kept as delimited lines, headers/footers and boilerplate dropped).
+    With DEBUG_TIMINGS=1 the response carries a "timings" breakdown per stage, including
+    prompt/completion token counts.
+    """
+    start = time.perf_counter()
+    with timing.collect() as timings, _observe_extraction("extract", start):
+        response = await _extract_and_save(file, text, mode, db)
+    if DEBUG_TIMINGS:
+        response["timings"] = timings.breakdown(time.perf_counter() - start)
+    return JSONResponse(content=response)
+
+
+@contextmanager
+def _observe_extraction(route: str, start: float = None):
+    """
+    Count an extraction request and its duration by route and outcome.
     """
+    start = start or time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        metrics.EXTRACTIONS.inc(route=route, outcome=outcome)
+        metrics.EXTRACT_SECONDS.observe(time.perf_counter() - start, route=route)
+
+
+async def _extract_and_save(file: Optional[UploadFile], text: Optional[str], mode: Optional[str], db: Session) -> dict:
     if not file and not text:
         raise HTTPException(status_code=400, detail="Provide either text or a file.")
+    mode = _extraction_mode(mode)
 
     saved_temp_path = None
+    try:
+        # If raw text provided, call extractor in text mode
+        if text:
+            try:
+                structured = await extract_invoice_auto_async(text, is_text=True)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"AI extraction failed: {e}")
+        else:
+            # Stream uploaded file to disk (hash computed on the way)
+            saved = await _ingest_upload(file)
+            saved_temp_path = saved["path"]
 
-    # If raw text provided, call extractor in text mode
-    if text:
+            # Call unified extractor which will handle pdf/image/text file
+            try:
+                structured = await extract_invoice_auto_async(
+                    saved["path"], is_text=False, content_hash=saved["sha256"], pdf_bytes=saved["data"],
+                    mode=mode,
+                )
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"AI extraction failed: {e}")
+
+        # Validate structured is a dict
+        if not isinstance(structured, dict):
+            raise HTTPException(status_code=500, detail="AI returned invalid format (expected JSON object).")
+
+        # Persist to database
         try:
-            structured = extract_invoice_auto(text, is_text=True)
+            invoice_id = await run_in_threadpool(save_invoice, db, structured)
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"AI extraction failed: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to save invoice to DB: {e}")
+    finally:
+        # the temp upload is removed whether or not extraction succeeded
+        if saved_temp_path:
+            _remove_upload({"source": saved_temp_path, "is_text": False})
+
+    return _invoice_response(invoice_id, structured)
+
+
+@router.post("/extract-stream")
+async def extract_stream(
+    file: Optional[UploadFile] = File(None),
+    text: Optional[str] = Form(None),
+    mode: Optional[str] = Form("auto"),
+):
+    """
+    Same input as /extract, but results are pushed as Server-Sent Events while
+    the model is still generating:
+      event: field   {"name": ..., "value": ...}     header field as soon as it is complete
+      event: item    {"index": i, "item": {...}}     each completed line item
+      event: result  {"structured": {...}}           final merged result
+      event: saved   {"invoice_id": n, "invoice": {...}, "items_saved": k}
+      event: error   {"error": "..."}
+    The model's generation is stopped as soon as its JSON object closes.
+    """
+    if not file and not text:
+        raise HTTPException(status_code=400, detail="Provide either text or a file.")
+    mode = _extraction_mode(mode)
+
+    if text:
+        payload = {"source": text, "is_text": True, "content_hash": None, "pdf_bytes": None}
     else:
-        # Save uploaded file to disk
-        filename = f"{uuid.uuid4().hex}_{file.filename}"
-        dest_path = os.path.join(UPLOAD_DIR, filename)
-        saved_temp_path = dest_path
-        with open(dest_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Call unified extractor which will handle pdf/image/text file
+        saved = await _ingest_upload(file)
+        payload = {"source": saved["path"], "is_text": False, "content_hash": saved["sha256"], "pdf_bytes": saved["data"]}
+
+    return StreamingResponse(
+        _stream_extraction(payload, mode),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _stream_extraction(payload: dict, mode: str):
+    try:
+        structured = None
         try:
-            structured = extract_invoice_auto(dest_path, is_text=False)
+            async for ev in extract_invoice_stream(
+                payload["source"], is_text=payload["is_text"], content_hash=payload["content_hash"],
+                pdf_bytes=payload["pdf_bytes"], mode=mode,
+            ):
+                name = ev.pop("event")
+                if name == "result":
+                    structured = ev["structured"]
+                yield _sse(name, ev)
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"AI extraction failed: {e}")
+            yield _sse("error", {"error": f"AI extraction failed: {e}"})
+            return
+
+        if not isinstance(structured, dict):
+            yield _sse("error", {"error": "AI returned invalid format (expected JSON object)."})
+            return
+        try:
+            ids = await run_in_threadpool(_save_in_new_session, [structured])
+        except Exception as e:
+            yield _sse("error", {"error": f"Failed to save invoice to DB: {e}"})
+            return
+        response = _invoice_response(ids[0], structured)
+        response.pop("structured")
+        yield _sse("saved", response)
+    finally:
+        _remove_upload(payload)
+
+
+def _sse(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def _extraction_mode(mode: Optional[str]) -> str:
+    try:
+        return _check_mode(mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _invoice_response(invoice_id: int, structured: dict) -> dict:
+    row = invoice_row(structured)
+    row.pop("raw_text")
+    row.pop("vendor_id")
+    # Decimal amounts / parsed dates -> JSON numbers and ISO strings
+    return jsonable_encoder({
+        "invoice_id": invoice_id,
+        "invoice": row,
+        "items_saved": len(item_rows(structured, invoice_id)),  # the rows actually inserted
+        "structured": structured
+    })
+
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_extraction_job(
+    file: Optional[UploadFile] = File(None),
+    text: Optional[str] = Form(None),
+    mode: Optional[str] = Form("auto"),
+):
+    """
+    Queue an extraction (same input as /extract) and return a job id right away.
+    Submitting a document that already has a queued, running or finished job
+    returns that job instead of starting another one.
+    """
+    if not file and not text:
+        raise HTTPException(status_code=400, detail="Provide either text or a file.")
+    mode = _extraction_mode(mode)
 
-    # Validate structured is a dict
-    if not isinstance(structured, dict):
-        raise HTTPException(status_code=500, detail="AI returned invalid format (expected JSON object).")
+    if text:
+        payload = {"source": text, "is_text": True, "content_hash": None, "mode": mode}
+        dedup_key = await run_in_threadpool(extraction_key, text, True, None, mode)
+    else:
+        saved = await _ingest_upload(file)
+        payload = {"source": saved["path"], "is_text": False, "content_hash": saved["sha256"], "mode": mode}
+        dedup_key = extraction_key(saved["path"], False, saved["sha256"], mode)
+
+    try:
+        job, deduplicated = job_queue.submit(payload, dedup_key=dedup_key)
+    except QueueFullError as e:
+        _remove_upload(payload)
+        raise HTTPException(status_code=503, detail=str(e))
+    if deduplicated:
+        _remove_upload(payload)
 
-    # Persist to database
+    return {"job_id": job["id"], "status": job["status"], "deduplicated": deduplicated}
+
+
+@router.get("/jobs/{job_id}")
+def get_extraction_job(job_id: str):
+    """
+    Poll a queued extraction. `result` is set once status is "done".
+    """
+    job = job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_queue.public_view(job)
+
+
+async def run_extraction_job(job: dict) -> dict:
+    """
+    Job handler used by the queue workers (registered in main.py).
+    """
+    payload = job["payload"]
     try:
-        invoice = Invoice(
-            invoice_number=structured.get("invoice_number"),
-            vendor_name=structured.get("vendor_name"),
-            buyer_name=structured.get("buyer_name"),
-            date=structured.get("date"),
-            subtotal=_safe_cast_float(structured.get("subtotal")),
-            tax=_safe_cast_float(structured.get("tax")),
-            total=_safe_cast_float(structured.get("total")),
-            currency=structured.get("currency"),
-            raw_text=structured.get("raw_text")
-        )
-        db.add(invoice)
-        db.flush()  # to get invoice.id
-
-        items = structured.get("items") or []
-        for it in items:
-            item = Item(
-                invoice_id=invoice.id,
-                name=it.get("name"),
-                quantity=_safe_cast_float(it.get("quantity")),
-                unit_price=_safe_cast_float(it.get("unit_price")),
-                total_price=_safe_cast_float(it.get("total_price"))
+        with _observe_extraction("job"):
+            structured = await extract_invoice_auto_async(
+                payload["source"], is_text=payload["is_text"], content_hash=payload["content_hash"],
+                mode=payload.get("mode", "auto"),
             )
-            db.add(item)
+            if not isinstance(structured, dict):
+                raise RuntimeError("AI returned invalid format (expected JSON object).")
+            invoice_id = (await run_in_threadpool(_save_in_new_session, [structured]))[0]
+        return _invoice_response(invoice_id, structured)
+    finally:
+        _remove_upload(payload)
 
-        db.commit()
-        db.refresh(invoice)
 
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to save invoice to DB: {e}")
+def _save_in_new_session(structured_list: list) -> list:
+    """
+    Save extractions in one transaction on a fresh session; returns invoice ids.
+    """
+    db = SessionFactory()
+    try:
+        return save_invoices(db, structured_list)
+    finally:
+        db.close()
 
-    # Optionally cleanup temp file
-    if saved_temp_path and os.path.exists(saved_temp_path):
+
+def _remove_upload(payload: dict):
+    if not payload["is_text"] and os.path.exists(payload["source"]):
         try:
-            os.remove(saved_temp_path)
+            os.remove(payload["source"])
         except Exception:
             pass
 
-    return JSONResponse(content={
-        "invoice_id": invoice.id,
-        "invoice": {
-            "invoice_number": invoice.invoice_number,
-            "vendor_name": invoice.vendor_name,
-            "buyer_name": invoice.buyer_name,
-            "date": invoice.date,
-            "subtotal": invoice.subtotal,
-            "tax": invoice.tax,
-            "total": invoice.total,
-            "currency": invoice.currency,
-        },
-        "items_saved": len(items),
-        "structured": structured
-    })
 
+@router.post("/extract-batch")
+async def extract_batch(file: UploadFile = File(...), mode: Optional[str] = Form("auto")):
+    """
+    Split a multi-invoice PDF into sections, extract them concurrently and
+    stream one NDJSON line per section as it finishes:
+      {"event": "sections", "count": n}
+      {"event": "section", "section_id": i, "status": "ok", "structured": {...}}
+      {"event": "section", "section_id": i, "status": "error", "error": "..."}
+      {"event": "saved", "invoice_ids": {"<section_id>": invoice_id, ...}}
+      {"event": "done", "ok": k, "failed": m}
+    Successful sections are saved in a single transaction once all have finished.
 
-def _safe_cast_float(val):
-    if val is None:
-        return None
+    `mode` is validated as for /extract; vision sends each section's pages to
+    the VLM (see ai_extractor.extract_section_async).
+    """
+    mode = _extraction_mode(mode)
+    if not file.filename.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="extract-batch expects a PDF.")
+
+    saved = await _ingest_upload(file)
+    dest_path = saved["path"]
+    src = saved["data"] if saved["data"] is not None else dest_path
     try:
-        return float(val)
-    except Exception:
-        s = str(val)
-        s = re.sub(r"[^\d\.\-]", "", s)
-        try:
-            return float(s) if s not in ("", ".", "-") else None
-        except Exception:
-            return None
+        sections = await run_in_threadpool(split_pdf_into_sections, src, True)
+    except Exception as e:
+        _remove_upload({"source": dest_path, "is_text": False})
+        raise HTTPException(status_code=500, detail=f"Failed to split PDF: {e}")
+
+    return StreamingResponse(_stream_batch(dest_path, sections, mode, src), media_type="application/x-ndjson")
+
+
+async def _stream_batch(dest_path: str, sections: list, mode: str = "auto", pdf_src=None):
+    sem = asyncio.Semaphore(BATCH_SECTION_CONCURRENCY)
+
+    async def _one(sid: int, text: str, pages: list):
+        async with sem:
+            try:
+                structured = await extract_section_async(text, mode=mode, pdf_src=pdf_src, pages=pages)
+                if not isinstance(structured, dict):
+                    raise RuntimeError("AI returned invalid format (expected JSON object).")
+                return sid, structured, None
+            except Exception as e:
+                return sid, None, str(e)
+
+    tasks = [asyncio.create_task(_one(sid, text, pages)) for sid, text, pages in sections]
+    ok = []
+    failed = 0
+    try:
+        yield _ndjson({"event": "sections", "count": len(sections)})
+        for fut in asyncio.as_completed(tasks):
+            sid, structured, error = await fut
+            if error is None:
+                ok.append((sid, structured))
+                yield _ndjson({"event": "section", "section_id": sid, "status": "ok", "structured": structured})
+            else:
+                failed += 1
+                yield _ndjson({"event": "section", "section_id": sid, "status": "error", "error": error})
+
+        ok.sort(key=lambda x: x[0])
+        if ok:
+            try:
+                ids = await run_in_threadpool(_save_in_new_session, [st for _, st in ok])
+                yield _ndjson({"event": "saved", "invoice_ids": {str(sid): iid for (sid, _), iid in zip(ok, ids)}})
+            except Exception as e:
+                yield _ndjson({"event": "error", "error": f"Failed to save invoices to DB: {e}"})
+        yield _ndjson({"event": "done", "ok": len(ok), "failed": failed})
+    finally:
+        for t in tasks:
+            t.cancel()
+        _remove_upload({"source": dest_path, "is_text": False})
+
+
+def _ndjson(obj: dict) -> bytes:
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+@router.get("")
+def list_invoices(
+    after_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=queries.MAX_PAGE_SIZE),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    vendor: Optional[str] = None,
+    vendor_id: Optional[int] = None,
+    invoice_number: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    min_total: Optional[float] = None,
+    max_total: Optional[float] = None,
+    include_items: bool = False,
+    db: Session = Depends(get_db),
+):
+    """
+    List invoices page by page. Pass the returned `next_after_id` as `after_id`
+    to get the next page (null when there are no more). Items are included
+    only with include_items=true; raw_text is never part of the listing.
+    date_from/date_to (YYYY-MM-DD) filter on the parsed invoice date.
+    """
+    return queries.list_invoices(
+        db,
+        after_id=after_id,
+        limit=limit,
+        descending=order == "desc",
+        vendor=vendor,
+        vendor_id=vendor_id,
+        invoice_number=invoice_number,
+        date_from=date_from,
+        date_to=date_to,
+        min_total=min_total,
+        max_total=max_total,
+        include_items=include_items,
+    )
+
+
+@router.get("/search")
+def search_invoices(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    vendor: Optional[str] = None,
+    include_items: bool = False,
+    db: Session = Depends(get_db),
+):
+    """
+    Full-text search over invoice number, parties, item names and raw text,
+    best match first (e.g. q="hex bolt" vendor="Acme Ltd").
+    """
+    try:
+        return search.search_invoices(db, q, limit=limit, offset=offset, vendor=vendor, include_items=include_items)
+    except search.SearchUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+
+@router.get("/{invoice_id:int}")
+def get_invoice(invoice_id: int, include_raw_text: bool = False, db: Session = Depends(get_db)):
+    invoice = queries.get_invoice(db, invoice_id, include_raw_text=include_raw_text)
+    if invoice is None:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    return invoice
+
+
+@router.get("/cache/stats")
+def cache_stats():
+    """
+    Hit/miss counters and entry counts for the extraction and OCR caches.
+    """
+    return {"extraction": extraction_cache.stats(), "ocr": ocr_cache.stats()}
@@ -0,0 +1,398 @@
+# backend/rule_extractor.py
+"""
+Deterministic pre-extractor that runs before the LLM.
+
+Regexes anchored on the invoice labels already used by the splitter
+(splitter.BOUNDARY_KEYWORDS: "Invoice No", "GSTIN", "Sold By", "Bill To", ...)
+plus per-vendor templates learned from saved Invoice rows pull out header
+fields in microseconds, each with a confidence score. ai_extractor then
+asks the LLM (see llm_fields):
+  - while a RULE_REQUIRED_FIELDS field is missing: for every missing field;
+  - once all of them are confident: for the line items only, which are never
+    rule-extracted (a much shorter answer), or, with RULE_LLM_ITEMS=0 for
+    deployments that only need header fields, not at all.
+The final result records where each field came from in "field_sources".
+Adding "items" to RULE_REQUIRED_FIELDS always asks for every missing field.
+
+A vendor template is picked by the vendor's name in the seller part of the
+invoice (its header before the buyer block, or a "Sold By" line), never by a
+name that only appears elsewhere, e.g. as the buyer.
+
+Learn vendor templates from the database with:
+    python rule_extractor.py learn
+
+Config (env):
+  RULE_EXTRACTOR_ENABLED      1/0 (default 1)
+  RULE_CONFIDENCE_THRESHOLD   minimum confidence to trust a rule value (default 0.85)
+  RULE_REQUIRED_FIELDS        comma-separated (default invoice_number,date,vendor_name,total)
+  RULE_LLM_ITEMS              1/0: ask the LLM for line items once required fields are found (default 1)
+  RULE_TEMPLATES_PATH         learned vendor templates (JSON)
+  RULE_TEMPLATE_MIN_INVOICES  saved invoices needed before a vendor gets a template (default 3)
+"""
+
+import json
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from splitter import BOUNDARY_KEYWORDS
+from utils.env import env_flag
+
+TMP_DIR = os.getenv("TMP_DIR", "/tmp/invoice_extractor")
+
+RULE_EXTRACTOR_ENABLED = env_flag("RULE_EXTRACTOR_ENABLED")
+RULE_CONFIDENCE_THRESHOLD = float(os.getenv("RULE_CONFIDENCE_THRESHOLD", "0.85"))
+RULE_REQUIRED_FIELDS = [
+    f.strip() for f in os.getenv("RULE_REQUIRED_FIELDS", "invoice_number,date,vendor_name,total").split(",") if f.strip()
+]
+RULE_LLM_ITEMS = env_flag("RULE_LLM_ITEMS")
+RULE_TEMPLATES_PATH = os.getenv("RULE_TEMPLATES_PATH", os.path.join(TMP_DIR, "vendor_templates.json"))
+RULE_TEMPLATE_MIN_INVOICES = int(os.getenv("RULE_TEMPLATE_MIN_INVOICES", "3"))
+
+# Schema fragments, used to ask the LLM for just the missing fields.
+FIELD_SCHEMA = {
+    "invoice_number": "string or null",
+    "date": "string or null",
+    "vendor_name": "string or null",
+    "buyer_name": "string or null",
+    "gst_number": "string or null",
+    "currency": "string or null",
+    "subtotal": "number or null",
+    "tax": "number or null",
+    "total": "number or null",
+    "items": '[{"name": string or null, "quantity": number or null, '
+             '"unit_price": number or null, "total_price": number or null}]',
+}
+ALL_FIELDS = list(FIELD_SCHEMA)
+
+# ----------------------
+# Patterns
+# ----------------------
+# Label keywords shared with the splitter's boundary detection.
+INVOICE_NO_LABELS = [k for k in BOUNDARY_KEYWORDS if re.search(r"invoice", k, re.I) and re.search(r"no|number", k, re.I)]
+GSTIN_LABEL = next(k for k in BOUNDARY_KEYWORDS if "GSTIN" in k)
+VENDOR_LABELS = [k for k in BOUNDARY_KEYWORDS if re.search(r"sold\s*by", k, re.I)]
+BUYER_LABELS = [k for k in BOUNDARY_KEYWORDS if re.search(r"bill\s*to", k, re.I)]
+
+SEP = r"\s*[:#.\-]*\s*"
+INVOICE_NO_VALUE = r"((?=[A-Z/\-_.]*\d)[A-Z0-9][A-Z0-9/\-_.]{2,40})"  # must contain a digit
+GSTIN_VALUE = r"\b(\d{2}[A-Z]{5}\d{4}[A-Z][1-9A-Z]Z[0-9A-Z])\b"
+MONTHS = r"(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)[a-z]*"
+DATE_VALUE = (
+    r"(\d{4}-\d{2}-\d{2}"
+    r"|\d{1,2}[/\-.]\d{1,2}[/\-.]\d{2,4}"
+    rf"|\d{{1,2}}[\s\-]{MONTHS}[\s\-,]+\d{{2,4}}"
+    rf"|{MONTHS}\s+\d{{1,2}},?\s+\d{{4}})"
+)
+AMOUNT_VALUE = r"(?:Rs\.?|INR|₹|\$|USD|EUR|€)?\s*(-?\d[\d,]*(?:\.\d{1,2})?)"
+
+RE_INVOICE_NO = re.compile(rf"(?:{'|'.join(INVOICE_NO_LABELS)}){SEP}{INVOICE_NO_VALUE}", re.I)
+RE_GSTIN_LABELLED = re.compile(rf"{GSTIN_LABEL}(?:\s*(?:No|Number))?{SEP}{GSTIN_VALUE}", re.I)
+RE_GSTIN = re.compile(GSTIN_VALUE)
+RE_DATE = re.compile(rf"\b(?:Invoice\s+Date|Date\s+of\s+Invoice|Inv\.?\s*Date|Bill\s+Date){SEP}{DATE_VALUE}", re.I)
+# a bare "Date" label; the word before it tells other dates ("Due Date") apart
+RE_DATE_GENERIC = re.compile(rf"(?:([A-Za-z.\-]+)[ \t]+)?\bDate{SEP}{DATE_VALUE}", re.I)
+OTHER_DATE_QUALIFIERS = {
+    "due", "order", "challan", "delivery", "dispatch", "despatch", "ship", "shipping", "shipment",
+    "supply", "po", "p.o.", "payment", "expiry", "exp", "print", "printed", "booking", "receipt",
+    "start", "end", "valid", "mfg", "manufacturing", "reference", "ref", "lr", "bill", "invoice", "inv.", "inv",
+}
+RE_GRAND_TOTAL = re.compile(rf"\b(?:Grand\s+Total|Total\s+Amount(?:\s+Payable)?|Invoice\s+Total|Amount\s+Payable|Net\s+Payable){SEP}{AMOUNT_VALUE}", re.I)
+RE_TOTAL = re.compile(rf"(?<!Sub )(?<!Sub-)\bTotal{SEP}{AMOUNT_VALUE}", re.I)
+RE_SUBTOTAL = re.compile(rf"\bSub[\s\-]?Total{SEP}{AMOUNT_VALUE}", re.I)
+RE_TAX = re.compile(rf"\b(?:Total\s+Tax|Tax\s+Amount|Total\s+GST){SEP}{AMOUNT_VALUE}", re.I)
+RE_VENDOR = re.compile(rf"(?:{'|'.join(VENDOR_LABELS)}){SEP}([^\n,]{{3,120}})", re.I)
+RE_BUYER = re.compile(rf"(?:{'|'.join(BUYER_LABELS)}){SEP}([^\n,]{{3,120}})", re.I)
+RE_CURRENCY = re.compile(r"(₹|\bINR\b|\bRs\.?|\bUSD\b|\$|\bEUR\b|€)")
+
+# characters at the top of an invoice searched for the seller's name
+TEMPLATE_HEADER_CHARS = 600
+
+CURRENCY_CODES = {"₹": "INR", "INR": "INR", "RS": "INR", "RS.": "INR", "USD": "USD", "$": "USD", "EUR": "EUR", "€": "EUR"}
+NUMERIC_FIELDS = {"subtotal", "tax", "total"}
+
+
+def _to_number(s: str) -> Optional[float]:
+    try:
+        return float(s.replace(",", ""))
+    except (AttributeError, ValueError):
+        return None
+
+
+def _pick(matches: List[str], single: float, multiple: float):
+    """
+    (value, confidence) from all matches of one pattern: a single distinct
+    value is trusted more than several conflicting ones (first one wins).
+    """
+    values = [m.strip() for m in matches if m and m.strip()]
+    if not values:
+        return None, 0.0
+    distinct = list(dict.fromkeys(values))
+    return distinct[0], single if len(distinct) == 1 else multiple
+
+
+def _generic_dates(text: str) -> List[str]:
+    """
+    Values of bare "Date" labels, skipping qualified ones (Due/Order/Challan
+    Date, ...; invoice/bill dates are matched by RE_DATE instead).
+    """
+    return [
+        value for qualifier, value in RE_DATE_GENERIC.findall(text)
+        if qualifier.lower() not in OTHER_DATE_QUALIFIERS
+    ]
+
+
+# ----------------------
+# Vendor templates
+# ----------------------
+_templates: Dict[str, dict] = {}
+
+VALUE_PATTERNS = {"invoice_number": INVOICE_NO_VALUE, "date": DATE_VALUE, "total": AMOUNT_VALUE}
+
+
+def load_templates(path: str = RULE_TEMPLATES_PATH) -> Dict[str, dict]:
+    global _templates
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            _templates = json.load(f)
+    except (OSError, ValueError):
+        _templates = {}
+    return _templates
+
+
+def _label_before(raw_text: str, value: str) -> Optional[str]:
+    """
+    Text preceding `value` on the first line that contains it, e.g. "Bill No".
+    """
+    for line in raw_text.splitlines():
+        pos = line.find(value)
+        if pos > 0:
+            label = re.sub(r"[\s:#.\-]+$", "", line[:pos]).strip()
+            label = label[-40:].strip()
+            if re.search(r"[A-Za-z]", label):
+                return label
+    return None
+
+
+def _format_amount_variants(v: float) -> List[str]:
+    return [f"{v:,.2f}", f"{v:.2f}", f"{v:g}"]
+
+
+def learn_vendor_templates(db, min_invoices: int = RULE_TEMPLATE_MIN_INVOICES, per_vendor: int = 50) -> Dict[str, dict]:
+    """
+    Build per-vendor label templates from saved invoices: for each field, the
+    label text that most often precedes the stored value in raw_text.
+    """
+    from models.invoice import Invoice
+
+    rows = (
+        db.query(Invoice.vendor_name, Invoice.invoice_number, Invoice.date, Invoice.total, Invoice.raw_text)
+        .filter(Invoice.vendor_name.isnot(None), Invoice.raw_text.isnot(None))
+        .order_by(Invoice.id.desc())
+        .yield_per(500)
+    )
+    by_vendor = defaultdict(list)
+    for r in rows:
+        key = r.vendor_name.strip().lower()
+        if len(by_vendor[key]) < per_vendor:
+            by_vendor[key].append(r)
+
+    templates = {}
+    for key, invs in by_vendor.items():
+        if len(invs) < min_invoices:
+            continue
+        labels = defaultdict(Counter)
+        for r in invs:
+            for field, value in (("invoice_number", r.invoice_number), ("date", r.date)):
+                if value:
+                    label = _label_before(r.raw_text, str(value))
+                    if label:
+                        labels[field][label] += 1
+            if r.total is not None:
+                for variant in _format_amount_variants(float(r.total)):
+                    label = _label_before(r.raw_text, variant)
+                    if label:
+                        labels["total"][label] += 1
+                        break
+        fields = {}
+        for field, counter in labels.items():
+            label, n = counter.most_common(1)[0]
+            if n >= min_invoices:
+                fields[field] = label
+        if fields:
+            templates[key] = {"vendor_name": invs[0].vendor_name.strip(), "labels": fields, "samples": len(invs)}
+    return templates
+
+
+def save_templates(templates: Dict[str, dict], path: str = RULE_TEMPLATES_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(templates, f, ensure_ascii=False, indent=2)
+    load_templates(path)
+
+
+def _seller_region(text: str) -> str:
+    """
+    Lowercased seller part of an invoice: the top of the text up to the buyer
+    block ("Bill To"), plus any "Sold By" lines.
+    """
+    head = text[:TEMPLATE_HEADER_CHARS]
+    buyer = RE_BUYER.search(head)
+    if buyer:
+        head = head[:buyer.start()]
+    return "\n".join([head] + RE_VENDOR.findall(text)).lower()
+
+
+def _match_template(text: str) -> Optional[dict]:
+    if not _templates:
+        return None
+    region = _seller_region(text)
+    best = None
+    for key, tpl in _templates.items():
+        if key and key in region and (best is None or len(key) > len(best[0])):
+            best = (key, tpl)
+    return best[1] if best else None
+
+
+# ----------------------
+# Extraction
+# ----------------------
+def pre_extract(text: str) -> dict:
+    """
+    Run the deterministic extractors over `text`.
+
+    Returns {"fields": {name: value}, "confidence": {name: float},
+             "sources": {name: "rule:template" | "rule:regex"},
+             "missing": [fields the LLM still has to provide],
+             "fallback": {name: value used only when the LLM has none}}.
+
+    A date found only under a bare "Date" label is a fallback, never a rule
+    value: the LLM is still asked for it and its answer wins.
+    """
+    fields, conf, sources = {}, {}, {}
+
+    def _set(name, value, c, source="rule:regex"):
+        if value is None or c <= conf.get(name, 0):
+            return
+        if name in NUMERIC_FIELDS:
+            value = _to_number(value)
+            if value is None:
+                return
+        fields[name] = value
+        conf[name] = c
+        sources[name] = source
+
+    tpl = _match_template(text)
+    if tpl:
+        _set("vendor_name", tpl["vendor_name"], 0.95, "rule:template")
+        for field, label in tpl["labels"].items():
+            m = re.search(r"(?<!\w)" + re.escape(label) + SEP + VALUE_PATTERNS[field], text, re.I)
+            if m:
+                _set(field, m.group(1), 0.95, "rule:template")
+
+    _set("invoice_number", *_pick(RE_INVOICE_NO.findall(text), 0.9, 0.6))
+    _set("date", *_pick(RE_DATE.findall(text), 0.9, 0.6))
+    fallback = {}
+    generic_dates = _generic_dates(text)
+    if generic_dates:
+        fallback["date"] = generic_dates[0].strip()
+
+    gst, c = _pick(RE_GSTIN_LABELLED.findall(text), 0.95, 0.7)
+    if gst is None:
+        gst, c = _pick(RE_GSTIN.findall(text), 0.8, 0.5)
+    _set("gst_number", gst, c)
+
+    total, c = _pick(RE_GRAND_TOTAL.findall(text), 0.9, 0.6)
+    if total is None:
+        total, c = _pick(RE_TOTAL.findall(text), 0.7, 0.4)
+    _set("total", total, c)
+    _set("subtotal", *_pick(RE_SUBTOTAL.findall(text), 0.9, 0.6))
+    _set("tax", *_pick(RE_TAX.findall(text), 0.85, 0.5))
+
+    _set("vendor_name", *_pick(RE_VENDOR.findall(text), 0.85, 0.5))
+    _set("buyer_name", *_pick(RE_BUYER.findall(text), 0.85, 0.5))
+
+    cur, c = _pick(RE_CURRENCY.findall(text), 0.9, 0.5)
+    if cur:
+        _set("currency", CURRENCY_CODES.get(cur.upper()), c)
+
+    confident = {f for f, c in conf.items() if c >= RULE_CONFIDENCE_THRESHOLD}
+    fields = {f: v for f, v in fields.items() if f in confident}
+    conf = {f: c for f, c in conf.items() if f in confident}
+    sources = {f: s for f, s in sources.items() if f in confident}
+    missing = [f for f in ALL_FIELDS if f not in fields]
+    fallback = {f: v for f, v in fallback.items() if f in missing}
+    return {"fields": fields, "confidence": conf, "sources": sources, "missing": missing, "fallback": fallback}
+
+
+def llm_fields(pre: dict) -> List[str]:
+    """
+    Fields to ask the LLM for: every missing one while a required field is
+    missing, otherwise just the line items (none with RULE_LLM_ITEMS=0).
+    """
+    if any(f in pre["missing"] for f in RULE_REQUIRED_FIELDS):
+        return pre["missing"]
+    return ["items"] if RULE_LLM_ITEMS and "items" in pre["missing"] else []
+
+
+def llm_needed(pre: dict) -> bool:
+    return bool(llm_fields(pre))
+
+
+def partial_prompt(text: str, fields: List[str]) -> str:
+    """
+    Prompt asking only for `fields`, with the same conventions as PROMPT_TEMPLATE.
+    """
+    schema = ",\n".join(f'  "{f}": {FIELD_SCHEMA[f]}' for f in fields)
+    return (
+        "\nYou are an invoice parsing expert. Extract ONLY the fields below and return ONLY valid JSON (no explanation).\n\n"
+        "Schema:\n{\n" + schema + "\n}\n\n"
+        'Invoice text:\n"""' + text + '"""\n'
+    )
+
+
+def merge_with_llm(pre: dict, parsed: Optional[dict]) -> dict:
+    """
+    Combine rule values (which win) with LLM output and record per-field provenance.
+    Fallback values fill only fields the LLM left empty.
+    Output that is not a JSON object is returned as is, for the caller to reject.
+    """
+    if parsed is not None and not isinstance(parsed, dict):
+        return parsed
+    out = dict(parsed or {})
+    sources = {}
+    for f in ALL_FIELDS:
+        if f in pre["fields"]:
+            out[f] = pre["fields"][f]
+            sources[f] = pre["sources"][f]
+        elif parsed is not None and parsed.get(f) not in (None, ""):
+            sources[f] = "llm"
+        elif f in pre.get("fallback", {}):
+            out[f] = pre["fallback"][f]
+            sources[f] = "rule:fallback"
+        else:
+            out.setdefault(f, [] if f == "items" else None)
+            sources[f] = "none"
+    out["field_sources"] = sources
+    return out
+
+
+load_templates()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] != "learn":
+        print("Usage: python rule_extractor.py learn")
+        raise SystemExit(1)
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        learned = learn_vendor_templates(db)
+    finally:
+        db.close()
+    save_templates(learned)
+    print(f"Learned templates for {len(learned)} vendors → {RULE_TEMPLATES_PATH}")
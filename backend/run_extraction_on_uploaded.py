@@ -1,18 +1,13 @@
 # backend/run_extraction_on_uploaded.py
 import json
+import sys
 from pathlib import Path
 from ai_extractor import extract_invoice_auto
 from splitter import split_pdf_into_sections
 
-FILES = [
-    "C:/Users/Bhrumin/Downloads/ariel.pdf",
-    "C:/Users/Bhrumin/Downloads/shampoo.pdf",
-]
-
 OUT = "/tmp/invoice_extractor/run_outputs"
-Path(OUT).mkdir(parents=True, exist_ok=True)
 
-for f in FILES:
+def run_file(f: str) -> Path:
     print("Processing:", f)
     sections = split_pdf_into_sections(f)
     out = {"file": f, "sections": []}
@@ -26,4 +21,15 @@ for f in FILES:
     with open(outfile, "w", encoding="utf-8") as fo:
         json.dump(out, fo, ensure_ascii=False, indent=2)
     print("Wrote:", outfile)
-print("All done. Check files in", OUT)
+    return outfile
+
+if __name__ == "__main__":
+    # quick look at a few PDFs; for a corpus use batch_extract.py
+    files = sys.argv[1:]
+    if not files:
+        print("Usage: python run_extraction_on_uploaded.py file.pdf [file.pdf ...]")
+        raise SystemExit(1)
+    Path(OUT).mkdir(parents=True, exist_ok=True)
+    for f in files:
+        run_file(f)
+    print("All done. Check files in", OUT)
@@ -1,11 +1,30 @@
 # backend/splitter.py
+"""
+Split a PDF holding several invoices (a merged statement) into one section per
+invoice.
+
+find_pdf_sections() scans each page's text once and scores the page as the
+start of a new invoice from its cues: an invoice title or number in the page's
+header band (the top of the page by PyMuPDF block position, or the first part
+of the text on OCR'd pages), a number that differs from the current invoice's,
+"Page 1 of N" vs "Page 2 of N", and whether the current invoice already showed
+its total. A second invoice starting lower on the same page (stacked receipts)
+needs a title or new number after the current invoice's total. Labels every
+invoice repeats (GSTIN, Bill To, Sold By) are not boundaries.
+
+Sections come back as page ranges plus offsets into the page texts; only
+section_text() copies text, once per section.
+"""
 import re
 import os
+import logging
+from bisect import bisect_right
+from collections import Counter
 from typing import List, Tuple
-from utils.pdf_reader import pdf_has_text, pdf_to_text, pdf_to_images
-from utils.ocr_reader import multiple_images_to_text
+from utils.pdf_reader import analyze_pdf, extract_page_texts
 
-# Heuristics/separators that commonly indicate invoice boundaries.
+# Heuristics/separators that commonly indicate invoice boundaries
+# (split_text_by_boundaries, for plain text without page structure).
 BOUNDARY_KEYWORDS = [
     r"\bTAX\s+INVOICE\b",
     r"\bBILL\s+OF\s+SUPPLY\b",
@@ -20,13 +39,38 @@ BOUNDARY_KEYWORDS = [
     r"\bTax Invoice\b"
 ]
 
+# Fraction of the page height (or of an OCR'd page's text) treated as its header.
+SPLIT_HEADER_BAND = float(os.getenv("SPLIT_HEADER_BAND", "0.35"))
+# Score a page needs to start a new section (see _page_score).
+SPLIT_PAGE_THRESHOLD = int(os.getenv("SPLIT_PAGE_THRESHOLD", "3"))
+
+logger = logging.getLogger(__name__)
+
 COMPILED_BOUNDARIES = re.compile("|".join(BOUNDARY_KEYWORDS), flags=re.IGNORECASE)
 
+# Cues are matched on the lowercased page. A title must open its line and not
+# be a label ("Invoice Date", "Invoice No"); a number needs a label ("Invoice
+# No", "Bill No") and a digit; a total ("Grand Total", "Amount due", "Net
+# amount", "Balance due", ...) needs an amount on its line, so a "Total" column
+# heading is not one. Case-insensitive alternations are slow on long text, so
+# a scan for the cue words finds the candidates and SECTION_CUES is only tried
+# there.
+CUE_WORDS = re.compile(r"invoice|bill|page|total|amount|grand|net|balance|tax|retail|commercial")
+SECTION_CUES = re.compile(
+    r"(?P<title>(?:tax[ \t]+|retail[ \t]+|commercial[ \t]+)?invoice|bill[ \t]+of[ \t]+supply)\b"
+    r"(?![ \t]*(?:no\b|number|num\b|#|date|total|value|amount|details|:))"
+    r"|(?:invoice[ \t]*(?:no\b\.?|number|num\b|#|:)|bill[ \t]*(?:no\b\.?|number|num\b|#))"
+    r"[ \t]*[:.#]?[ \t]*(?P<number>[a-z0-9][\w/-]*\d[\w/-]*)"
+    r"|page[ \t]+(?P<page_no>\d+)[ \t]*(?:of|/)[ \t]*\d+"
+    r"|(?P<total>grand[ \t]+total|total[ \t]+amount|amount[ \t]+(?:payable|due)|net[ \t]+amount"
+    r"|balance[ \t]+due|total)\b(?=[^\n\d]{0,30}\d)"
+)
+
+
 def find_boundaries(text: str) -> List[int]:
     """Return a sorted list of match start indices for the boundary keywords."""
-    matches = [m.start() for m in COMPILED_BOUNDARIES.finditer(text)]
-    matches = sorted(set(matches))
-    return matches
+    # finditer yields non-overlapping matches left to right: already sorted and unique
+    return [m.start() for m in COMPILED_BOUNDARIES.finditer(text)]
 
 def split_text_by_boundaries(text: str) -> List[str]:
     """
@@ -51,50 +95,207 @@ def split_text_by_boundaries(text: str) -> List[str]:
     if tail:
         sections.append(tail)
     # If initial patch caused the first section to be a header-only fragment, merge small fragments
-    cleaned = []
+    merged = []
     for s in sections:
-        if cleaned and len(s.split()) < 5:
-            cleaned[-1] += "\n\n" + s
+        if merged and len(s.split()) < 5:
+            merged[-1].append(s)
         else:
-            cleaned.append(s)
-    return cleaned
+            merged.append([s])
+    return ["\n\n".join(parts) for parts in merged]
 
-def split_pdf_into_sections(pdf_path: str) -> List[Tuple[int, str]]:
+
+# ----------------------
+# page-aware detection
+# ----------------------
+def _header_test(page: dict, text: str):
     """
-    Returns list of (section_id, text). Uses selectable text if possible, otherwise OCR.
+    Return in_header(offset) for a page: by vertical position when the page
+    has layout blocks covering its text (interpolated inside the block, which
+    may hold the whole page), else by position in the text.
     """
-    if pdf_has_text(pdf_path):
-        text = pdf_to_text(pdf_path)
-    else:
-        image_pages = pdf_to_images(pdf_path)
-        text = multiple_images_to_text(image_pages)
+    blocks = page.get("blocks")
+    height = page.get("height") or 0
+    if blocks and height and blocks[-1][5] == len(text):
+        starts = [b[4] for b in blocks]
+        limit = height * SPLIT_HEADER_BAND
+
+        def in_header(offset: int) -> bool:
+            _, y0, _, y1, start, end = blocks[max(0, bisect_right(starts, offset) - 1)]
+            return y0 + (y1 - y0) * (offset - start) / max(1, end - start) < limit
+        return in_header
+    limit = len(text) * SPLIT_HEADER_BAND
+    return lambda offset: offset < limit
+
+
+def page_cues(text: str) -> List[tuple]:
+    """
+    [(kind, offset, value)] for one page, in text order: ("title", line start, True),
+    ("number", offset, "INV-1"), ("page_no", offset, 2), ("total", offset, True).
+    """
+    lower = text.lower()
+    if len(lower) != len(text):
+        # a few non-ASCII letters grow when lowered; keep offsets aligned
+        lower = "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+    cues = []
+    end = 0
+    for w in CUE_WORDS.finditer(lower):
+        pos = w.start()
+        if pos < end or (pos and (lower[pos - 1].isalnum() or lower[pos - 1] == "_")):
+            continue  # inside the previous cue, or not at a word start
+        m = SECTION_CUES.match(lower, pos)
+        if m is None:
+            continue
+        end = m.end()
+        if m.group("title"):
+            line_start = lower.rfind("\n", 0, pos) + 1
+            if not lower[line_start:pos].strip(" \t"):
+                cues.append(("title", line_start, True))
+        elif m.group("number"):
+            cues.append(("number", pos, m.group("number").upper()))
+        elif m.group("page_no"):
+            cues.append(("page_no", pos, int(m.group("page_no"))))
+        else:
+            cues.append(("total", pos, True))
+    return cues
+
+
+def _page_score(first: dict, current: dict) -> int:
+    """
+    How strongly a page's header cues say it starts a new invoice.
+    `first` holds the page's header cues, `current` the open section's state.
+    """
+    score = 0
+    if first.get("title"):
+        score += 2
+    number = first.get("number")
+    if number:
+        score += 2
+        if current["number"]:
+            score += 2 if number != current["number"] else -5
+    page_no = first.get("page_no")
+    if page_no is not None:
+        score += 2 if page_no == 1 else -5
+    if current["closed"]:
+        score += 1
+    return score
+
+
+def detect_sections(pages: list, texts: list = None) -> List[dict]:
+    """
+    Invoice sections of a document from its pages (analyze_pdf() page dicts,
+    ideally with layout=True) and their texts (`texts` overrides page["text"],
+    e.g. with OCR output). Linear in the text length.
 
-    # Normalize whitespace
+    Returns [{"section_id": 1, "page_start": 0, "start": 0, "page_end": 2, "end": 812}, ...]
+    with 0-based pages; `start` is an offset into page_start's text and `end`
+    (exclusive) into page_end's text.
+    """
+    if texts is None:
+        texts = [p["text"] for p in pages]
+    sections = []
+    current = None
+
+    def open_section(page_no: int, offset: int):
+        nonlocal current
+        if current is not None and offset:
+            # mid-page split; at a page start the open section already ends with the previous page
+            current["section"]["page_end"] = page_no
+            current["section"]["end"] = offset
+        sec = {"section_id": len(sections) + 1, "page_start": page_no, "start": offset,
+               "page_end": page_no, "end": offset}
+        sections.append(sec)
+        current = {"section": sec, "number": None, "closed": False}
+
+    for i, text in enumerate(texts):
+        page = pages[i] if i < len(pages) else {}
+        if not text:
+            continue  # blank or failed OCR page: part of whatever is open
+        in_header = _header_test(page, text)
+        header = {}
+        body = []
+        for kind, pos, value in page_cues(text):
+            if kind == "page_no":
+                # page numbers sit in headers or footers alike
+                header.setdefault("page_no", value)
+            elif body or kind == "total" or not in_header(pos):
+                body.append((kind, pos, value))  # from the first total on, cues belong to the page body
+            else:
+                header.setdefault(kind, value)
+
+        if current is None or _page_score(header, current) >= SPLIT_PAGE_THRESHOLD:
+            open_section(i, 0)
+        if header.get("number") and not current["number"]:
+            current["number"] = header["number"]
+        current["section"]["page_end"] = i
+        current["section"]["end"] = len(text)
+
+        for kind, pos, value in body:
+            if kind == "total":
+                current["closed"] = True
+                continue
+            new_number = kind == "number" and value != current["number"]
+            if current["closed"] and (kind == "title" or new_number):
+                open_section(i, text.rfind("\n", 0, pos) + 1)
+                current["section"]["end"] = len(text)
+            if kind == "number" and not current["number"]:
+                current["number"] = value
+    return sections
+
+
+def section_text(texts: list, section: dict) -> str:
+    """
+    Materialise one section from the page texts, with whitespace normalised.
+    """
+    first, last = section["page_start"], section["page_end"]
+    if first == last:
+        parts = [texts[first][section["start"]:section["end"]]]
+    else:
+        parts = [texts[first][section["start"]:]] + texts[first + 1:last] + [texts[last][:section["end"]]]
+    text = "\n".join(p for p in parts if p)
     text = re.sub(r"\r\n|\r", "\n", text)
     text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
 
-    sections = split_text_by_boundaries(text)
-    # If no boundaries detected but file contains multiple 'Invoice Number' occurrences, split by those:
-    if len(sections) == 1:
-        # fallback: split by repeated "Invoice" tokens
-        parts = re.split(r"(?i)(\bInvoice\b|\bInvoice Number\b|\bINVOICE\b)", text)
-        # reconstruct in chunks
-        if len(parts) > 3:
-            # crude reconstruction: find occurrences of 'Invoice' and split there
-            idxs = [m.start() for m in re.finditer(r"(?i)\bInvoice\b", text)]
-            if len(idxs) > 1:
-                # use indices to cut slices
-                indices = idxs + [len(text)]
-                sects = []
-                s0 = 0
-                for i in indices:
-                    if i <= s0:
-                        continue
-                    sects.append(text[s0:i].strip())
-                    s0 = i
-                if s0 < len(text):
-                    sects.append(text[s0:].strip())
-                sections = [s for s in sects if len(s.split()) > 10]
-    # Provide ids
-    result = [(i+1, s) for i, s in enumerate(sections)]
+
+def find_pdf_sections(pdf_path) -> dict:
+    """
+    Page texts and invoice sections of a PDF (see detect_sections). Uses
+    selectable text where pages have it, OCR only for scanned pages.
+    `pdf_path` may also be the PDF bytes.
+
+    Returns {"pages": [text per page], "sections": [...], "ocr_failed_pages": [...]}.
+    """
+    analysis = analyze_pdf(pdf_path, layout=True)
+    extracted = extract_page_texts(pdf_path, analysis)
+    for f in extracted["ocr_failed_pages"]:
+        logger.warning("OCR failed for page %d: %s", f["page"] + 1, f["error"])
+    texts = extracted["pages"]
+    sections = detect_sections(analysis["pages"], texts)
+    return {"pages": texts, "sections": sections, "ocr_failed_pages": extracted["ocr_failed_pages"]}
+
+
+def split_pdf_into_sections(pdf_path, with_pages: bool = False) -> List[tuple]:
+    """
+    Returns list of (section_id, text). Uses selectable text where pages have it,
+    OCR only for scanned pages. `pdf_path` may also be the PDF bytes.
+
+    with_pages=True returns (section_id, text, pages) instead, where `pages`
+    are the section's 0-based PDF pages, or None when it shares a page with
+    another section (so page images would show more than one invoice).
+    """
+    found = find_pdf_sections(pdf_path)
+    per_page = Counter(
+        p for sec in found["sections"] for p in range(sec["page_start"], sec["page_end"] + 1)
+    )
+    result = []
+    for sec in found["sections"]:
+        text = section_text(found["pages"], sec)
+        if not text:
+            continue
+        if with_pages:
+            pages = list(range(sec["page_start"], sec["page_end"] + 1))
+            shared = any(per_page[p] > 1 for p in pages)
+            result.append((len(result) + 1, text, None if shared else pages))
+        else:
+            result.append((len(result) + 1, text))
     return result
@@ -0,0 +1,157 @@
+# backend/stub_llm_server.py
+"""
+Stand-in for LM Studio / OpenRouter so the pipeline and bench_extract.py run
+without a model.
+
+Serves POST /v1/chat/completions (OpenAI format, plain and `stream: true`).
+The reply is the gold answer when the prompt contains the text of a record in
+--gold (a corrected_gold.jsonl or *_dataset.jsonl), otherwise a fixed sample
+invoice. --latency and --tokens-per-sec simulate model time so concurrency
+and stage timings behave like they would against a real server.
+
+Usage:
+  python stub_llm_server.py [--port 1234] [--gold gold.jsonl] [--latency 0.2] [--tokens-per-sec 0]
+then point the backend at it:
+  LMSTUDIO_URL=http://127.0.0.1:1234/v1/chat/completions
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE = {
+    "invoice_number": "INV-0001",
+    "date": "2024-01-02",
+    "vendor_name": "Sample Traders",
+    "buyer_name": None,
+    "gst_number": None,
+    "currency": "INR",
+    "subtotal": 1000.0,
+    "tax": 180.0,
+    "total": 1180.0,
+    "items": [{"name": "Sample item", "quantity": 1, "unit_price": 1000.0, "total_price": 1000.0}],
+}
+NEEDLE_CHARS = 200
+
+
+def load_gold(path: str) -> list:
+    """
+    [(needle, answer)]: a prompt containing `needle` gets `answer`.
+    """
+    out = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            text = (rec.get("text") or "").strip()
+            answer = rec.get("model_output")
+            if text and isinstance(answer, dict) and "error" not in answer:
+                answer = {k: v for k, v in answer.items() if k != "raw_text"}
+                out.append((text[:NEEDLE_CHARS], answer))
+    return out
+
+
+def _prompt_text(payload: dict) -> str:
+    parts = []
+    for msg in payload.get("messages") or []:
+        content = msg.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(c.get("text", "") for c in content or [] if isinstance(c, dict))
+    return "\n".join(parts)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real servers
+    gold = []
+    latency = 0.0
+    jitter = 0.0
+    tokens_per_sec = 0.0
+
+    def _answer(self, prompt: str) -> str:
+        for needle, answer in self.gold:
+            if needle in prompt:
+                return json.dumps(answer, ensure_ascii=False)
+        return json.dumps(SAMPLE)
+
+    def do_POST(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(n) or b"{}")
+        except ValueError:
+            self.send_error(400, "invalid JSON")
+            return
+        prompt = _prompt_text(payload)
+        content = self._answer(prompt)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": max(1, len(content) // 4)}
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if payload.get("stream"):
+            self._stream(content, usage)
+            return
+        if self.tokens_per_sec > 0:
+            time.sleep(usage["completion_tokens"] / self.tokens_per_sec)
+        body = json.dumps({
+            "object": "chat.completion",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, content: str, usage: dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        step = 16  # characters per delta, roughly 4 tokens
+        try:
+            for i in range(0, len(content), step):
+                chunk = {"choices": [{"index": 0, "delta": {"content": content[i:i + step]}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if self.tokens_per_sec > 0:
+                    time.sleep(4 / self.tokens_per_sec)
+            self.wfile.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client stopped reading (e.g. JSON already complete)
+
+    def log_message(self, *args):
+        pass
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=1234)
+    ap.add_argument("--gold")
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds before the first token")
+    ap.add_argument("--jitter", type=float, default=0.0, help="+/- seconds added to --latency")
+    ap.add_argument("--tokens-per-sec", type=float, default=0.0, help="generation speed, 0 = instant")
+    args = ap.parse_args(argv)
+
+    StubHandler.gold = load_gold(args.gold) if args.gold else []
+    StubHandler.latency = args.latency
+    StubHandler.jitter = args.jitter
+    StubHandler.tokens_per_sec = args.tokens_per_sec
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+    print(f"Stub LLM on http://{args.host}:{args.port}/v1/chat/completions ({len(StubHandler.gold)} gold answers)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
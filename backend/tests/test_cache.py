@@ -0,0 +1,94 @@
+# backend/tests/test_cache.py
+import pytest
+
+from utils import cache as cache_mod
+from utils.cache import DiskCache, LRUCache, TieredCache
+
+
+class _Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock()
+    monkeypatch.setattr(cache_mod.time, "time", c)
+    return c
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(max_items=2)
+    lru.set("a", "1")
+    lru.set("b", "2")
+    assert lru.get("a") == "1"  # b is now the oldest
+    lru.set("c", "3")
+    assert lru.get("b") is None
+    assert (lru.get("a"), lru.get("c"), len(lru)) == ("1", "3", 2)
+
+
+def test_lru_disabled_with_zero_items():
+    lru = LRUCache(max_items=0)
+    lru.set("a", "1")
+    assert lru.get("a") is None
+
+
+def test_disk_ttl(tmp_path, clock):
+    disk = DiskCache(str(tmp_path / "c.sqlite3"), ttl=60)
+    disk.set("k", "v")
+    clock.now += 59
+    assert disk.get("k") == "v"
+    clock.now += 2
+    assert disk.get("k") is None
+    assert len(disk) == 0  # the expired entry is deleted on read
+
+
+def test_disk_evicts_by_entries_and_access(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(DiskCache, "EVICT_EVERY", 1)
+    disk = DiskCache(str(tmp_path / "c.sqlite3"), ttl=0, max_entries=10)
+    for i in range(10):
+        clock.now += 1
+        disk.set(f"k{i}", "v")
+    clock.now += 1
+    assert disk.get("k0") == "v"  # recently used: survives
+    clock.now += 1
+    disk.set("k10", "v")
+    assert len(disk) == 9
+    assert disk.get("k0") == "v"
+    assert disk.get("k1") is None and disk.get("k2") is None
+
+
+def test_disk_evicts_by_size(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(DiskCache, "EVICT_EVERY", 1)
+    disk = DiskCache(str(tmp_path / "c.sqlite3"), ttl=0, max_bytes=100)
+    for i in range(5):
+        clock.now += 1
+        disk.set(f"k{i}", "x" * 30)
+    assert len(disk) * 30 <= 100
+    assert disk.get("k4") is not None
+
+
+def test_tiered_promotes_disk_hits_and_counts(tmp_path):
+    disk = DiskCache(str(tmp_path / "c.sqlite3"))
+    tiered = TieredCache(LRUCache(4), disk)
+    tiered.set("k", {"items": [1]})
+    tiered.memory.clear()
+
+    hit = tiered.get("k")
+    assert hit == {"items": [1]}
+    hit["items"].append(2)  # callers get copies
+    assert tiered.get("k") == {"items": [1]}
+    assert tiered.get("missing") is None
+
+    s = tiered.stats()
+    assert (s["hits_disk"], s["hits_memory"], s["misses"], s["sets"]) == (1, 1, 1, 1)
+    assert s["hit_ratio"] == round(2 / 3, 4)
+
+
+def test_tiered_disabled():
+    tiered = TieredCache(LRUCache(4), enabled=False)
+    tiered.set("k", 1)
+    assert tiered.get("k") is None and len(tiered.memory) == 0
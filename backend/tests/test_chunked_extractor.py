@@ -0,0 +1,126 @@
+# backend/tests/test_chunked_extractor.py
+import asyncio
+import re
+
+import chunked_extractor as ce
+
+
+def _rows(n):
+    return "\n".join(f"Item {i:03d}  2  x  50.00  100.00" for i in range(n))
+
+
+def _fake_llm(max_rows, calls):
+    """
+    Answers item prompts with one item per row, truncated past max_rows rows.
+    """
+    def call(prompt, max_tokens):
+        calls.append((prompt, max_tokens))
+        if "header fields" in prompt:
+            return {"invoice_number": "INV-1", "total": 10.0}, False
+        names = re.findall(r"Item \d{3}", prompt.split('"""')[1])
+        items = [{"name": n, "quantity": 2, "unit_price": 50.0, "total_price": 100.0} for n in names]
+        if len(items) > max_rows:
+            return {"items": items[:max_rows]}, True
+        return {"items": items}, False
+    return call
+
+
+def test_split_windows_respects_budget_and_overlap():
+    text = "\n".join(f"line {i:03d} " + "x" * 30 for i in range(100))
+    windows = ce.split_windows(text, 200, 2)
+    assert len(windows) > 1
+    assert all(len(w["text"]) <= ce._budget_chars(200) for w in windows)
+    assert windows[0]["overlap"] == ""
+    for prev, cur in zip(windows, windows[1:]):
+        assert cur["overlap"] == "\n".join(prev["text"].splitlines()[-2:])
+        assert cur["text"].startswith(cur["overlap"])
+    lines = [ln for w in windows for ln in w["text"].splitlines()]
+    assert sorted(set(lines)) == text.splitlines()
+
+
+def test_split_windows_cuts_long_lines():
+    windows = ce.split_windows("word " * 2000, 100, 2)
+    limit = ce._budget_chars(100)
+    assert all(len(w["text"]) <= limit for w in windows)
+    assert all(len(w["overlap"]) <= limit // 4 for w in windows)
+    assert ce._line_pieces("a" * 25, 10) == ["a" * 10, "a" * 10, "a" * 5]
+
+
+def test_short_text_is_one_window():
+    assert ce.split_windows("one\ntwo") == [{"text": "one\ntwo", "overlap": ""}]
+    assert not ce.needs_chunking("short text")
+
+
+def test_merge_drops_overlap_duplicates_only():
+    windows = [
+        {"text": "Bolt 2 5.00 10.00\nNut 1 1.00 1.00", "overlap": ""},
+        {"text": "Nut 1 1.00 1.00\nWasher 4 0.50 2.00", "overlap": "Nut 1 1.00 1.00"},
+    ]
+    bolt = {"name": "Bolt", "quantity": 2, "unit_price": 5.0, "total_price": 10.0}
+    nut = {"name": "Nut", "quantity": 1, "unit_price": 1.0, "total_price": 1.0}
+    washer = {"name": "Washer", "quantity": 4, "unit_price": 0.5, "total_price": 2.0}
+    merged = ce.merge_results({"total": 13.0}, [[bolt, nut], [dict(nut, name=" nut "), washer]], windows)
+    assert merged["items"] == [bolt, nut, washer]
+    assert merged["total"] == 13.0 and merged["invoice_number"] is None
+
+    # the same row outside the shared lines is a real repeat
+    windows[1]["overlap"] = ""
+    merged = ce.merge_results({}, [[bolt, nut], [nut, washer, "junk"]], windows)
+    assert merged["items"] == [bolt, nut, nut, washer]
+
+
+def test_window_tokens_follows_output_budget(monkeypatch):
+    monkeypatch.setattr(ce, "EXTRACT_CHUNK_TOKENS", 2500)
+    monkeypatch.setattr(ce, "EXTRACT_ITEM_MAX_TOKENS", 4000)
+    monkeypatch.setattr(ce, "EXTRACT_ITEM_OUTPUT_RATIO", 1.5)
+    assert ce.window_tokens() == 2500
+    monkeypatch.setattr(ce, "EXTRACT_ITEM_MAX_TOKENS", 1500)
+    assert ce.window_tokens() == 1000
+
+
+def test_truncated_window_is_resplit(monkeypatch):
+    monkeypatch.setattr(ce, "EXTRACT_CHUNK_TOKENS", 400)
+    monkeypatch.setattr(ce, "EXTRACT_CHUNK_OVERLAP", 0)
+    text = _rows(80)
+    calls = []
+    out = ce.extract_chunked(text, _fake_llm(30, calls), max_workers=2)
+    names = [it["name"] for it in out["items"]]
+    assert names == [f"Item {i:03d}" for i in range(80)]
+    assert out["chunked"]["truncated_windows"] == 0
+    assert out["invoice_number"] == "INV-1"
+    assert any(mt == ce.EXTRACT_ITEM_MAX_TOKENS for _, mt in calls)
+
+
+def test_resplit_limit_keeps_recovered_items(monkeypatch):
+    monkeypatch.setattr(ce, "EXTRACT_CHUNK_TOKENS", 400)
+    monkeypatch.setattr(ce, "EXTRACT_CHUNK_OVERLAP", 0)
+    monkeypatch.setattr(ce, "EXTRACT_MAX_RESPLITS", 0)
+    out = ce.extract_chunked(_rows(80), _fake_llm(30, []), max_workers=2)
+    assert out["chunked"]["truncated_windows"] > 0
+    assert out["items"]
+
+
+def test_async_resplit_and_header_skip(monkeypatch):
+    monkeypatch.setattr(ce, "EXTRACT_CHUNK_TOKENS", 400)
+    monkeypatch.setattr(ce, "EXTRACT_CHUNK_OVERLAP", 0)
+    calls = []
+    sync_call = _fake_llm(30, calls)
+
+    async def call(prompt, max_tokens):
+        return sync_call(prompt, max_tokens)
+
+    out = asyncio.run(ce.extract_chunked_async(_rows(80), call, header=False))
+    assert len(out["items"]) == 80
+    assert out["invoice_number"] is None
+    assert not any("header fields" in p for p, _ in calls)
+
+
+def test_list_header_reply_is_ignored():
+    def call(prompt, max_tokens):
+        if "header fields" in prompt:
+            return [{"invoice_number": "X"}], False
+        return {"items": []}, False
+
+    out = ce.extract_chunked(_rows(5), call)
+    assert out["invoice_number"] is None
+    assert out["items"] == []
@@ -0,0 +1,91 @@
+# backend/tests/test_json_repair.py
+import pytest
+
+from utils.json_repair import IncrementalJsonParser, JsonRepairError, parse_json, parse_json_checked
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1}', {"a": 1}),
+    ('Here you go:\n```json\n{"a": 1}\n```', {"a": 1}),
+    ('[{"a": 1}]', [{"a": 1}]),
+    ('result: [{"a": 1}, {"a": 2}] done', [{"a": 1}, {"a": 2}]),
+    ('{"a": 1, "b": [1, 2,],}', {"a": 1, "b": [1, 2]}),
+    ("{'a': 'x', b: None, c: True}", {"a": "x", "b": None, "c": True}),
+    ('{"name": "O\'Brien"}', {"name": "O'Brien"}),
+    ("{'name': 'O'Brien'}", {"name": "O'Brien"}),
+    ('{"note": "said "hi" twice"}', {"note": 'said "hi" twice'}),
+])
+def test_parse_json(text, expected):
+    assert parse_json(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": "x" "b": 2}', {"a": "x", "b": 2}),
+    ('{"a": "x"\n"b": 2}', {"a": "x", "b": 2}),
+    ('{"a": "x" 5}', {"a": "x"}),
+    ('["x" "y" 3]', ["x", "y", 3]),
+])
+def test_missing_commas(text, expected):
+    obj, truncated = parse_json_checked(text)
+    assert obj == expected
+    assert not truncated
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"total": 1,234.50}', {"total": 1234.5}),
+    ('{"total": 1,234.50, "tax": 12}', {"total": 1234.5, "tax": 12}),
+    ('{"total": 12,345,678}', {"total": 12345678}),
+    ('{"a": 1,"b": 2,}', {"a": 1, "b": 2}),
+])
+def test_thousands_separators(text, expected):
+    assert parse_json(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"name": "Nu', {}),
+    ('{"a": "x", "total": 12', {"a": "x"}),
+    ('{"items": [{"name": "A", "qty": 1}, {"name": "Nu', {"items": [{"name": "A", "qty": 1}]}),
+    ('{"items": [{"name": "A"}, {"name": "B", "qty": 2', {"items": [{"name": "A"}]}),
+    ('{"items": [1, 2', {"items": [1]}),
+    ('{"a": "done"', {"a": "done"}),
+    ('{"vendor": {"name": "Acme", "gst', {"vendor": {"name": "Acme"}}),
+])
+def test_truncated_input_drops_unfinished_tail(text, expected):
+    obj, truncated = parse_json_checked(text)
+    assert obj == expected
+    assert truncated
+
+
+def test_not_truncated_when_complete():
+    assert parse_json_checked('{"a": [1, 2]}') == ({"a": [1, 2]}, False)
+    assert parse_json_checked('{"a": [1, 2], }') == ({"a": [1, 2]}, False)
+
+
+def test_no_object():
+    with pytest.raises(JsonRepairError):
+        parse_json("no json here")
+    with pytest.raises(JsonRepairError):
+        parse_json(None)
+
+
+def test_incremental_feed_matches_one_shot():
+    text = '{"invoice_number": "INV-1", "total": 1,234.50, "items": [{"name": "A", "qty": 2}, {"name": "B" "qty": 3}]}'
+    seen = []
+    parser = IncrementalJsonParser(on_value=lambda path, value: seen.append(path))
+    for i in range(0, len(text), 3):
+        parser.feed(text[i:i + 3])
+    assert parser.done
+    assert parser.close() == {
+        "invoice_number": "INV-1", "total": 1234.5,
+        "items": [{"name": "A", "qty": 2}, {"name": "B", "qty": 3}],
+    }
+    assert ("invoice_number",) in seen and ("items", 1) in seen
+
+
+def test_incremental_truncated_item_not_reported():
+    seen = []
+    parser = IncrementalJsonParser(on_value=lambda path, value: seen.append((path, value)))
+    parser.feed('{"items": [{"name": "A"}, {"name": "Nu')
+    assert parser.close() == {"items": [{"name": "A"}]}
+    assert parser.truncated
+    assert (("items", 1, "name"), "Nu") not in seen
@@ -0,0 +1,79 @@
+# backend/tests/test_layout_text.py
+import pytest
+
+from utils import layout_text as lt
+
+CHAR_W = 6.0
+
+
+def _words(y, *cells, x=50.0, gap=40.0, h=10.0):
+    """
+    PyMuPDF-style word tuples for one line: `cells` are strings whose words
+    sit one space apart; consecutive cells are `gap` points apart.
+    """
+    out = []
+    for cell in cells:
+        for word in cell.split():
+            x1 = x + len(word) * CHAR_W
+            out.append((x, y, x1, y + h, word))
+            x = x1 + CHAR_W
+        x += gap
+    return out
+
+
+def test_word_rows_groups_by_line_and_splits_cells():
+    words = _words(100, "Widget A", "2", "10.00", "20.00") + _words(120, "Grand Total", "20.00")
+    # PyMuPDF order is not guaranteed; a slightly lower baseline stays on its row
+    words = list(reversed(words)) + [(400.0, 101.5, 430.0, 111.5, "(ea)")]
+    rows = lt.word_rows(words)
+    assert [r["cells"] for r in rows] == [
+        ["Widget A", "2", "10.00", "20.00", "(ea)"],
+        ["Grand Total", "20.00"],
+    ]
+    assert rows[0]["y0"] == 100 and rows[0]["y1"] == 111.5
+
+
+def test_render_row():
+    assert lt.render_row(["Widget A", "2", "10.00"]) == "Widget A | 2 | 10.00"
+    assert lt.render_row(["Grand Total", "20.00"]) == "Grand Total  20.00"
+    assert lt.render_row(["one cell"]) == "one cell"
+
+
+def test_text_rows_for_ocr_pages():
+    rows = lt.text_rows("  Tax Invoice \n\nWidget    2   10.00\n")
+    assert [r["cells"] for r in rows] == [["Tax Invoice"], ["Widget 2 10.00"]]
+    assert [r["y0"] for r in rows] == [0, 1]
+
+
+def test_running_headers_and_page_numbers_are_dropped():
+    def page(body):
+        words = _words(10, "ACME TRADERS") + _words(300, body) + _words(790, "Page 1 of 2")
+        return {"words": words, "height": 800}
+
+    text = lt.layout_text([page("first body"), page("second body")])
+    assert text.splitlines() == ["ACME TRADERS", "first body", "second body"]
+
+
+@pytest.mark.parametrize("rows, expected", [
+    # a boilerplate paragraph is dropped up to the next gap
+    ([(0, "Terms & Conditions"), (12, "Goods once sold"), (24, "will not be taken back"), (60, "Thanks")],
+     ["Thanks"]),
+    # rows with invoice data survive inside it
+    ([(0, "Bank Details"), (12, "IFSC HDFC0001"), (24, "Grand Total 20.00")],
+     ["Grand Total 20.00"]),
+    # a row of boilerplate cells only disappears
+    ([(0, "Authorised Signatory")], []),
+])
+def test_drop_boilerplate(rows, expected):
+    rows = [{"y0": y, "y1": y + 10, "cells": [text]} for y, text in rows]
+    assert [" ".join(r["cells"]) for r in lt.drop_boilerplate(rows)] == expected
+
+
+def test_boilerplate_cells_are_removed_from_a_row():
+    rows = [{"y0": 0, "y1": 10, "cells": ["For ACME", "Authorised Signatory"]}]
+    assert lt.drop_boilerplate(rows)[0]["cells"] == ["For ACME"]
+
+
+def test_flags(monkeypatch):
+    monkeypatch.setattr(lt, "LAYOUT_DROP_BOILERPLATE", False)
+    assert lt.layout_text([{"text": "Authorised Signatory"}]) == "Authorised Signatory"
@@ -0,0 +1,52 @@
+# backend/tests/test_llm_client.py
+import socket
+import threading
+import time
+
+import pytest
+import requests
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+
+from llm_client import LLMClient
+
+
+def test_wrapped_read_timeout_is_detected():
+    wrapped = requests.ConnectionError(ReadTimeoutError(None, "/v1", "Read timed out."))
+    assert LLMClient._read_timed_out(wrapped)
+    assert not LLMClient._read_timed_out(requests.ConnectionError(ProtocolError("reset")))
+
+
+def _stalling_server(hits):
+    """
+    Sends headers and part of the body, then stalls past the client timeout.
+    """
+    srv = socket.socket()
+    srv.bind(("127.0.0.1", 0))
+    srv.listen()
+
+    def serve():
+        while True:
+            try:
+                conn, _ = srv.accept()
+            except OSError:
+                return
+            hits.append(1)
+            conn.recv(65536)
+            conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 100\r\n\r\n{\"cho")
+            time.sleep(1)
+            conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return srv
+
+
+def test_body_read_timeout_is_not_retried():
+    hits = []
+    srv = _stalling_server(hits)
+    client = LLMClient(max_retries=3, backoff_base=0)
+    try:
+        with pytest.raises(requests.ConnectionError):
+            client.post_chat({}, f"http://127.0.0.1:{srv.getsockname()[1]}/v1", timeout=0.2)
+    finally:
+        srv.close()
+    assert len(hits) == 1
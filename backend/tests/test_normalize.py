@@ -0,0 +1,64 @@
+# backend/tests/test_normalize.py
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from models.normalize import parse_amount, parse_date
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1,20,000.50", "120000.50"),
+    ("₹ 1,20,000.50", "120000.50"),
+    ("1,200.50", "1200.50"),
+    ("1.200,50", "1200.50"),
+    ("12,5", "12.5"),
+    ("1,200", "1200"),
+    ("USD 99.99", "99.99"),
+    ("Rs. 450", "450"),
+    ("(123.45)", "-123.45"),
+    ("-50", "-50"),
+    ("123.45-", "-123.45"),
+    # Indian "no paise" suffix is decoration, not a sign
+    ("INR 5,00,000/-", "500000"),
+    ("Rs. 5,000/-", "5000"),
+    ("Rs 5,000-/-", "5000"),
+    ("Rs. 500/- only", "500"),
+    ("5,000 /=", "5000"),
+    (1180, "1180"),
+    (12.5, "12.5"),
+    (Decimal("7.25"), "7.25"),
+])
+def test_parse_amount(value, expected):
+    assert parse_amount(value) == Decimal(expected)
+
+
+@pytest.mark.parametrize("value", [None, "", "abc", "/-", True, float("nan"), float("inf")])
+def test_parse_amount_no_number(value):
+    assert parse_amount(value) is None
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024-03-18", date(2024, 3, 18)),
+    ("2024/3/8", date(2024, 3, 8)),
+    ("18/03/2024", date(2024, 3, 18)),
+    ("03/18/2024", date(2024, 3, 18)),  # day-first impossible, read month-first
+    ("05.04.24", date(2024, 4, 5)),
+    ("18 Mar 2024", date(2024, 3, 18)),
+    ("1st January, 2024", date(2024, 1, 1)),
+    ("March 18, 2024", date(2024, 3, 18)),
+    ("Sept 9 2024", date(2024, 9, 9)),
+    (datetime(2024, 3, 18, 10, 30), date(2024, 3, 18)),
+    (date(2024, 3, 18), date(2024, 3, 18)),
+])
+def test_parse_date(value, expected):
+    assert parse_date(value) == expected
+
+
+def test_parse_date_month_first():
+    assert parse_date("05/04/2024", day_first=False) == date(2024, 5, 4)
+
+
+@pytest.mark.parametrize("value", [None, "", "soon", "31/02/2024", "18 Foo 2024"])
+def test_parse_date_invalid(value):
+    assert parse_date(value) is None
@@ -0,0 +1,63 @@
+# backend/tests/test_persistence.py
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from database import Base
+from models.invoice import Vendor
+from models.persistence import _match_vendors, resolve_vendors, vendor_row
+
+GSTIN = "27ABCDE1234F1Z5"
+OTHER_GSTIN = "29ABCDE1234F1Z3"
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", future=True)
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def _vendors(db):
+    return db.execute(select(Vendor.name, Vendor.normalized_name, Vendor.gstin).order_by(Vendor.id)).all()
+
+
+def test_rows_are_keyed_by_gstin_then_name():
+    assert vendor_row("Acme Pvt. Ltd.", "27abcde1234f1z5")["vendor_key"] == f"gstin:{GSTIN}"
+    assert vendor_row("ACME Ltd")["vendor_key"] == "name:acme"
+    assert vendor_row(None) is None
+
+
+def test_same_key_reuses_row(db):
+    first = resolve_vendors(db, [vendor_row("Acme Pvt Ltd", GSTIN)])
+    again = resolve_vendors(db, [vendor_row("ACME PRIVATE LIMITED", GSTIN), None])
+    assert again == [first[0], None]
+    assert len(_vendors(db)) == 1
+
+
+def test_gstin_matches_row_under_another_name(db):
+    [vid] = resolve_vendors(db, [vendor_row("Acme Traders", GSTIN)])
+    new = {"x": dict(vendor_row("Acme Trading Co", GSTIN), vendor_key="x")}
+    assert _match_vendors(db, new) == {"x": vid}
+
+
+def test_name_only_row_gets_the_gstin(db):
+    [vid] = resolve_vendors(db, [vendor_row("Acme Ltd")])
+    assert resolve_vendors(db, [vendor_row("ACME Limited", GSTIN)]) == [vid]
+    assert _vendors(db) == [("Acme Ltd", "acme", GSTIN)]
+    # later name-only invoices land on the same row
+    assert resolve_vendors(db, [vendor_row("Acme")]) == [vid]
+
+
+def test_name_does_not_merge_different_gstins(db):
+    [a] = resolve_vendors(db, [vendor_row("Acme", GSTIN)])
+    [b] = resolve_vendors(db, [vendor_row("Acme", OTHER_GSTIN)])
+    assert a != b
+
+
+def test_batch_aliases_name_only_vendor(db):
+    ids = resolve_vendors(db, [vendor_row("Acme"), vendor_row("Acme Ltd", GSTIN), vendor_row("Beta")])
+    assert ids[0] == ids[1] != ids[2]
+    assert [v.gstin for v in _vendors(db)] == [GSTIN, None]
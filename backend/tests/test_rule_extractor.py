@@ -0,0 +1,102 @@
+# backend/tests/test_rule_extractor.py
+import pytest
+
+import rule_extractor as rx
+
+INVOICE = """ACME TRADERS
+Sold By: Acme Traders Pvt Ltd
+GSTIN: 27ABCDE1234F1Z5
+Invoice No: INV-2024-001
+Invoice Date: 05/03/2024
+Bill To: Beta Stores
+Widget 2 10.00 20.00
+Sub Total: 20.00
+Total Tax: 3.60
+Grand Total: Rs. 23.60
+"""
+
+
+@pytest.fixture(autouse=True)
+def no_templates(monkeypatch):
+    monkeypatch.setattr(rx, "_templates", {})
+
+
+def test_header_fields():
+    pre = rx.pre_extract(INVOICE)
+    assert pre["fields"] == {
+        "invoice_number": "INV-2024-001", "date": "05/03/2024", "gst_number": "27ABCDE1234F1Z5",
+        "total": 23.6, "subtotal": 20.0, "tax": 3.6, "vendor_name": "Acme Traders Pvt Ltd",
+        "buyer_name": "Beta Stores", "currency": "INR",
+    }
+    assert pre["missing"] == ["items"]
+    assert set(pre["sources"].values()) == {"rule:regex"}
+
+
+def test_conflicting_matches_are_not_trusted():
+    pre = rx.pre_extract("Invoice No: INV-1\nInvoice No: INV-2")
+    assert "invoice_number" not in pre["fields"]
+
+
+def test_llm_fields(monkeypatch):
+    pre = rx.pre_extract(INVOICE)
+    assert rx.llm_fields(pre) == ["items"]
+    monkeypatch.setattr(rx, "RULE_LLM_ITEMS", False)
+    assert rx.llm_fields(pre) == [] and not rx.llm_needed(pre)
+
+    partial = rx.pre_extract(INVOICE.replace("Grand Total", "Balance"))
+    assert "total" in rx.llm_fields(partial) and "items" in rx.llm_fields(partial)
+
+
+def test_template_matches_seller_only(monkeypatch):
+    monkeypatch.setattr(rx, "_templates", {
+        "acme traders": {"vendor_name": "Acme Traders", "labels": {"invoice_number": "Ref"}},
+    })
+    pre = rx.pre_extract("Acme Traders\nRef: X-991\n")
+    assert pre["fields"] == {"vendor_name": "Acme Traders", "invoice_number": "X-991"}
+    assert pre["sources"]["invoice_number"] == "rule:template"
+
+    # the same name as the buyer does not pick the template
+    pre = rx.pre_extract("Beta Co\nBill To: Acme Traders\nRef: X-991\n")
+    assert "invoice_number" not in pre["fields"]
+
+
+def test_merge_rule_values_win():
+    pre = rx.pre_extract(INVOICE)
+    merged = rx.merge_with_llm(pre, {"total": 99.0, "items": [{"name": "Widget"}]})
+    assert merged["total"] == 23.6
+    assert merged["items"] == [{"name": "Widget"}]
+    assert merged["field_sources"]["total"] == "rule:regex"
+    assert merged["field_sources"]["items"] == "llm"
+    assert rx.merge_with_llm(pre, ["not", "a", "dict"]) == ["not", "a", "dict"]
+
+
+@pytest.mark.parametrize("text", [
+    "Due Date: 15/02/2024",
+    "Order Date: 03/01/2024",
+    "Challan Date - 02-01-2024",
+    "Delivery Date: 5 Jan 2024",
+])
+def test_qualified_dates_are_not_invoice_dates(text):
+    pre = rx.pre_extract(text)
+    assert "date" not in pre["fields"]
+    assert "date" not in pre["fallback"]
+
+
+def test_invoice_date_label_beats_other_dates():
+    pre = rx.pre_extract("Invoice Date: 01/01/2024\nDue Date: 31/01/2024")
+    assert pre["fields"]["date"] == "01/01/2024"
+
+
+def test_generic_date_is_only_a_fallback():
+    pre = rx.pre_extract("Place: Mumbai Date: 01/01/2024\nDue Date: 31/01/2024")
+    assert "date" not in pre["fields"]
+    assert pre["fallback"] == {"date": "01/01/2024"}
+    assert "date" in rx.llm_fields(pre)
+
+    merged = rx.merge_with_llm(pre, {"date": "2024-01-02"})
+    assert merged["date"] == "2024-01-02"
+    assert merged["field_sources"]["date"] == "llm"
+
+    merged = rx.merge_with_llm(pre, {"date": None})
+    assert merged["date"] == "01/01/2024"
+    assert merged["field_sources"]["date"] == "rule:fallback"
@@ -0,0 +1,37 @@
+# backend/tests/test_search.py
+from types import SimpleNamespace
+
+import pytest
+
+from models import search
+
+
+def _bind(name):
+    return SimpleNamespace(dialect=SimpleNamespace(name=name), engine=SimpleNamespace(url=f"{name}://x"))
+
+
+class _Session:
+    def __init__(self, conn):
+        self.conn = conn
+        self.executed = []
+
+    def connection(self):
+        return self.conn
+
+    def execute(self, *args):
+        self.executed.append(args)
+
+
+def test_unsupported_dialect_skips_writes(caplog):
+    bind = _bind("mysql")
+    search.ensure_search_index(bind)
+    db = _Session(bind)
+    search.index_invoices(db, [1], [{"invoice_number": "A"}])
+    assert db.executed == []
+    search.ensure_search_index(bind)
+    assert sum("not supported on mysql" in r.message for r in caplog.records) <= 1
+
+
+def test_unsupported_dialect_fails_reads():
+    with pytest.raises(search.SearchUnavailableError):
+        search.search_invoices(_Session(_bind("mysql")), "widget")
@@ -0,0 +1,82 @@
+# backend/tests/test_splitter.py
+import pytest
+
+import splitter
+from splitter import _page_score, detect_sections, page_cues, section_text
+
+INV_1 = "TAX INVOICE\nInvoice No: INV-001\nSold By: Acme\nWidget 2 10.00\nGrand Total 20.00\n"
+INV_2 = "TAX INVOICE\nInvoice No: INV-002\nSold By: Beta\nGadget 1 5.00\nTotal 5.00\n"
+CONTINUED = "Widget continued 1 10.00\nPage 2 of 2\n"
+
+
+def test_page_cues():
+    assert page_cues(INV_1) == [("title", 0, True), ("number", 12, "INV-001"), ("total", 61, True)]
+    assert page_cues("Page 3 of 4") == [("page_no", 0, 3)]
+
+
+@pytest.mark.parametrize("text", [
+    "Invoice Date: 01/01/2024",   # a label, not a title
+    "Total Qty  Rate  Amount",    # a column heading has no amount
+    "Invoice No: pending",        # a number needs a digit
+])
+def test_labels_are_not_cues(text):
+    assert page_cues(text) == []
+
+
+@pytest.mark.parametrize("text, kind", [
+    ("Bill No: B-17", "number"),
+    ("Amount due 1,200.00", "total"),
+    ("Net amount: 90", "total"),
+    ("Balance due  45.10", "total"),
+])
+def test_alternative_labels(text, kind):
+    assert [c[0] for c in page_cues(text)] == [kind]
+
+
+@pytest.mark.parametrize("header, current, expected", [
+    ({"title": True, "number": "B"}, {"number": "A", "closed": True}, 7),
+    ({"title": True, "number": "A"}, {"number": "A", "closed": False}, -1),
+    ({"page_no": 2}, {"number": "A", "closed": False}, -5),
+    ({"page_no": 1, "title": True}, {"number": None, "closed": False}, 4),
+    ({}, {"number": None, "closed": True}, 1),
+])
+def test_page_score(header, current, expected):
+    assert _page_score(header, current) == expected
+
+
+def test_continuation_page_stays_in_section():
+    sections = detect_sections([{}] * 3, [INV_1, CONTINUED, INV_2])
+    assert [(s["page_start"], s["page_end"]) for s in sections] == [(0, 1), (2, 2)]
+
+
+def test_two_invoices_on_one_page_split_mid_page():
+    text = INV_1 + INV_2
+    sections = detect_sections([{}], [text])
+    assert len(sections) == 2
+    assert section_text([text], sections[0]).endswith("Grand Total 20.00")
+    assert section_text([text], sections[1]).startswith("TAX INVOICE\nInvoice No: INV-002")
+
+
+def test_blank_pages_join_the_open_section():
+    sections = detect_sections([{}] * 3, [INV_1, "", INV_2])
+    assert [(s["page_start"], s["page_end"]) for s in sections] == [(0, 0), (2, 2)]
+
+
+def test_threshold(monkeypatch):
+    monkeypatch.setattr(splitter, "SPLIT_PAGE_THRESHOLD", 100)
+    assert len(detect_sections([{}] * 2, [INV_1, INV_2])) == 1
+
+
+def test_split_pdf_with_pages(tmp_path):
+    from bench_split import build_statement
+
+    path = str(tmp_path / "statement.pdf")
+    build_statement(path, 3, 0.0)
+    sections = splitter.split_pdf_into_sections(path, with_pages=True)
+    assert len(sections) == 3
+    pages = [p for _, _, p in sections]
+    assert all(pages) and sorted(sum(pages, [])) == list(range(max(pages[-1]) + 1))
+
+    build_statement(path, 2, 1.0)  # both invoices stacked on one page
+    sections = splitter.split_pdf_into_sections(path, with_pages=True)
+    assert [p for _, _, p in sections] == [None, None]
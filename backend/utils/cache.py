@@ -0,0 +1,180 @@
+# backend/utils/cache.py
+"""
+Small caching building blocks shared by the extraction and OCR caches.
+
+- LRUCache:    bounded in-memory tier (thread-safe OrderedDict).
+- DiskCache:   persistent SQLite tier with TTL and entry/size based eviction.
+- TieredCache: memory in front of disk, with hit/miss statistics.
+
+Values are JSON-serialisable objects; callers get deep copies so a cached
+result can never be mutated in place.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class LRUCache:
+    def __init__(self, max_items: int = 256):
+        self.max_items = max_items
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: str, value: str):
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskCache:
+    """
+    SQLite-backed key/value store. Entries older than `ttl` seconds are treated
+    as missing; when the table grows past `max_entries` or `max_bytes`, the
+    least recently accessed entries are evicted.
+    """
+
+    # only run the (relatively expensive) size check every N writes
+    EVICT_EVERY = 50
+
+    def __init__(self, path: str, ttl: float = 30 * 86400, max_entries: int = 50000, max_bytes: int = 512 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                (key, value, now, now, len(value)),
+            )
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        if self.ttl:
+            self._conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+        count, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+        # drop the least recently used 10% beyond the limits in one statement
+        target = min(self.max_entries, int(count * self.max_bytes / size) if size else count)
+        excess = count - int(target * 0.9)
+        self._conn.execute(
+            "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed LIMIT ?)",
+            (excess,),
+        )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+class TieredCache:
+    """
+    In-memory LRU in front of an optional DiskCache. Disk hits are promoted
+    into memory.
+    """
+
+    def __init__(self, memory: LRUCache, disk: Optional[DiskCache] = None, enabled: bool = True):
+        self.memory = memory
+        self.disk = disk
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {"hits_memory": 0, "hits_disk": 0, "misses": 0, "sets": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        raw = self.memory.get(key)
+        if raw is not None:
+            self._count("hits_memory")
+            return json.loads(raw)
+        if self.disk is not None:
+            raw = self.disk.get(key)
+            if raw is not None:
+                self.memory.set(key, raw)
+                self._count("hits_disk")
+                return json.loads(raw)
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        raw = json.dumps(value, ensure_ascii=False)
+        self.memory.set(key, raw)
+        if self.disk is not None:
+            self.disk.set(key, raw)
+        self._count("sets")
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        lookups = s["hits_memory"] + s["hits_disk"] + s["misses"]
+        s["hit_ratio"] = round((s["hits_memory"] + s["hits_disk"]) / lookups, 4) if lookups else None
+        s["memory_entries"] = len(self.memory)
+        s["disk_entries"] = len(self.disk) if self.disk is not None else None
+        s["enabled"] = self.enabled
+        return s
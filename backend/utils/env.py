@@ -0,0 +1,13 @@
+# backend/utils/env.py
+"""
+Environment config helpers.
+"""
+
+import os
+
+
+def env_flag(name: str, default: str = "1") -> bool:
+    """
+    Boolean setting: off when set to "", "0", "false" or "False", `default` when unset.
+    """
+    return os.getenv(name, default) not in ("0", "false", "False", "")
@@ -2,25 +2,90 @@
 DAWG/backend/app/utils/file_helpers.py
 
 Helpers to save uploaded files to a temp folder and cleanup.
+
+Uploads are streamed to disk in fixed-size chunks and hashed on the way, so the
+content hash (used for caching/dedup) needs no second read and memory stays
+bounded no matter how large the scan is. Small uploads are also kept in memory
+so PyMuPDF can open them straight from the buffer.
 """
+import hashlib
 import os
 import uuid
 from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
 
 TMP_DIR = os.getenv("TMP_DIR", "/tmp/invoice_extractor")
 os.makedirs(TMP_DIR, exist_ok=True)
 
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+# Uploads up to this size are also returned as bytes (0 disables).
+UPLOAD_KEEP_IN_MEMORY_BYTES = int(os.getenv("UPLOAD_KEEP_IN_MEMORY_MB", "8")) * 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+
+async def stream_upload_to_disk(
+    upload_file: UploadFile,
+    dest_dir: str = TMP_DIR,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    keep_in_memory: int = UPLOAD_KEEP_IN_MEMORY_BYTES,
+) -> dict:
+    """
+    Copy an UploadFile to `dest_dir` chunk by chunk while computing its SHA-256.
+    Raises UploadTooLargeError as soon as more than `max_bytes` have arrived
+    (the partial file is removed).
+
+    Returns {"path", "sha256", "size", "data"}; `data` holds the bytes for
+    uploads no larger than `keep_in_memory`, otherwise None.
+    """
+    if upload_file.size is not None and upload_file.size > max_bytes:
+        raise UploadTooLargeError(f"Upload exceeds {max_bytes // (1024 * 1024)} MB limit.")
+
+    name = os.path.basename(upload_file.filename or "upload")
+    path = os.path.join(dest_dir, f"{uuid.uuid4().hex}_{name}")
+    h = hashlib.sha256()
+    size = 0
+    kept = bytearray() if keep_in_memory > 0 else None
+
+    f = await run_in_threadpool(open, path, "wb")
+    try:
+        while True:
+            chunk = await upload_file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLargeError(f"Upload exceeds {max_bytes // (1024 * 1024)} MB limit.")
+            h.update(chunk)
+            if kept is not None:
+                if size <= keep_in_memory:
+                    kept += chunk
+                else:
+                    kept = None
+            await run_in_threadpool(f.write, chunk)
+    except BaseException:
+        f.close()
+        cleanup_tmp_file(path)
+        raise
+    f.close()
+
+    return {
+        "path": path,
+        "sha256": h.hexdigest(),
+        "size": size,
+        "data": bytes(kept) if kept is not None else None,
+    }
+
+
 async def save_upload_file_tmp(upload_file: UploadFile) -> str:
     """
     Save FastAPI UploadFile to a temp path and return that path.
     """
-    ext = os.path.splitext(upload_file.filename)[1] or ""
-    filename = f"{uuid.uuid4().hex}{ext}"
-    path = os.path.join(TMP_DIR, filename)
-    content = await upload_file.read()
-    with open(path, "wb") as f:
-        f.write(content)
-    return path
+    saved = await stream_upload_to_disk(upload_file, TMP_DIR, keep_in_memory=0)
+    return saved["path"]
 
 def cleanup_tmp_file(path: str):
     try:
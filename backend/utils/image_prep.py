@@ -0,0 +1,74 @@
+# backend/utils/image_prep.py
+"""
+Image preparation for the vision model.
+
+Phone photos and 200-DPI page renders are far larger than a VLM needs; sending
+them as-is bloats the request and slows prefill. prepare_image() fixes EXIF
+rotation, downsizes to a maximum long edge and re-encodes with the real MIME
+type.
+
+Config (env):
+  VLM_MAX_EDGE      longest side in pixels after resizing (default 1600)
+  VLM_IMAGE_FORMAT  JPEG, PNG or WEBP (default JPEG)
+  VLM_JPEG_QUALITY  1-95 for JPEG/WEBP (default 85)
+"""
+
+import base64
+import io
+import os
+from typing import Tuple, Union
+
+from PIL import Image, ImageOps
+
+VLM_MAX_EDGE = int(os.getenv("VLM_MAX_EDGE", "1600"))
+VLM_IMAGE_FORMAT = os.getenv("VLM_IMAGE_FORMAT", "JPEG").upper()
+VLM_JPEG_QUALITY = int(os.getenv("VLM_JPEG_QUALITY", "85"))
+
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+def _load(source: Union[str, dict, Image.Image]) -> Image.Image:
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, dict):  # raw page buffer from pdf_reader.iter_page_images()
+        return Image.frombytes(source["mode"], tuple(source["size"]), source["samples"])
+    img = Image.open(source)
+    img.load()
+    return img
+
+
+def prepare_image(
+    source,
+    max_edge: int = None,
+    fmt: str = None,
+    quality: int = None,
+) -> Tuple[bytes, str]:
+    """
+    Return (encoded_bytes, mime_type) for a path, PIL image or raw page buffer,
+    resized so the long edge is at most `max_edge`.
+    """
+    max_edge = max_edge or VLM_MAX_EDGE
+    fmt = (fmt or VLM_IMAGE_FORMAT).upper()
+    if fmt == "JPG":
+        fmt = "JPEG"
+    if fmt not in MIME_TYPES:
+        raise ValueError(f"Unsupported VLM image format: {fmt}")
+    quality = quality or VLM_JPEG_QUALITY
+
+    img = ImageOps.exif_transpose(_load(source))
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    if max(img.size) > max_edge:
+        img = img.copy()
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    buf = io.BytesIO()
+    if fmt == "PNG":
+        img.save(buf, format="PNG", optimize=True)
+    else:
+        img.save(buf, format=fmt, quality=quality)
+    return buf.getvalue(), MIME_TYPES[fmt]
+
+
+def to_data_url(data: bytes, mime: str) -> str:
+    return f"data:{mime};base64,{base64.b64encode(data).decode()}"
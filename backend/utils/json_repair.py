@@ -0,0 +1,344 @@
+# backend/utils/json_repair.py
+"""
+Tolerant, incremental JSON parser for model output.
+
+One left-to-right scan finds the first JSON object (or array) in the text and
+builds it while reading, tolerating what models commonly produce:
+  - prose or ```json fences around the object (skipped)
+  - trailing or missing commas ("a": "x" "b": 2)
+  - single-quoted strings and unquoted keys; an apostrophe inside a string
+    ("O'Brien", 'O'Brien') is kept because a quote only closes a string when
+    followed by , } ] : or end of input, or by whitespace and then a quote
+    or a digit (a missing comma)
+  - numbers with thousands separators in object values ("total": 1,234.50)
+  - Python literals (None, True, False) and raw newlines inside strings
+  - truncation: close() returns everything completed so far with open arrays
+    and objects closed; the unfinished last value (a cut-off string or
+    number, or a list item whose object never closed) is dropped, and
+    `truncated` is set
+
+Text can be fed in chunks (e.g. from a streaming completion); `on_value` is
+called with (path, value) whenever a value completes, so callers can act on
+header fields or line items before the response ends. `done` turns True as
+soon as the top-level object closes.
+
+    parse_json(text)                          one-shot, raises JsonRepairError
+    parse_json_checked(text)                  (obj, truncated)
+    p = IncrementalJsonParser(on_value=cb)
+    p.feed(chunk); ...; obj = p.close()
+"""
+
+import json
+import re
+from typing import Any, Callable, Optional
+
+from utils import metrics, timing
+
+_WS = " \t\r\n"
+_LITERALS = {
+    "true": True, "false": False, "null": None,
+    "True": True, "False": False, "None": None,
+    "NaN": None, "undefined": None,
+}
+_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_GROUPED_NUMBER = re.compile(r"[-+]?\d{1,3}(?:,\d{3})+(?:\.\d+)?")
+# after "1" of "1,234.50": the rest of a grouped number, then the value's end
+_GROUP_TAIL = re.compile(r"(?:,\d{3})+(?:\.\d+)?(?=[ \t\r]*[,}\]\n])")
+_GROUP_TAIL_PARTIAL = re.compile(r"(?:,\d{0,3})+(?:\.\d*)?[ \t\r]*")
+_GROUP_HEAD = re.compile(r"[-+]?\d{1,3}")
+_STRING_RUN = {'"': re.compile(r'[^"\\]+'), "'": re.compile(r"[^'\\]+")}
+_WS_RUN = re.compile(r"[ \t\r\n]+")
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+
+class JsonRepairError(ValueError):
+    pass
+
+
+def _bare_value(token: str):
+    if token in _LITERALS:
+        return _LITERALS[token]
+    if _GROUPED_NUMBER.fullmatch(token):
+        token = token.replace(",", "")
+    if _NUMBER.fullmatch(token):
+        try:
+            if any(c in token for c in ".eE"):
+                return float(token)
+            return int(token)
+        except ValueError:
+            pass
+    return token
+
+
+def _fix_surrogates(s: str) -> str:
+    # \\uD83D\\uDE00-style pairs arrive as two lone surrogates
+    if any("\ud800" <= c <= "\udfff" for c in s):
+        return s.encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+    return s
+
+
+class IncrementalJsonParser:
+    """
+    Streaming, repairing JSON parser; see the module docstring.
+    `truncated` is True when close() had to close open containers.
+    """
+
+    def __init__(self, on_value: Optional[Callable[[tuple, Any], None]] = None):
+        self.on_value = on_value
+        self.root = None
+        self.done = False
+        self.truncated = False
+        self._buf = ""
+        self._pos = 0
+        self._state = "seek"  # seek | value | string | after_string | bare | done
+        self._stack = []      # [container, pending_key, path]; path None when detached
+        self._quote = None
+        self._chars = []
+        self._ws = ""
+
+    # ---- public ----
+    def feed(self, chunk: str) -> bool:
+        """
+        Consume more text. Returns `done`.
+        """
+        if self.done or not chunk:
+            return self.done
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        self._run(final=False)
+        return self.done
+
+    def close(self):
+        """
+        Finish parsing (end of input) and return the object, repaired as needed.
+        """
+        if not self.done:
+            self._run(final=True)
+            state = self._state
+            if state == "after_string":
+                # the closing quote was the last character: the string is complete
+                frame = self._stack[-1] if self._stack else None
+                if frame is not None and not (isinstance(frame[0], dict) and frame[1] is None):
+                    self._emit(_fix_surrogates("".join(self._chars)))
+            elif state == "bare" and not self._stack:
+                self._finish_bare()
+            # a string cut off before its closing quote, or a bare token that may
+            # be cut short (12 of 1234), is dropped rather than kept as data
+            self._chars = []
+            if self._stack:
+                self.truncated = True
+            while self._stack:
+                if len(self._stack) > 1 and isinstance(self._stack[-2][0], list):
+                    # an unfinished list item (e.g. a line item missing its last fields)
+                    self._stack.pop()
+                    self._stack[-1][0].pop()
+                    continue
+                self._close_container()
+            self.done = True
+            self._state = "done"
+        if self.root is None:
+            raise JsonRepairError("No JSON object found in model output.")
+        return self.root
+
+    # ---- tree building ----
+    def _emit(self, value):
+        container, key, path = self._stack[-1]
+        if isinstance(container, list):
+            container.append(value)
+            if path is not None and self.on_value:
+                self.on_value(path + (len(container) - 1,), value)
+        elif key is None:
+            self._stack[-1][1] = value if isinstance(value, str) else json.dumps(value)
+        else:
+            container[key] = value
+            self._stack[-1][1] = None
+            if path is not None and self.on_value:
+                self.on_value(path + (key,), value)
+
+    def _open_container(self, container):
+        if not self._stack:
+            self.root = container
+            self._stack.append([container, None, ()])
+            return
+        parent, key, ppath = self._stack[-1]
+        path = None
+        if isinstance(parent, list):
+            parent.append(container)
+            path = None if ppath is None else ppath + (len(parent) - 1,)
+        elif key is not None:
+            parent[key] = container
+            self._stack[-1][1] = None
+            path = None if ppath is None else ppath + (key,)
+        self._stack.append([container, None, path])
+
+    def _close_container(self):
+        container, _, path = self._stack.pop()
+        if path and self.on_value:
+            self.on_value(path, container)
+        if not self._stack:
+            self.done = True
+            self._state = "done"
+
+    def _finish_bare(self):
+        token = "".join(self._chars).strip()
+        self._chars = []
+        self._state = "value"
+        if not token:
+            return
+        frame = self._stack[-1]
+        if isinstance(frame[0], dict) and frame[1] is None:
+            frame[1] = token.strip("\"'")  # unquoted key
+        else:
+            self._emit(_bare_value(token))
+
+    # ---- scanner ----
+    def _run(self, final: bool):
+        buf = self._buf
+        n = len(buf)
+        pos = self._pos
+        while pos < n and not self.done:
+            state = self._state
+
+            if state == "seek":
+                starts = [i for i in (buf.find("{", pos), buf.find("[", pos)) if i >= 0]
+                if not starts:
+                    pos = n
+                    break
+                pos = min(starts)
+                self._open_container({} if buf[pos] == "{" else [])
+                self._state = "value"
+                pos += 1
+
+            elif state == "value":
+                m = _WS_RUN.match(buf, pos)
+                if m:
+                    pos = m.end()
+                    continue
+                ch = buf[pos]
+                if ch == "{" or ch == "[":
+                    self._open_container({} if ch == "{" else [])
+                    pos += 1
+                elif ch == "}" or ch == "]":
+                    self._close_container()
+                    pos += 1
+                elif ch == ",":
+                    self._stack[-1][1] = None  # key without a value
+                    pos += 1
+                elif ch == ":":
+                    pos += 1
+                elif ch == '"' or ch == "'":
+                    self._quote = ch
+                    self._chars = []
+                    self._state = "string"
+                    pos += 1
+                else:
+                    self._chars = []
+                    self._state = "bare"
+
+            elif state == "string":
+                m = _STRING_RUN[self._quote].match(buf, pos)
+                if m:
+                    self._chars.append(m.group())
+                    pos = m.end()
+                    continue
+                ch = buf[pos]
+                if ch == "\\":
+                    if pos + 1 >= n:
+                        break  # wait for the escaped character
+                    esc = buf[pos + 1]
+                    if esc == "u":
+                        hexa = buf[pos + 2:pos + 6]
+                        if len(hexa) < 4 and not final:
+                            break
+                        try:
+                            self._chars.append(chr(int(hexa, 16)))
+                            pos += 6
+                        except ValueError:
+                            self._chars.append("u")
+                            pos += 2
+                    else:
+                        self._chars.append(_ESCAPES.get(esc, esc))
+                        pos += 2
+                else:  # the opening quote character
+                    self._ws = ""
+                    self._state = "after_string"
+                    pos += 1
+
+            elif state == "after_string":
+                ch = buf[pos]
+                if ch in _WS:
+                    self._ws += ch
+                    pos += 1
+                    continue
+                # after whitespace, a quote or digit starts the next value (missing comma)
+                ends = ch in ",}]:" or (self._ws and (ch in "\"'" or ch.isdigit()))
+                if ends:
+                    self._state = "value"
+                    self._emit(_fix_surrogates("".join(self._chars)))
+                    self._chars = []
+                else:
+                    # the quote was part of the text (e.g. an apostrophe)
+                    self._chars.append(self._quote + self._ws)
+                    self._state = "string"
+
+            elif state == "bare":
+                frame = self._stack[-1]
+                in_key = isinstance(frame[0], dict) and frame[1] is None
+                stop = ",}]\n:" if in_key else ",}]\n"
+                start = pos
+                while pos < n and buf[pos] not in stop:
+                    pos += 1
+                self._chars.append(buf[start:pos])
+                if pos < n and buf[pos] == "," and not in_key and isinstance(frame[0], dict) \
+                        and _GROUP_HEAD.fullmatch("".join(self._chars).strip()):
+                    # "total": 1,234.50 -- a thousands separator, not the next key
+                    m = _GROUP_TAIL.match(buf, pos)
+                    if m:
+                        self._chars.append(m.group())
+                        pos = m.end()
+                        continue
+                    if not final and _GROUP_TAIL_PARTIAL.fullmatch(buf, pos):
+                        break  # wait for the rest of the number
+                if pos < n:
+                    self._finish_bare()
+        self._pos = pos
+
+
+def parse_json(text: str):
+    """
+    Parse model output into a Python object. Valid JSON, bare or wrapped in
+    fences/prose, takes the C fast path; anything else gets a single repairing
+    scan. Raises JsonRepairError when no object can be found.
+    """
+    return parse_json_checked(text)[0]
+
+
+def parse_json_checked(text: str):
+    """
+    parse_json() that also reports truncation: returns (obj, truncated), where
+    `truncated` means the output ended before its JSON did (e.g. the model hit
+    max_tokens) and the unfinished tail was dropped.
+    """
+    if text is None:
+        raise JsonRepairError("Model returned empty response")
+    with timing.stage("json_repair"):
+        starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+        start = min(starts) if starts else -1
+        end = text.rfind("}" if start >= 0 and text[start] == "{" else "]")
+        if 0 <= start < end:
+            try:
+                obj = json.loads(text[start:end + 1])
+                metrics.JSON_PARSE.inc(path="fast")
+                return obj, False
+            except ValueError:
+                pass
+        timing.count("json_repair_fallbacks")
+        parser = IncrementalJsonParser()
+        parser.feed(text)
+        try:
+            obj = parser.close()
+        except JsonRepairError:
+            metrics.JSON_PARSE.inc(path="failed")
+            raise
+        metrics.JSON_PARSE.inc(path="truncated" if parser.truncated else "repair")
+        return obj, parser.truncated
@@ -0,0 +1,206 @@
+# backend/utils/layout_text.py
+"""
+Layout-preserving document text for the "layout" extraction mode.
+
+Plain page.get_text() emits a table column by column, so the LLM has to
+re-pair quantities, rates and amounts. Here words (PyMuPDF "words" boxes) are
+grouped into visual rows by their vertical centre and split into cells at
+wide horizontal gaps:
+  - a row of 3+ cells (a table row) becomes "Widget A | 2 | 10.00 | 20.00"
+  - two cells (a label and its value, or two side-by-side columns) are joined
+    with two spaces, so "Grand Total  1180.00" still matches label regexes
+  - anything else is the row's words joined by single spaces
+Then, to shorten the prompt:
+  - rows in the top / bottom band of a page that repeat on another page
+    (running headers, footers) are kept once, page numbers are dropped
+  - boilerplate is dropped: terms & conditions / bank details / declaration
+    paragraphs and cells such as IFSC, account numbers, "computer generated",
+    "Authorised Signatory" (never a row carrying a total, GSTIN or invoice number)
+
+OCR'd pages have no word boxes; their lines are used as rows (first / last
+lines as the bands).
+
+Config (env):
+  LAYOUT_CELL_GAP          gap, in average character widths, that starts a new cell (default 2)
+  LAYOUT_HEADER_BAND       top fraction of a page checked for running headers (default 0.15)
+  LAYOUT_FOOTER_BAND       bottom fraction checked for running footers (default 0.12)
+  LAYOUT_DROP_REPEATED     1/0 (default 1)
+  LAYOUT_DROP_BOILERPLATE  1/0 (default 1)
+"""
+
+import os
+import re
+from typing import List
+
+from utils.env import env_flag
+
+LAYOUT_CELL_GAP = float(os.getenv("LAYOUT_CELL_GAP", "2"))
+LAYOUT_HEADER_BAND = float(os.getenv("LAYOUT_HEADER_BAND", "0.15"))
+LAYOUT_FOOTER_BAND = float(os.getenv("LAYOUT_FOOTER_BAND", "0.12"))
+LAYOUT_DROP_REPEATED = env_flag("LAYOUT_DROP_REPEATED")
+LAYOUT_DROP_BOILERPLATE = env_flag("LAYOUT_DROP_BOILERPLATE")
+
+# lines of an OCR'd page treated as its header / footer band
+OCR_BAND_LINES = 3
+# rows dropped after a boilerplate heading before giving up on the paragraph
+BOILERPLATE_MAX_ROWS = 15
+
+RE_PAGE_NUMBER = re.compile(r"^(?:page\s*)?\d+\s*(?:of|/)\s*\d+$|^-\s*\d+\s*-$|^page\s*\d+$", re.I)
+RE_BOILERPLATE_HEADING = re.compile(
+    r"^\W*(?:terms\s*(?:&|and)\s*conditions|terms\s+of\s+(?:sale|payment)|t\s*&\s*c|"
+    r"bank\s+details|our\s+bank(?:ers|\s+details)?|bank\s+account\s+details|declaration|remittance\s+details)\b",
+    re.I,
+)
+RE_BOILERPLATE_CELL = re.compile(
+    r"\b(?:ifsc|swift|a/c\s*(?:no|number|name)|account\s*(?:no|number|name|holder)|bank\s*name|branch\s*(?:name|:)"
+    r"|upi\s*id|computer[\s-]generated|does\s+not\s+require\s+(?:a\s+)?signature|authori[sz]ed\s+signatory"
+    r"|e\.?\s*&\s*o\.?\s*e|subject\s+to\s+.{0,40}jurisdiction|thank\s+you\s+for)",
+    re.I,
+)
+# rows that must survive boilerplate removal
+RE_KEEP = re.compile(r"total|gstin|invoice\s*(?:no|number|#|date)|amount\s+payable|\btax\b|\d[\d,]*\.\d{2}\b", re.I)
+
+
+# ----------------------
+# rows and cells
+# ----------------------
+def word_rows(words: list) -> List[dict]:
+    """
+    Group PyMuPDF words (x0, y0, x1, y1, text, ...) into visual rows, top to bottom.
+    Returns [{"y0", "y1", "cells": [str, ...]}].
+    """
+    if not words:
+        return []
+    ordered = sorted(words, key=lambda w: ((w[1] + w[3]) / 2, w[0]))
+    rows = []
+    cur = [ordered[0]]
+    mid = (ordered[0][1] + ordered[0][3]) / 2
+    height = ordered[0][3] - ordered[0][1]
+    for w in ordered[1:]:
+        wmid = (w[1] + w[3]) / 2
+        if abs(wmid - mid) <= max(1.0, min(height, w[3] - w[1]) / 2):
+            cur.append(w)
+        else:
+            rows.append(cur)
+            cur = [w]
+            mid, height = wmid, w[3] - w[1]
+    rows.append(cur)
+    return [_row(r) for r in rows]
+
+
+def _row(words: list) -> dict:
+    words.sort(key=lambda w: w[0])
+    chars = sum(len(w[4]) for w in words)
+    char_w = sum(w[2] - w[0] for w in words) / max(1, chars)
+    cells = [[words[0][4]]]
+    for prev, w in zip(words, words[1:]):
+        if w[0] - prev[2] > LAYOUT_CELL_GAP * char_w:
+            cells.append([w[4]])
+        else:
+            cells[-1].append(w[4])
+    return {
+        "y0": min(w[1] for w in words),
+        "y1": max(w[3] for w in words),
+        "cells": [" ".join(c) for c in cells],
+    }
+
+
+def text_rows(text: str) -> List[dict]:
+    """
+    Rows of an OCR'd page: one per non-empty line, positions by line number.
+    """
+    lines = [ln.strip() for ln in text.splitlines()]
+    lines = [ln for ln in lines if ln]
+    return [{"y0": i, "y1": i + 1, "cells": [re.sub(r"\s{2,}", " ", ln)]} for i, ln in enumerate(lines)]
+
+
+def render_row(cells: list) -> str:
+    if len(cells) >= 3:
+        return " | ".join(cells)
+    return "  ".join(cells)
+
+
+# ----------------------
+# clean-up
+# ----------------------
+def _band_keys(page: dict) -> set:
+    rows = page["rows"]
+    if not rows:
+        return set()
+    if page.get("height"):
+        top = page["height"] * LAYOUT_HEADER_BAND
+        bottom = page["height"] * (1 - LAYOUT_FOOTER_BAND)
+        band = [r for r in rows if r["y1"] <= top or r["y0"] >= bottom]
+    else:
+        band = rows[:OCR_BAND_LINES] + rows[-OCR_BAND_LINES:]
+    return {render_row(r["cells"]).casefold() for r in band}
+
+
+def drop_repeated(pages: list):
+    """
+    Keep running header / footer rows only where they first appear; drop page numbers.
+    """
+    seen = set()
+    for page in pages:
+        band = _band_keys(page)
+        kept = []
+        for r in page["rows"]:
+            line = render_row(r["cells"])
+            key = line.casefold()
+            if RE_PAGE_NUMBER.match(line.strip()):
+                continue
+            if key in band:
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(r)
+        page["rows"] = kept
+
+
+def drop_boilerplate(rows: list) -> list:
+    kept = []
+    skipping = 0
+    last_y1 = None
+    gap_limit = None
+    for r in rows:
+        line = " ".join(r["cells"])
+        if RE_BOILERPLATE_HEADING.match(line) and not RE_KEEP.search(line):
+            skipping = BOILERPLATE_MAX_ROWS
+            last_y1 = r["y1"]
+            gap_limit = (r["y1"] - r["y0"]) * 1.5
+            continue
+        if skipping:
+            # the paragraph ends at a wider gap or at a row that carries invoice data
+            if RE_KEEP.search(line) or r["y0"] - last_y1 > gap_limit:
+                skipping = 0
+            else:
+                skipping -= 1
+                last_y1 = r["y1"]
+                continue
+        cells = [c for c in r["cells"] if RE_KEEP.search(c) or not RE_BOILERPLATE_CELL.search(c)]
+        if cells:
+            kept.append({**r, "cells": cells})
+    return kept
+
+
+# ----------------------
+# document
+# ----------------------
+def layout_text(pages: list) -> str:
+    """
+    Layout text of a document. `pages` are dicts with either "words" (PyMuPDF
+    word tuples) and "height", or "text" (an OCR'd page).
+    """
+    prepared = []
+    for p in pages:
+        if p.get("words") is not None:
+            prepared.append({"rows": word_rows(p["words"]), "height": p.get("height")})
+        else:
+            prepared.append({"rows": text_rows(p.get("text") or ""), "height": None})
+    if LAYOUT_DROP_REPEATED:
+        drop_repeated(prepared)
+    out = []
+    for p in prepared:
+        rows = drop_boilerplate(p["rows"]) if LAYOUT_DROP_BOILERPLATE else p["rows"]
+        out.extend(render_row(r["cells"]) for r in rows)
+    return "\n".join(out).strip()
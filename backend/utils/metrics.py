@@ -0,0 +1,197 @@
+# backend/utils/metrics.py
+"""
+In-process metrics, rendered in the Prometheus text format on GET /metrics.
+
+A small registry of counters and histograms with labels, so the backend needs
+no metrics client library:
+
+    PAGES = metrics.counter("dawg_pdf_pages_total", "PDF pages analysed", ("kind",))
+    PAGES.inc(kind="ocr")
+    metrics.STAGE_SECONDS.observe(0.42, stage="ocr")
+    metrics.render()  # text exposition
+
+Every utils.timing stage is observed in dawg_stage_seconds{stage=...}.
+Values are per process: with several uvicorn workers each worker serves its
+own numbers. Work done inside the OCR process pool is counted by the parent.
+
+Config (env):
+  METRICS_ENABLED   1/0 (default 1); when off nothing is recorded and /metrics is not mounted
+"""
+
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from utils.env import env_flag
+
+METRICS_ENABLED = env_flag("METRICS_ENABLED")
+
+# seconds; from a cached lookup to a slow multi-page LLM extraction
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry: Dict[str, "_Metric"] = {}
+_registry_lock = threading.Lock()
+_callbacks: List[Callable[[], Iterable[str]]] = []
+
+
+def _label_str(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        out.extend(self._lines(items))
+        return out
+
+    @abstractmethod
+    def _lines(self, items) -> List[str]:
+        """
+        Sample lines for the sorted (label values, state) pairs.
+        """
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED or not amount:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _lines(self, items):
+        return [f"{self.name}{_label_str(self.labels, k)} {_num(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]  # bucket counts, sum, count
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _lines(self, items):
+        out = []
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = 'le="%s"' % _num(bound)
+                out.append(f"{self.name}_bucket{_label_str(self.labels, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            out.append(f"{self.name}_bucket{_label_str(self.labels, key, le)} {n}")
+            out.append(f"{self.name}_sum{_label_str(self.labels, key)} {_num(total)}")
+            out.append(f"{self.name}_count{_label_str(self.labels, key)} {n}")
+        return out
+
+
+def _register(cls, name: str, *args, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, *args, **kwargs)
+        return metric
+
+
+def counter(name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+    return _register(Counter, name, help, labels)
+
+
+def histogram(name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram, name, help, labels, buckets)
+
+
+def register_callback(fn: Callable[[], Iterable[str]]):
+    """
+    Add a function returning ready-made exposition lines at scrape time
+    (for values owned elsewhere, e.g. cache statistics).
+    """
+    _callbacks.append(fn)
+
+
+def sample_lines(name: str, help: str, values: Dict[tuple, float], labels: Tuple[str, ...] = (),
+                 kind: str = "gauge") -> List[str]:
+    """
+    Exposition lines for values read at scrape time; `values` maps label value tuples to numbers.
+    """
+    out = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    out.extend(f"{name}{_label_str(labels, k)} {_num(v)}" for k, v in values.items() if v is not None)
+    return out
+
+
+def render() -> str:
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for m in metrics:
+        lines.extend(m.render())
+    for fn in _callbacks:
+        try:
+            lines.extend(fn())
+        except Exception:
+            pass  # a broken callback must not take /metrics down
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------
+# pipeline metrics
+# ----------------------
+STAGE_SECONDS = histogram("dawg_stage_seconds", "Time spent in each extraction stage (excluding nested stages)", ("stage",))
+PDF_PAGES = counter("dawg_pdf_pages_total", "PDF pages analysed, by whether they had a text layer", ("kind",))
+OCR_PAGES = counter("dawg_ocr_pages_total", "Pages sent for OCR, by outcome", ("result",))
+OCR_CHARS = counter("dawg_ocr_characters_total", "Characters produced by OCR (cache hits included)")
+LLM_REQUESTS = counter("dawg_llm_requests_total", "LLM calls, by outcome", ("outcome",))
+LLM_RETRIES = counter("dawg_llm_retries_total", "LLM call retries")
+LLM_TOKENS = counter("dawg_llm_tokens_total", "Tokens reported by the model server", ("kind",))
+JSON_PARSE = counter(
+    "dawg_json_parse_total",
+    "Model outputs parsed, by path (fast = valid JSON, repair = repairing scan, truncated = closed open containers)",
+    ("path",),
+)
+EXTRACTIONS = counter("dawg_extractions_total", "Extraction requests, by route and outcome", ("route", "outcome"))
+EXTRACT_SECONDS = histogram("dawg_extract_seconds", "End-to-end extraction request time", ("route",))
@@ -0,0 +1,58 @@
+# backend/utils/ocr_cache.py
+"""
+Persistent per-page OCR text cache.
+
+Tesseract output depends only on the page pixels and the OCR settings, not on
+the prompt or model, so it is cached separately from extraction results. The
+key is a hash of the rendered page buffer plus DPI, Tesseract language/config
+and Tesseract version; re-running a corpus with a new prompt or model then
+only pays for LLM time.
+
+Config (env):
+  OCR_CACHE_ENABLED       1/0 (default 1)
+  OCR_CACHE_MEMORY_ITEMS  in-memory LRU size (default 512)
+  OCR_CACHE_PATH          SQLite file ("" disables the persistent tier)
+  OCR_CACHE_TTL           seconds, 0 = never expire (default 0)
+  OCR_CACHE_MAX_ENTRIES   entry cap (default 500000)
+  OCR_CACHE_MAX_MB        size cap (default 1024)
+"""
+
+import hashlib
+import os
+
+from utils.cache import LRUCache, DiskCache, TieredCache
+from utils.env import env_flag
+
+TMP_DIR = os.getenv("TMP_DIR", "/tmp/invoice_extractor")
+
+OCR_CACHE_ENABLED = env_flag("OCR_CACHE_ENABLED")
+OCR_CACHE_MEMORY_ITEMS = int(os.getenv("OCR_CACHE_MEMORY_ITEMS", "512"))
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", os.path.join(TMP_DIR, "ocr_cache.sqlite3"))
+OCR_CACHE_TTL = float(os.getenv("OCR_CACHE_TTL", "0"))
+OCR_CACHE_MAX_ENTRIES = int(os.getenv("OCR_CACHE_MAX_ENTRIES", "500000"))
+OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", "1024"))
+
+
+def page_key(raw: dict, dpi: int, lang: str, config: str, engine_version: str) -> str:
+    """
+    Cache key for a raw page buffer from pdf_reader.iter_page_images().
+    """
+    h = hashlib.sha256()
+    h.update(f"{raw['mode']}:{raw['size'][0]}x{raw['size'][1]}:".encode())
+    h.update(raw["samples"])
+    return "|".join([h.hexdigest(), str(dpi), lang, config, engine_version])
+
+
+def _build_cache() -> TieredCache:
+    disk = None
+    if OCR_CACHE_ENABLED and OCR_CACHE_PATH:
+        disk = DiskCache(
+            OCR_CACHE_PATH,
+            ttl=OCR_CACHE_TTL,
+            max_entries=OCR_CACHE_MAX_ENTRIES,
+            max_bytes=OCR_CACHE_MAX_MB * 1024 * 1024,
+        )
+    return TieredCache(LRUCache(OCR_CACHE_MEMORY_ITEMS), disk, enabled=OCR_CACHE_ENABLED)
+
+
+ocr_cache = _build_cache()
@@ -1,32 +1,506 @@
 # backend/utils/ocr_reader.py
 """
 Image OCR utility using pytesseract and Pillow.
+
+Multi-page OCR runs on a shared process pool so scanned documents use every
+core instead of one. Configure with:
+  OCR_WORKERS       number of worker processes (default: CPU count, 1 = inline)
+  OCR_PAGE_TIMEOUT  seconds allowed per page before it is reported as failed
+  OCR_LANG          Tesseract language(s), e.g. "eng" or "eng+hin"
+  OCR_CONFIG        extra Tesseract config flags
+
+Before Tesseract sees a page it is preprocessed: grayscale, deskewed,
+binarized (Otsu) and cropped to its content. Tesseract then does less
+layout work on fewer pixels and reads straighter, cleaner glyphs. The page
+segmentation mode and language are chosen once per document from its first
+page, and PDF pages are rendered at a DPI picked from page size and ink
+density (see choose_dpi). Preprocessing settings:
+  OCR_PREPROCESS      1/0 master switch (default 1)
+  OCR_BINARIZE        1/0 Otsu binarization (default 1)
+  OCR_DESKEW          1/0 deskew (default 1)
+  OCR_MAX_SKEW        largest skew angle searched, degrees (default 5)
+  OCR_CROP_MARGINS    1/0 crop empty margins (default 1)
+  OCR_PSM             "auto" or a fixed Tesseract --psm value (default auto)
+  OCR_AUTO_LANG       1/0 detect the script per PDF and add its language (default 1);
+                      standalone images skip the extra OSD pass and use OCR_LANG
+  OCR_DPI             render DPI when adaptive DPI is off (default 200)
+  OCR_ADAPTIVE_DPI    1/0 pick DPI per page (default 1)
+  OCR_MIN_DPI / OCR_MAX_DPI   adaptive DPI range (default 150 / 300)
+  OCR_MAX_MEGAPIXELS  cap on rendered page size (default 12)
 """
 
-from PIL import Image
+import os
+import itertools
+import threading
+import concurrent.futures
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
 import pytesseract
 
-def image_to_text(image_path: str) -> str:
+from utils import metrics, timing
+from utils.env import env_flag
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_PAGE_TIMEOUT = float(os.getenv("OCR_PAGE_TIMEOUT", "120"))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+OCR_CONFIG = os.getenv("OCR_CONFIG", "")
+
+
+OCR_PREPROCESS = env_flag("OCR_PREPROCESS")
+OCR_BINARIZE = env_flag("OCR_BINARIZE")
+OCR_DESKEW = env_flag("OCR_DESKEW")
+OCR_MAX_SKEW = float(os.getenv("OCR_MAX_SKEW", "5"))
+OCR_CROP_MARGINS = env_flag("OCR_CROP_MARGINS")
+OCR_PSM = os.getenv("OCR_PSM", "auto")
+OCR_AUTO_LANG = env_flag("OCR_AUTO_LANG")
+
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_ADAPTIVE_DPI = env_flag("OCR_ADAPTIVE_DPI")
+OCR_MIN_DPI = int(os.getenv("OCR_MIN_DPI", "150"))
+OCR_MAX_DPI = int(os.getenv("OCR_MAX_DPI", "300"))
+OCR_MAX_PIXELS = int(float(os.getenv("OCR_MAX_MEGAPIXELS", "12")) * 1_000_000)
+
+# Ink fraction of a low-res probe render (see choose_dpi).
+SPARSE_INK = 0.01
+DENSE_INK = 0.12
+# Minimum gap between the Otsu class means for a page to count as having ink.
+MIN_CONTRAST = 40
+
+# Tesseract OSD script -> traineddata name, for per-document language choice.
+SCRIPT_LANGS = {
+    "Latin": "eng", "Devanagari": "hin", "Bengali": "ben", "Tamil": "tam",
+    "Telugu": "tel", "Kannada": "kan", "Malayalam": "mal", "Gujarati": "guj",
+    "Gurmukhi": "pan", "Arabic": "ara", "Cyrillic": "rus", "Han": "chi_sim",
+}
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_size = 0
+_pool_lock = threading.Lock()  # documents may be OCR'd from several threads
+
+
+def _open_image(image: Union[str, dict, Image.Image]) -> Image.Image:
+    """
+    Accept a file path, a PIL image, or a raw page buffer from
+    pdf_reader.iter_page_images() ({"mode", "size", "samples"}).
+    """
+    if isinstance(image, Image.Image):
+        return image
+    if isinstance(image, dict):
+        return Image.frombytes(image["mode"], tuple(image["size"]), image["samples"])
+    return Image.open(image)
+
+
+# ----------------------
+# Preprocessing
+# ----------------------
+def _otsu(gray: Image.Image) -> Tuple[int, float]:
+    """
+    Otsu threshold of an L-mode image. Returns (threshold, gap between the
+    dark and light class means); a small gap means there is no real ink.
+    """
+    hist = gray.histogram()[:256]
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    w_dark = 0
+    sum_dark = 0
+    best = -1.0
+    threshold, gap = 127, 0.0
+    for t in range(256):
+        w_dark += hist[t]
+        if w_dark == 0:
+            continue
+        w_light = total - w_dark
+        if w_light == 0:
+            break
+        sum_dark += t * hist[t]
+        m_dark = sum_dark / w_dark
+        m_light = (sum_all - sum_dark) / w_light
+        between = w_dark * w_light * (m_dark - m_light) ** 2
+        if between > best:
+            best = between
+            threshold, gap = t, m_light - m_dark
+    return threshold, gap
+
+
+def _binarize(gray: Image.Image, threshold: int) -> Image.Image:
+    return gray.point([0 if i <= threshold else 255 for i in range(256)])
+
+
+def ink_density(img: Image.Image) -> float:
+    """
+    Fraction of dark pixels (0.0 for blank or near-uniform pages).
+    """
+    gray = img if img.mode == "L" else img.convert("L")
+    threshold, gap = _otsu(gray)
+    if gap < MIN_CONTRAST:
+        return 0.0
+    return sum(gray.histogram()[: threshold + 1]) / max(1, gray.width * gray.height)
+
+
+def _row_profile_score(ink: Image.Image, angle: float) -> float:
+    # text lines aligned with the rows give a spiky row profile
+    rot = ink.rotate(angle, resample=Image.NEAREST, fillcolor=0)
+    rows = list(rot.resize((1, rot.height), Image.BOX).getdata())
+    return sum((b - a) ** 2 for a, b in zip(rows, rows[1:]))
+
+
+def estimate_skew(binary: Image.Image, max_angle: float = None) -> float:
+    """
+    Skew angle (degrees, PIL rotate() convention) that levels the text lines,
+    found by projection profiles on a downscaled copy: a 1 degree sweep, then
+    0.1 degree refinement around the best match.
+    """
+    max_angle = OCR_MAX_SKEW if max_angle is None else max_angle
+    if max_angle <= 0:
+        return 0.0
+    ink = ImageOps.invert(binary)
+    if ink.width > 800:
+        ink = ink.resize((800, max(1, ink.height * 800 // ink.width)), Image.BOX)
+    coarse = [a for a in range(-int(max_angle), int(max_angle) + 1)]
+    best = max(coarse, key=lambda a: _row_profile_score(ink, a))
+    fine = [best + d / 10 for d in range(-9, 10)]
+    return max(fine, key=lambda a: _row_profile_score(ink, a))
+
+
+def crop_margins(binary: Image.Image, pad: int = 12) -> Image.Image:
+    """
+    Crop to the bounding box of the ink. Bounds come from a 4x reduced copy so
+    isolated scanner specks in the margins do not stop the crop.
+    """
+    ink = ImageOps.invert(binary).reduce(4)
+    box = ink.point([0 if i < 64 else 255 for i in range(256)]).getbbox()
+    if not box:
+        return binary
+    left, top, right, bottom = (v * 4 for v in box)
+    return binary.crop((
+        max(0, left - pad), max(0, top - pad),
+        min(binary.width, right + pad), min(binary.height, bottom + pad),
+    ))
+
+
+def preprocess(img: Image.Image) -> Image.Image:
+    """
+    Grayscale -> deskew -> Otsu binarize -> crop margins (each step switchable,
+    see module docstring). Blank pages are returned as grayscale.
+    """
+    gray = img if img.mode == "L" else img.convert("L")
+    threshold, gap = _otsu(gray)
+    if gap < MIN_CONTRAST:
+        return gray
+    if OCR_DESKEW:
+        angle = estimate_skew(_binarize(gray, threshold))
+        if abs(angle) >= 0.2:
+            gray = gray.rotate(angle, resample=Image.BICUBIC, fillcolor=255)
+    if not OCR_BINARIZE:
+        return gray
+    binary = _binarize(gray, threshold)
+    return crop_margins(binary) if OCR_CROP_MARGINS else binary
+
+
+def preprocess_signature() -> str:
+    """
+    Identifies the preprocessing settings (part of the OCR cache key).
+    """
+    if not OCR_PREPROCESS:
+        return "raw"
+    return f"prep:b{int(OCR_BINARIZE)}d{int(OCR_DESKEW)}:{OCR_MAX_SKEW}c{int(OCR_CROP_MARGINS)}"
+
+
+# ----------------------
+# Per-document OCR plan
+# ----------------------
+def choose_dpi(width_pt: float, height_pt: float, density: float) -> int:
+    """
+    Render DPI for a scanned page from its size (PDF points) and the ink
+    density of a low-res probe: sparse pages (large type, little text) get
+    OCR_MIN_DPI, dense pages and narrow slips (small print) OCR_MAX_DPI. The
+    result is capped so the page stays under OCR_MAX_MEGAPIXELS.
+    """
+    if not OCR_ADAPTIVE_DPI:
+        return OCR_DPI
+    dpi = OCR_DPI
+    if density >= DENSE_INK or min(width_pt, height_pt) < 4 * 72:
+        dpi = OCR_MAX_DPI
+    elif density < SPARSE_INK:
+        dpi = OCR_MIN_DPI
+    area_in = max(1.0, (width_pt / 72) * (height_pt / 72))
+    cap = int((OCR_MAX_PIXELS / area_in) ** 0.5)
+    return max(72, min(dpi, cap))
+
+
+def choose_psm(prepped: Image.Image, page_size: Tuple[int, int] = None) -> int:
+    """
+    Page segmentation mode from a preprocessed page (and the uncropped page
+    size): tall narrow slips (receipts) are one column, near-empty pages are
+    sparse text, everything else gets full automatic layout analysis.
+    """
+    if OCR_PSM != "auto":
+        return int(OCR_PSM)
+    w, h = page_size or prepped.size
+    if h > 2.5 * w:
+        return 4
+    if ink_density(prepped) < 0.01:
+        return 11
+    return 3
+
+
+_installed_langs = None
+
+def _available_langs() -> set:
+    global _installed_langs
+    if _installed_langs is None:
+        try:
+            _installed_langs = set(pytesseract.get_languages(config=""))
+        except Exception:
+            _installed_langs = set()
+    return _installed_langs
+
+
+def detect_lang(prepped: Image.Image) -> str:
+    """
+    OCR_LANG plus the language of the script Tesseract OSD detects, when that
+    traineddata is installed (invoices usually mix English with the local script).
+    """
+    try:
+        osd = pytesseract.image_to_osd(prepped, output_type=pytesseract.Output.DICT, timeout=30)
+    except Exception:
+        return OCR_LANG
+    lang = SCRIPT_LANGS.get(osd.get("script"))
+    base = OCR_LANG.split("+")
+    if not lang or lang in base or lang not in _available_langs():
+        return OCR_LANG
+    return "+".join(base + [lang])
+
+
+def _plan(img: Image.Image, auto_lang: bool) -> dict:
+    probe = img if img.mode == "L" else img.convert("L")
+    if max(probe.size) > 1600:
+        probe = probe.copy()
+        probe.thumbnail((1600, 1600), Image.BOX)
+    prepped = preprocess(probe) if OCR_PREPROCESS else probe
+    lang = detect_lang(prepped) if auto_lang else OCR_LANG
+    return {"lang": lang, "psm": choose_psm(prepped, probe.size)}
+
+
+def plan_document(image, auto_lang: bool = None) -> dict:
+    """
+    OCR settings for a whole document, from its first page:
+    {"lang": str, "psm": int}. Runs on a downscaled copy to stay cheap.
+    `auto_lang` (default OCR_AUTO_LANG) adds a Tesseract OSD pass for the script.
+    """
+    auto_lang = OCR_AUTO_LANG if auto_lang is None else auto_lang
+    if isinstance(image, Image.Image):
+        return _plan(image, auto_lang)
+    with _open_image(image) as img:
+        return _plan(img, auto_lang)
+
+
+def _tesseract_config(psm: int) -> str:
+    if "--psm" in OCR_CONFIG:
+        return OCR_CONFIG
+    return f"--psm {psm} {OCR_CONFIG}".strip()
+
+
+def image_to_text(image, timeout: float = 0, plan: dict = None) -> str:
     """
-    Extract text from an image path using pytesseract.
+    Extract text from an image using pytesseract.
+    `image` may be a path, a PIL image or a raw page buffer (see _open_image).
     Ensure Tesseract is installed on the system.
+    `timeout` (seconds, 0 = none) kills the tesseract process if exceeded.
+    `plan` is the document's plan_document() result; without one the image is
+    treated as a single-page document and planned on its own, without the OSD
+    pass (an OSD pass per image costs a sizeable share of its OCR time).
     """
-    with Image.open(image_path) as img:
-        # Optional preprocessing could go here
-        text = pytesseract.image_to_string(img)
+    with timing.stage("ocr"), _open_image(image) as img:
+        if plan is None:
+            plan = plan_document(img, auto_lang=False)
+        prepped = preprocess(img) if OCR_PREPROCESS else img
+        text = pytesseract.image_to_string(
+            prepped, lang=plan["lang"], config=_tesseract_config(plan["psm"]), timeout=timeout
+        )
     return text.strip()
 
 
-def multiple_images_to_text(image_paths: list) -> str:
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_size = workers
+        return _pool
+
+
+def ocr_pages(images: Iterable, workers: int = None, timeout: float = None, plan: dict = None) -> dict:
     """
-    Concatenate OCR outputs from multiple images.
+    OCR several page images concurrently on the worker pool.
+
+    `images` may be any iterable (including a lazy generator) of paths, PIL
+    images or raw page buffers. At most 2 * workers pages are in flight at
+    once, so a generator is only drained as fast as OCR keeps up.
+
+    Returns a dict:
+      {"texts": [text per input page, "" where it failed], "failed": [{"page": i, "error": str}]}
+    Output is always in input order; `page` is the 0-based position in `images`.
+    `plan` (see plan_document) applies to every page; by default it is taken
+    from the first page.
     """
-    texts = []
-    for p in image_paths:
+    workers = workers or OCR_WORKERS
+    timeout = OCR_PAGE_TIMEOUT if timeout is None else timeout
+    if plan is None:
+        images = iter(images)
+        first = next(images, None)
+        if first is None:
+            return {"texts": [], "failed": []}
         try:
-            t = image_to_text(p)
-            if t:
-                texts.append(t)
+            plan = plan_document(first)
         except Exception:
-            continue
-    return "\n".join(texts).strip()
+            plan = {"lang": OCR_LANG, "psm": 3}  # unreadable page: reported below
+        images = itertools.chain([first], images)
+    texts = {}
+    failed = []
+    count = 0
+
+    def _fail(i, e):
+        texts[i] = ""
+        failed.append({"page": i, "error": f"{type(e).__name__}: {e}"})
+
+    if workers <= 1:
+        for i, img in enumerate(images):
+            count += 1
+            try:
+                texts[i] = image_to_text(img, timeout, plan)
+            except Exception as e:
+                _fail(i, e)
+        return {"texts": [texts[i] for i in range(count)], "failed": failed}
+
+    pool = _get_pool(workers)
+    window = workers * 2
+    # tesseract enforces the per-page timeout itself; this is a backstop for a
+    # worker that hangs outside tesseract (e.g. decoding a corrupt image).
+    backstop = timeout + 30 if timeout else None
+    pending = {}
+
+    def _drain(return_when):
+        done, _ = concurrent.futures.wait(pending, timeout=backstop, return_when=return_when)
+        if not done:
+            for fut, i in pending.items():
+                fut.cancel()
+                _fail(i, TimeoutError("page OCR did not finish"))
+            pending.clear()
+            return
+        for fut in done:
+            i = pending.pop(fut)
+            try:
+                texts[i] = fut.result()
+            except Exception as e:
+                _fail(i, e)
+
+    for i, img in enumerate(images):
+        count += 1
+        pending[pool.submit(image_to_text, img, timeout, plan)] = i
+        while len(pending) >= window:
+            _drain(concurrent.futures.FIRST_COMPLETED)
+    while pending:
+        _drain(concurrent.futures.FIRST_COMPLETED)
+
+    failed.sort(key=lambda f: f["page"])
+    return {"texts": [texts[i] for i in range(count)], "failed": failed}
+
+
+_engine_version = None
+
+def _tesseract_version() -> str:
+    global _engine_version
+    if _engine_version is None:
+        try:
+            _engine_version = str(pytesseract.get_tesseract_version())
+        except Exception:
+            _engine_version = "unknown"
+    return _engine_version
+
+
+def _document_plan(raw: dict, use_cache: bool) -> dict:
+    # the plan needs an OSD pass, so it is cached against the first page too
+    from utils.ocr_cache import ocr_cache, page_key
+
+    key = page_key(raw, "plan", OCR_LANG, preprocess_signature(), _tesseract_version()) if use_cache else None
+    if key:
+        hit = ocr_cache.get(key)
+        if hit is not None:
+            return hit
+    plan = plan_document(raw)
+    if key:
+        ocr_cache.set(key, plan)
+    return plan
+
+
+def ocr_page_buffers(pages: Iterable[Tuple[int, dict]], dpi: int, use_cache: bool = True) -> dict:
+    """
+    OCR raw page buffers from pdf_reader.iter_page_images(), consulting the
+    persistent OCR cache first so only unseen pages reach Tesseract. A buffer's
+    own "dpi" entry (adaptive DPI) takes precedence over `dpi`.
+
+    Returns {"texts": {page_index: text}, "failed": [{"page": page_index, "error": str}]}.
+    """
+    from utils.ocr_cache import ocr_cache, page_key
+
+    use_cache = use_cache and ocr_cache.enabled
+    texts = {}
+    misses = []  # (page_index, key) in the order they are sent to OCR
+
+    pages = iter(pages)
+    first = next(pages, None)
+    if first is None:
+        return {"texts": {}, "failed": []}
+    with timing.stage("ocr"):
+        plan = _document_plan(first[1], use_cache)
+    pages = itertools.chain([first], pages)
+    config = f"psm{plan['psm']}|{preprocess_signature()}|{OCR_CONFIG}"
+
+    def _uncached() -> Iterator[dict]:
+        for idx, raw in pages:
+            key = page_key(raw, raw.get("dpi", dpi), plan["lang"], config, _tesseract_version()) if use_cache else None
+            if key:
+                hit = ocr_cache.get(key)
+                if hit is not None:
+                    texts[idx] = hit
+                    continue
+            misses.append((idx, key))
+            yield raw
+
+    with timing.stage("ocr"):  # page rendering pulled by _uncached() is timed as "render"
+        result = ocr_pages(_uncached(), plan=plan)
+    failed_pos = {f["page"] for f in result["failed"]}
+    for pos, (idx, key) in enumerate(misses):
+        texts[idx] = result["texts"][pos]
+        if key and pos not in failed_pos:
+            ocr_cache.set(key, texts[idx])
+    failed = [{"page": misses[f["page"]][0], "error": f["error"]} for f in result["failed"]]
+    count_ocr(texts.values(), cached=len(texts) - len(misses), failed=len(failed))
+    return {"texts": texts, "failed": failed}
+
+
+def count_ocr(texts: Iterable[str], cached: int = 0, failed: int = 0):
+    """
+    Record OCR volume (pages by outcome, characters) in metrics and the request timings.
+    """
+    texts = list(texts)
+    chars = sum(len(t) for t in texts)
+    metrics.OCR_PAGES.inc(len(texts) - cached - failed, result="ok")
+    metrics.OCR_PAGES.inc(cached, result="cached")
+    metrics.OCR_PAGES.inc(failed, result="failed")
+    metrics.OCR_CHARS.inc(chars)
+    timing.count("ocr_pages", len(texts))
+    timing.count("ocr_chars", chars)
+
+
+def multiple_images_to_text(image_paths: list) -> str:
+    """
+    Concatenate OCR outputs from multiple images.
+    """
+    result = ocr_pages(image_paths)
+    return "\n".join(t for t in result["texts"] if t).strip()
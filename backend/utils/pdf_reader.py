@@ -3,22 +3,147 @@
 PDF utilities using PyMuPDF (fitz).
 """
 
+import mmap
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Callable, Iterator, Tuple, Union
+
 import fitz  # pymupdf
 
-def pdf_to_text(pdf_path: str) -> str:
+from utils import metrics, timing
+
+# Pages with fewer selectable characters than this are treated as scanned.
+MIN_PAGE_TEXT_CHARS = 30
+
+# Files at least this large are memory-mapped rather than opened by path.
+PDF_MMAP_THRESHOLD = int(os.getenv("PDF_MMAP_THRESHOLD", str(32 * 1024 * 1024)))
+
+PdfSource = Union[str, bytes, memoryview]
+
+
+@contextmanager
+def open_pdf(source: PdfSource):
     """
-    Extract selectable text from a PDF. Returns concatenated page text.
+    Open a PDF from a path or from bytes already in memory.
+
+    In-memory bytes (e.g. a small upload kept while streaming it to disk) are
+    handed to PyMuPDF directly. Large files are memory-mapped and passed as a
+    zero-copy view, so the OS pages them in on demand instead of the process
+    reading the whole file.
     """
-    text_chunks = []
-    with fitz.open(pdf_path) as doc:
-        for page in doc:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        doc = fitz.open(stream=source, filetype="pdf")
+        try:
+            yield doc
+        finally:
+            doc.close()
+        return
+
+    if os.path.getsize(source) < PDF_MMAP_THRESHOLD:
+        with fitz.open(source) as doc:
+            yield doc
+        return
+
+    with open(source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        doc = fitz.open(stream=view, filetype="pdf")
+        try:
+            yield doc
+        finally:
+            doc.close()
+            del doc
             try:
-                t = page.get_text()
+                view.release()
+            except BufferError:
+                pass
+
+
+def analyze_pdf(pdf_path: PdfSource, min_chars: int = MIN_PAGE_TEXT_CHARS, layout: bool = False) -> dict:
+    """
+    Open the PDF once and collect everything the pipeline needs from it.
+    `pdf_path` may also be the PDF bytes (see open_pdf).
+
+    Returns a dict:
+      {
+        "page_count": int,
+        "pages": [
+          {"index": 0, "text": str, "has_text": bool, "needs_ocr": bool,
+           "width": float, "height": float, "rotation": int},
+          ...
+        ],
+        "text_pages": [indices with selectable text],
+        "ocr_pages": [indices that need OCR],
+      }
+
+    With layout=True each page also gets "blocks": [(x0, y0, x1, y1, start, end)],
+    its text blocks in reading order with the span [start, end) each covers in
+    the page "text" (which is then the concatenation of the blocks).
+    """
+    pages = []
+    with timing.stage("pdf_parse"), open_pdf(pdf_path) as doc:
+        for i, page in enumerate(doc):
+            blocks = [] if layout else None
+            try:
+                if layout:
+                    t, blocks = _page_blocks(page)
+                else:
+                    t = page.get_text() or ""
             except Exception:
                 t = ""
-            if t:
-                text_chunks.append(t)
-    return "\n".join(text_chunks).strip()
+            has_text = len(t.strip()) >= min_chars
+            rect = page.rect
+            info = {
+                "index": i,
+                "text": t,
+                "has_text": has_text,
+                "needs_ocr": not has_text,
+                "width": rect.width,
+                "height": rect.height,
+                "rotation": page.rotation,
+            }
+            if layout:
+                info["blocks"] = blocks
+            pages.append(info)
+    ocr_pages = [p["index"] for p in pages if p["needs_ocr"]]
+    metrics.PDF_PAGES.inc(len(pages) - len(ocr_pages), kind="text")
+    metrics.PDF_PAGES.inc(len(ocr_pages), kind="scanned")
+    timing.count("pdf_pages", len(pages))
+    return {
+        "page_count": len(pages),
+        "pages": pages,
+        "text_pages": [p["index"] for p in pages if p["has_text"]],
+        "ocr_pages": ocr_pages,
+    }
+
+
+def _page_blocks(page) -> Tuple[str, list]:
+    parts = []
+    blocks = []
+    pos = 0
+    for x0, y0, x1, y1, text, _, kind in page.get_text("blocks"):
+        if kind != 0 or not text:
+            continue  # image block
+        parts.append(text)
+        blocks.append((x0, y0, x1, y1, pos, pos + len(text)))
+        pos += len(text)
+    return "".join(parts), blocks
+
+
+def analysis_text(analysis: dict) -> str:
+    """
+    Concatenate page text from an analyze_pdf() result, in page order.
+    """
+    chunks = [p["text"] for p in analysis["pages"] if p["text"]]
+    return "\n".join(chunks).strip()
+
+
+def pdf_to_text(pdf_path: PdfSource) -> str:
+    """
+    Extract selectable text from a PDF. Returns concatenated page text.
+    """
+    return analysis_text(analyze_pdf(pdf_path))
 
 
 def pdf_has_text(pdf_path: str, min_chars: int = 30) -> bool:
@@ -32,19 +157,150 @@ def pdf_has_text(pdf_path: str, min_chars: int = 30) -> bool:
         return False
 
 
-def pdf_to_images(pdf_path: str, dpi: int = 200) -> list:
+def iter_page_images(pdf_path: PdfSource, dpi: Union[int, Callable] = 200, pages: list = None,
+                     gray: bool = False) -> Iterator[Tuple[int, dict]]:
+    """
+    Lazily render PDF pages and yield (page_index, raw_image) one page at a time.
+
+    raw_image is {"mode": "RGB", "size": (w, h), "samples": bytes, "dpi": int}
+    taken straight from the pixmap buffer, so nothing is PNG-encoded or written
+    to disk. It is picklable (for the OCR process pool) and can be turned into a
+    PIL image with Image.frombytes(mode, size, samples). Only one rendered page
+    is held here at a time, so memory stays bounded for large documents.
+
+    `dpi` may be a callable taking the fitz page and returning its DPI (see
+    ocr_dpi). With gray=True pages are rendered as single-channel "L" buffers.
+    """
+    wanted = set(pages) if pages is not None else None
+    colorspace = fitz.csGRAY if gray else fitz.csRGB
+    with open_pdf(pdf_path) as doc:
+        for i, page in enumerate(doc):
+            if wanted is not None and i not in wanted:
+                continue
+            with timing.stage("render"):
+                page_dpi = dpi(page) if callable(dpi) else dpi
+                mat = fitz.Matrix(page_dpi / 72, page_dpi / 72)
+                pix = page.get_pixmap(matrix=mat, colorspace=colorspace, alpha=False)
+                raw = {
+                    "mode": "L" if gray else "RGB",
+                    "size": (pix.width, pix.height),
+                    "samples": bytes(pix.samples),
+                    "dpi": page_dpi,
+                }
+                pix = None
+            yield i, raw
+
+
+def ocr_dpi(page) -> int:
+    """
+    Adaptive OCR render DPI for a page: a 36 DPI grayscale probe gives the ink
+    density, which together with the page size picks the DPI (ocr_reader.choose_dpi).
+    """
+    from PIL import Image
+    from utils.ocr_reader import choose_dpi, ink_density, OCR_ADAPTIVE_DPI, OCR_DPI
+
+    if not OCR_ADAPTIVE_DPI:
+        return OCR_DPI
+    pix = page.get_pixmap(matrix=fitz.Matrix(0.5, 0.5), colorspace=fitz.csGRAY, alpha=False)
+    probe = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    rect = page.rect
+    return choose_dpi(rect.width, rect.height, ink_density(probe))
+
+
+def pdf_to_images(pdf_path: PdfSource, dpi: int = 200, pages: list = None, out_dir: str = None) -> list:
     """
     Render PDF pages to PNG files and return list of file paths.
-    Caller should remove temp files as needed.
+    If `pages` is given, only those page indices are rendered.
+
+    File-based fallback for callers that really need paths; the OCR pipeline uses
+    iter_page_images() instead. Files go to a fresh per-call directory (or
+    `out_dir`) so concurrent requests never share filenames. Remove them with
+    remove_page_images() when done.
     """
+    out_dir = out_dir or tempfile.mkdtemp(prefix="dawg_pdf_")
     out = []
-    doc = fitz.open(pdf_path)
-    tmpdir = "/tmp"  # caller will place under TMP_DIR if desired
-    for i, page in enumerate(doc):
-        mat = fitz.Matrix(dpi / 72, dpi / 72)
-        pix = page.get_pixmap(matrix=mat, alpha=False)
-        out_path = f"{tmpdir}/dawg_pdf_page_{i+1}.png"
-        pix.save(out_path)
-        out.append(out_path)
-    doc.close()
+    wanted = set(pages) if pages is not None else None
+    mat = fitz.Matrix(dpi / 72, dpi / 72)
+    with open_pdf(pdf_path) as doc:
+        for i, page in enumerate(doc):
+            if wanted is not None and i not in wanted:
+                continue
+            pix = page.get_pixmap(matrix=mat, alpha=False)
+            out_path = os.path.join(out_dir, f"page_{i+1}.png")
+            pix.save(out_path)
+            out.append(out_path)
     return out
+
+
+def remove_page_images(image_paths: list):
+    """
+    Delete files produced by pdf_to_images() along with their per-call directory.
+    """
+    dirs = {os.path.dirname(p) for p in image_paths}
+    for p in image_paths:
+        try:
+            os.remove(p)
+        except Exception:
+            pass
+    for d in dirs:
+        if os.path.basename(d).startswith("dawg_pdf_"):
+            shutil.rmtree(d, ignore_errors=True)
+
+
+def extract_page_texts(pdf_path: PdfSource, analysis: dict = None, dpi: int = None) -> dict:
+    """
+    Text of every page, using selectable text where a page has it and OCR (on
+    the worker pool) only for the pages classified as scanned. Scanned pages
+    are streamed to OCR as grayscale in-memory buffers, and pages already in
+    the OCR cache skip Tesseract entirely. Without an explicit `dpi` each page
+    is rendered at its adaptive OCR DPI (see ocr_dpi).
+
+    Returns {"pages": [text per page], "ocr_failed_pages": [{"page": i, "error": str}]},
+    where `page` is the 0-based page index in the PDF.
+    """
+    from utils.ocr_reader import ocr_page_buffers
+
+    analysis = analysis or analyze_pdf(pdf_path)
+    ocr_idx = analysis["ocr_pages"]
+    ocr_texts = {}
+    failed = []
+    if ocr_idx:
+        pages = iter_page_images(pdf_path, dpi=dpi or ocr_dpi, pages=ocr_idx, gray=True)
+        result = ocr_page_buffers(pages, dpi or 0)
+        ocr_texts = result["texts"]
+        failed = result["failed"]
+
+    texts = [ocr_texts.get(p["index"], "") if p["needs_ocr"] else p["text"] for p in analysis["pages"]]
+    return {"pages": texts, "ocr_failed_pages": failed}
+
+
+def extract_pdf_text(pdf_path: PdfSource, analysis: dict = None, dpi: int = None) -> dict:
+    """
+    Build the full document text (see extract_page_texts).
+
+    Returns {"text": str, "ocr_failed_pages": [{"page": i, "error": str}]}.
+    """
+    extracted = extract_page_texts(pdf_path, analysis, dpi)
+    text = "\n".join(t for t in extracted["pages"] if t).strip()
+    return {"text": text, "ocr_failed_pages": extracted["ocr_failed_pages"]}
+
+
+def extract_layout_text(pdf_path: PdfSource, analysis: dict = None, dpi: int = None) -> dict:
+    """
+    Like extract_pdf_text(), but text pages are rebuilt from word boxes into
+    rows and delimited table cells, with running headers/footers and
+    boilerplate removed (see utils.layout_text). Scanned pages are OCR'd as usual.
+
+    Returns {"text": str, "ocr_failed_pages": [{"page": i, "error": str}]}.
+    """
+    from utils.layout_text import layout_text
+
+    analysis = analysis or analyze_pdf(pdf_path)
+    extracted = extract_page_texts(pdf_path, analysis, dpi)
+    pages = [{"text": t} for t in extracted["pages"]]
+    if analysis["text_pages"]:
+        with timing.stage("pdf_parse"), open_pdf(pdf_path) as doc:
+            for i in analysis["text_pages"]:
+                page = doc[i]
+                pages[i] = {"words": page.get_text("words"), "height": page.rect.height}
+    return {"text": layout_text(pages), "ocr_failed_pages": extracted["ocr_failed_pages"]}
@@ -0,0 +1,135 @@
+# backend/utils/timing.py
+"""
+Per-stage wall-clock timing for the extraction pipeline.
+
+Pipeline code marks its stages:
+
+    with timing.stage("ocr"):
+        ...
+
+Every stage is observed in the dawg_stage_seconds histogram (utils.metrics),
+and a caller that wants the breakdown for one unit of work collects it:
+
+    with timing.collect() as t:
+        extract_invoice_auto(path)
+    t.as_dict()  # {"pdf_parse": {"seconds": 0.01, "calls": 1}, "ocr": {...}, ...}
+    t.counts     # {"pdf_pages": 3, "prompt_tokens": 812, ...} from timing.count()
+
+Stages nest: a stage records its own time minus the time of stages opened
+inside it, so "ocr" does not also count the page "render" work interleaved
+with it and the totals add up to roughly the wall time.
+
+Collectors follow contextvars: asyncio tasks inherit them, and work handed to
+threads must be run with contextvars.copy_context().run(...) to be counted.
+Worker processes are not followed; time spent waiting on them is counted by
+the stage that waits.
+
+Stage names used by the pipeline: pdf_parse, render, ocr, llm, json_repair,
+db_write.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from utils import metrics
+
+_collector: ContextVar[Optional["Timings"]] = ContextVar("dawg_timings", default=None)
+_frame: ContextVar[Optional[list]] = ContextVar("dawg_timing_frame", default=None)
+
+
+class Timings:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, list] = {}  # name -> [seconds, calls]
+        self.counts: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            s = self.stages.setdefault(name, [0.0, 0])
+            s[0] += seconds
+            s[1] += 1
+
+    def count(self, name: str, amount: float):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def seconds(self, name: str) -> float:
+        return self.stages.get(name, (0.0, 0))[0]
+
+    def breakdown(self, total_seconds: float) -> dict:
+        """
+        Per-request debug view: stage seconds, what no stage covered, and counters.
+        """
+        stages = self.as_dict()
+        covered = sum(s["seconds"] for s in stages.values())
+        return {
+            "total_seconds": round(total_seconds, 6),
+            "stages": stages,
+            "other_seconds": round(max(0.0, total_seconds - covered), 6),
+            "counts": dict(self.counts),
+        }
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {name: {"seconds": round(s, 6), "calls": n} for name, (s, n) in self.stages.items()}
+
+
+@contextmanager
+def collect(timings: Timings = None):
+    """
+    Collect stage timings of everything run inside the block (see module doc).
+    """
+    timings = timings or Timings()
+    token = _collector.set(timings)
+    frame_token = _frame.set(None)
+    try:
+        yield timings
+    finally:
+        _frame.reset(frame_token)
+        _collector.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    parent = _frame.get()
+    frame = [0.0]  # time spent in nested stages
+    token = _frame.set(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _frame.reset(token)
+        if parent is not None:
+            parent[0] += elapsed
+        _add(name, max(0.0, elapsed - frame[0]))
+
+
+def record(name: str, seconds: float):
+    """
+    Add an already measured duration (for code that cannot wrap a block, e.g.
+    an async generator).
+    """
+    parent = _frame.get()
+    if parent is not None:
+        parent[0] += seconds
+    _add(name, seconds)
+
+
+def count(name: str, amount: float = 1):
+    """
+    Add to a per-unit-of-work counter (pages, tokens, ...) of the current collector.
+    """
+    timings = _collector.get()
+    if timings is not None and amount:
+        timings.count(name, amount)
+
+
+def _add(name: str, seconds: float):
+    metrics.STAGE_SECONDS.observe(seconds, stage=name)
+    timings = _collector.get()
+    if timings is not None:
+        timings.add(name, seconds)